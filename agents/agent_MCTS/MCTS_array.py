@@ -0,0 +1,244 @@
+import numpy as np
+import time
+from numba import njit
+from typing import Optional, Tuple
+from agents.common import PlayerAction, BoardPiece, NO_PLAYER, PLAYER1, PLAYER2, BOARD_ROWS, BOARD_COLS,\
+    board_to_bitboard, apply_player_action_bitboard, connect_four_bitboard
+from agents.simulation import make_rng, random_playout
+
+MAX_NODES = 2**22  # Default maximal number of nodes of the tree (about 80 MB)
+
+
+class ArrayTree:
+    """
+    Search tree for Monte-Carlo-Tree-Search stored as preallocated arrays (one entry per node) instead of Node
+    objects. Node 0 is the root. When a node is expanded for the first time, a block of BOARD_COLS (here 7)
+    consecutive nodes is reserved for its children, the child of action a is node first_child + a. The boards of
+    the nodes are not stored but rebuilt along the path from the root
+    """
+    # Number of bytes used per node: parent, first_child, visits, wins (int32), action, player, untried (int8)
+    BYTES_PER_NODE = 4 + 4 + 4 + 4 + 1 + 1 + 1
+
+    def __init__(self, max_nodes: int = MAX_NODES):
+        """
+        :param max_nodes: Maximal number of nodes. If it is reached, no more nodes are expanded (but the search goes
+        on with simulations from the existing nodes)
+        """
+        # np.zeros does not touch the memory, so only the memory of the nodes that are used is allocated
+        self.parent = np.zeros(max_nodes, dtype=np.int32)
+        self.first_child = np.zeros(max_nodes, dtype=np.int32)  # 0 if the node was not expanded yet
+        self.visits = np.zeros(max_nodes, dtype=np.int32)  # 0 if the child was not expanded yet
+        self.wins = np.zeros(max_nodes, dtype=np.int32)  # Wins minus losses of the player of the node
+        self.action = np.zeros(max_nodes, dtype=np.int8)  # Action that led to the node
+        self.player = np.zeros(max_nodes, dtype=np.int8)  # Player whose action led to the node
+        self.untried = np.zeros(max_nodes, dtype=np.uint8)  # Bitmask of the legal actions that were not expanded
+        self.n_nodes = 1
+
+    @property
+    def nbytes(self) -> int:
+        """
+        :return: Number of bytes used by the nodes of the tree
+        """
+        return self.n_nodes * self.BYTES_PER_NODE
+
+
+@njit(cache=True)
+def legal_actions_mask(heights: np.ndarray) -> np.uint8:
+    """
+    :param heights: Array of the number of pieces per column of a bitboard
+    :return: Bitmask of the legal actions (bit a is set if column a is not full)
+    """
+    mask = 0
+    for a in range(BOARD_COLS):
+        if heights[a] < BOARD_ROWS:
+            mask |= 1 << a
+    return np.uint8(mask)
+
+
+@njit(cache=True)
+def select_and_expand(parent: np.ndarray, first_child: np.ndarray, visits: np.ndarray, wins: np.ndarray,
+                      action: np.ndarray, player: np.ndarray, untried: np.ndarray, n_nodes: int,
+                      bitboards: np.ndarray, heights: np.ndarray, c: float) -> Tuple[int, int, bool]:
+    """
+    Goes down the tree from the root (selection) and expands a new child (expansion). The actions on the path are
+    applied to the bitboard of the root
+    :param parent, first_child, visits, wins, action, player, untried: Arrays of the ArrayTree
+    :param n_nodes: Number of used nodes of the tree
+    :param bitboards: Player masks of the bitboard of the root (modified in place)
+    :param heights: Heights of the bitboard of the root (modified in place)
+    :param c: Exploration parameter of UCB1
+    :return: Node from which the simulation starts, new number of used nodes and bool if the action that led to
+    the node won the game
+    """
+    node = 0
+    won = False
+    # Selection: go down the tree until a terminal node or a node with untried actions is reached
+    while untried[node] == 0 and first_child[node] != 0:
+        log_visits = np.log(visits[node])
+        best_score = -np.inf
+        best_child = -1
+        for a in range(BOARD_COLS):
+            child = first_child[node] + a
+            if visits[child] > 0:
+                score = wins[child] / visits[child] + c * np.sqrt(log_visits / visits[child])
+                if score >= best_score:
+                    best_score = score
+                    best_child = child
+        node = best_child
+        apply_player_action_bitboard(bitboards, heights, action[node], player[node])
+        won = connect_four_bitboard(bitboards[player[node] - 1])
+
+    # Expansion: choose a random untried action and create a child node (if the tree is not full)
+    if untried[node] != 0 and (first_child[node] != 0 or n_nodes + BOARD_COLS <= parent.shape[0]):
+        if first_child[node] == 0:
+            first_child[node] = n_nodes
+            n_nodes += BOARD_COLS
+        n_untried = 0
+        for a in range(BOARD_COLS):
+            if untried[node] & (1 << a):
+                n_untried += 1
+        k = np.random.randint(n_untried)
+        chosen = 0
+        for a in range(BOARD_COLS):
+            if untried[node] & (1 << a):
+                if k == 0:
+                    chosen = a
+                    break
+                k -= 1
+        untried[node] &= ~np.uint8(1 << chosen)
+        child = first_child[node] + chosen
+        parent[child] = node
+        action[child] = chosen
+        player[child] = PLAYER1 if player[node] == PLAYER2 else PLAYER2
+        apply_player_action_bitboard(bitboards, heights, action[child], player[child])
+        won = connect_four_bitboard(bitboards[player[child] - 1])
+        # No free actions if the action of the node won the game --> the node is a terminal node
+        untried[child] = 0 if won else legal_actions_mask(heights)
+        node = child
+    return node, n_nodes, won
+
+
+@njit(cache=True)
+def seed_tree_rng(seed: int):
+    """
+    Seeds the random number generator of numba used for the random choices in the tree (expansion)
+    :param seed: Seed (32 bit)
+    """
+    np.random.seed(seed)
+
+
+@njit(cache=True)
+def backpropagate(parent: np.ndarray, visits: np.ndarray, wins: np.ndarray, player: np.ndarray, node: int,
+                  winner: BoardPiece):
+    """
+    Updates the number of visits and wins of all nodes from the node up to the root. The wins of a node are
+    counted for the player whose action led to the node (1 for a win, -1 for a loss, 0 for a draw), so that
+    the selection chooses the best action for the player who is to move at each node
+    :param parent, visits, wins, player: Arrays of the ArrayTree
+    :param node: Node from which the simulation started
+    :param winner: Player ID of the winner of the simulation, NO_PLAYER if the game ended in a draw
+    """
+    while True:
+        visits[node] += 1
+        if winner != NO_PLAYER:
+            wins[node] += 1 if player[node] == winner else -1
+        if node == 0:
+            break
+        node = parent[node]
+
+
+@njit(cache=True)
+def max_tree_depth(parent: np.ndarray, visits: np.ndarray, n_nodes: int) -> int:
+    """
+    :param parent, visits: Arrays of the ArrayTree
+    :param n_nodes: Number of used nodes of the tree
+    :return: Depth of the deepest visited node (children are always stored after their parent, so the depths can
+    be computed in one pass)
+    """
+    depths = np.zeros(n_nodes, dtype=np.int32)
+    max_depth = 0
+    for node in range(1, n_nodes):
+        if visits[node] > 0:
+            depths[node] = depths[parent[node]] + 1
+            max_depth = max(max_depth, depths[node])
+    return max_depth
+
+
+def array_tree_stats(tree: ArrayTree) -> dict:
+    """
+    :param tree: Search tree of MCTS_array
+    :return: Statistics of the search: iterations and playouts (one per iteration), number of visited nodes, depth
+    of the tree and visits and values (wins minus losses per visit) of the children of the root per action (None
+    for actions without child)
+    """
+    visits = [None] * BOARD_COLS
+    values = [None] * BOARD_COLS
+    for action in range(BOARD_COLS):
+        child = tree.first_child[0] + action
+        if tree.first_child[0] != 0 and tree.visits[child] > 0:
+            visits[action] = int(tree.visits[child])
+            values[action] = float(tree.wins[child] / tree.visits[child])
+    return {"source": "search", "iterations": int(tree.visits[0]), "playouts": int(tree.visits[0]),
+            "tree_size": int(np.count_nonzero(tree.visits[:tree.n_nodes])),
+            "max_depth": int(max_tree_depth(tree.parent, tree.visits, tree.n_nodes)), "child_visits": visits,
+            "child_values": values}
+
+
+def MCTS_array(board: np.ndarray, player: BoardPiece, max_time: float, max_nodes: int = MAX_NODES,
+               seed: Optional[int] = None) -> Tuple[PlayerAction, ArrayTree]:
+    """
+    Finds the best action given the board using Monte-Carlo-Tree-Search on an ArrayTree (drop-in replacement for
+    MCTS that can hold millions of nodes within a fixed memory budget)
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param player: Player ID of the player for which a good move (that generates a win most probably)
+     has to be chosen
+    :param max_time: Number of seconds until an action need to be chosen
+    :param max_nodes: Maximal number of nodes of the search tree
+    :param seed: Seed of the random number generator of the simulations
+    :return: Column in which player wants to make his move (chosen using MCTS) and the search tree
+    """
+    rng = make_rng(seed)
+    if seed is not None:
+        seed_tree_rng(seed % 2**32)
+    tree = ArrayTree(max_nodes)
+    root_bitboards, root_heights = board_to_bitboard(board)
+    # The root belongs to the opponent, who made the last action
+    tree.player[0] = PLAYER1 if player == PLAYER2 else PLAYER2
+    tree.untried[0] = legal_actions_mask(root_heights)
+
+    # Perform as many iterations of MCTS as allowed by the maximal time (but at least expand the root node once)
+    end_time = time.time() + max_time
+    while time.time() < end_time or tree.first_child[0] == 0:
+        # Selection and expansion on a copy of the bitboard of the root
+        bitboards, heights = root_bitboards.copy(), root_heights.copy()
+        node, tree.n_nodes, win = select_and_expand(
+            tree.parent, tree.first_child, tree.visits, tree.wins, tree.action, tree.player, tree.untried,
+            tree.n_nodes, bitboards, heights, np.sqrt(2))
+
+        # Simulation: generate random moves of the players until the board is full or one player won, starting
+        # with the opponent of the last player who made a move in the tree path
+        if win:
+            winner = tree.player[node]
+        else:
+            winner = random_playout(bitboards, heights, PLAYER1 if tree.player[node] == PLAYER2 else PLAYER2, rng)
+
+        # Backpropagation: update the nodes on the path with the result of the simulation
+        backpropagate(tree.parent, tree.visits, tree.wins, tree.player, node, winner)
+
+    # After the max_time has run out, take an immediate win if there is one, else choose the action with the best
+    # ratio of wins and visits
+    best_score = -np.inf
+    best_action = None
+    for action in range(BOARD_COLS):
+        child = tree.first_child[0] + action
+        if tree.visits[child] == 0:
+            continue
+        bitboards, heights = root_bitboards.copy(), root_heights.copy()
+        apply_player_action_bitboard(bitboards, heights, PlayerAction(action), player)
+        if connect_four_bitboard(bitboards[player - 1]):
+            return PlayerAction(action), tree
+        score = tree.wins[child] / tree.visits[child]
+        if score > best_score:
+            best_action = action
+            best_score = score
+    return PlayerAction(best_action), tree
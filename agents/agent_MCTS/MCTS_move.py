@@ -1,20 +1,33 @@
 import numpy as np
+import sys
+import threading
 import time
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict, Union
+from agents.agent_MCTS.MCTS_array import MCTS_array, MAX_NODES, array_tree_stats
+from agents.agent_MCTS.MCTS_parallel import MCTS_parallel
 from agents.common import PlayerAction, BoardPiece, SavedState, apply_player_action, connect_four,\
-     PLAYER1, PLAYER2, NO_PLAYER
+     PLAYER1, PLAYER2, NO_PLAYER, BOARD_COLS, board_to_bitboard, connect_four_bitboard, zobrist_hash, zobrist_key,\
+     child_boards, winning_action_masks, center_first_argmax
+from agents.simulation import make_rng, random_playout, batch_random_playouts
+from agents.opening_book import book_move, DEFAULT_BOOK_FILE
+from agents.solver import solver_move, SOLVER_EMPTY_CELLS, SOLVER_NODES
 
+MAX_TABLE_NODES = 200000  # Default maximal number of nodes of the table of the search on a DAG
+MAX_TREE_NODES = 200000  # Default maximal number of nodes of the search tree of Node objects (see prune_tree)
+BATCH_PLAYOUTS = 100000  # Number of playouts that generate_moves_MCTS runs in one batch (bounds the memory)
 
-def poss_actions(board, player=None, check_win=False) -> np.ndarray:
+
+def poss_actions(board, player=None, check_win=False, last_action=None) -> np.ndarray:
     """
     Determines the possible actions that can be taken in a given board
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player who took the last action on the board
     :param check_win: Bool if it should be checked whether the player won the game
+    :param last_action: Last action of the player (only the lines through it are checked for a win)
     :return: Array of possible actions (free columns)
     """
     # No free actions if the action of the node won the game
-    if check_win and connect_four(board, player):
+    if check_win and connect_four(board, player, last_action):
         return np.array([])
     else:
         return np.where(board[0, :] == NO_PLAYER)[0]
@@ -24,15 +37,23 @@ class Node:
     """
     Describes a tree node associated with a specific board state used for Monte-Carlo-Tree-Search (MCTS - see below)
     """
-    def __init__(self, action=None, parent=None, board=None, player=None):
+    # No attribute dict per node (a large part of the memory of a node, see node_bytes)
+    __slots__ = ("parent", "action", "board", "player", "hash", "wins", "visits", "children", "child_actions",
+                 "untried_actions")
+
+    def __init__(self, action=None, parent=None, board=None, player=None, board_hash=None):
         self.parent = parent
         self.action = action  # The action that resulted in the board
         self.board = board  # Associated board state
         self.player = player  # The player at the current node whose action led to the board
+        self.hash = board_hash  # Zobrist hash of the board (only used if the nodes are shared by a table)
         self.wins = 0
         self.visits = 0
         self.children = []
-        self.untried_actions = poss_actions(board, player, True)  # Array of free columns, no possible actions
+        # Actions that lead from the node to its children (a child that is shared by several nodes was created
+        # with the action of the first one, so child.action can differ)
+        self.child_actions = []
+        self.untried_actions = poss_actions(board, player, True, action)  # Array of free columns, no possible actions
         # if the player won the game --> the node is a terminal node
 
     def selection(self, c=np.sqrt(2)):
@@ -46,130 +67,502 @@ class Node:
         # Return the child with the largest score
         return sorted(self.children, key=ucb_func)[-1]
 
-    def expansion(self, action: PlayerAction):
+    def expansion(self, action: PlayerAction, table: Optional[Dict[int, "Node"]] = None):
         """
         Expands a node by creating a new child node
         :param action: Action to apply in order to expand a node
+        :param table: Nodes by the hash of their board. If given, the node of the board after the action is taken
+        from the table if it is already in there (the node is shared by all paths to the board, the nodes form a
+        DAG) and new nodes are added to the table
         :return: Child after node expansion (The board of the child node
         corresponds to the board of the parent after the action was applied)
         """
         # The parent node was created by taking an action for a specific player. For
         # the expansion choose the opponent , as the players have alternating turns
         player_exp = PLAYER1 if self.player == PLAYER2 else PLAYER2
+        if table is not None:
+            child_hash = self.hash ^ zobrist_key(self.board, action, player_exp)
+            child = table.get(child_hash)
+            if child is None:
+                child = Node(action=action, board=apply_player_action(self.board.copy(), action, player_exp),
+                             player=player_exp, board_hash=child_hash)
+                table[child_hash] = child
+            self.children.append(child)
+            self.child_actions.append(action)
+            self.untried_actions = np.setdiff1d(self.untried_actions, action)
+            return child
         # Apply the action to the board of the parent node
         new_board = apply_player_action(self.board.copy(), action, player_exp)
         # Create a new child node with that action and board
         child = Node(action=action, parent=self, board=new_board, player=player_exp)
         # Append the created child to the children of the parent
         self.children.append(child)
+        self.child_actions.append(action)
         # Remove the action from the untried actions from the parent
         self.untried_actions = np.setdiff1d(self.untried_actions, action)
 
         return child
 
-    def update(self, result: int):
+    def update(self, result: int, n_playouts: int = 1):
         """
         Updates the win and visits value of a node
-        :param result: 0 if the game ended in a draw, 1 if the player won, -1 if the player lost
+        :param result: 0 if the game ended in a draw, 1 if the player won, -1 if the player lost (summed over all
+        playouts)
+        :param n_playouts: Number of playouts from which the result was obtained
         """
-        self.visits += 1
+        self.visits += n_playouts
         self.wins += result
 
 
-def MCTS(board: np.ndarray, player: BoardPiece, max_time: float) -> PlayerAction:
+class MCTSState(SavedState):
+    """
+    State of the MCTS agent that is kept between the moves of one game
+    """
+    def __init__(self, node: Node, max_tree_nodes: Optional[int] = MAX_TREE_NODES):
+        self.node = node  # Node of the search tree after the last action of the agent
+        self.max_tree_nodes = max_tree_nodes
+        self.inherited_visits = 0  # Visits of the root node that were inherited from the search of the last move
+
+
+class MCTSDagState(SavedState):
+    """
+    State of the MCTS agent searching a DAG that is kept between the moves of one game
+    """
+    def __init__(self, table: Dict[int, Node], max_table_nodes: int = MAX_TABLE_NODES):
+        self.table = table  # Nodes of the previous searches by the hash of their board
+        self.max_table_nodes = max_table_nodes
+
+
+def reuse_subtree(saved_state: Optional[SavedState], board: np.ndarray) -> Optional[Node]:
+    """
+    Finds the node of the search tree of the last move that belongs to the current board (the node after the last
+    action of the agent and the reply of the opponent) and detaches it from the rest of the tree
+    :param saved_state: State of the agent from the previous move
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :return: Node that can be used as the new root node, None if it was not found
+    """
+    if not isinstance(saved_state, MCTSState):
+        return None
+    for child in saved_state.node.children:
+        if np.array_equal(child.board, board):
+            # Detach the subtree so that the rest of the old tree can be freed
+            child.parent = None
+            saved_state.node.children = []
+            saved_state.node.child_actions = []
+            return child
+    return None
+
+
+def node_bytes(node: Node) -> int:
+    """
+    :param node: Node of a search tree
+    :return: Number of bytes of the node, its board and its lists and arrays of actions and children (the children
+    themselves are not included)
+    """
+    return sys.getsizeof(node) + sys.getsizeof(node.board) + sys.getsizeof(node.untried_actions) + \
+        sys.getsizeof(node.children) + sys.getsizeof(node.child_actions)
+
+
+def tree_stats(root_node: Node, inherited_visits: int = 0, n_playouts: int = 1) -> dict:
+    """
+    :param root_node: Root node of the search tree
+    :param inherited_visits: Visits of the root node from the search of the previous move
+    :param n_playouts: Number of random playouts per iteration of the search (see MCTS)
+    :return: Statistics of the search: iterations, playouts, number of nodes, bytes of the nodes (see node_bytes),
+    depth of the tree and visits and values (wins minus losses per visit) of the children of the root per action
+    (None for actions without child)
+    """
+    # Nodes that are shared by several paths (see MCTSDagState) are counted once
+    seen = set()
+    n_bytes = 0
+    max_depth = 0
+    stack = [(root_node, 0)]
+    while stack:
+        node, depth = stack.pop()
+        max_depth = max(max_depth, depth)
+        if id(node) not in seen:
+            seen.add(id(node))
+            n_bytes += node_bytes(node)
+            stack.extend((child, depth + 1) for child in node.children)
+    n_nodes = len(seen)
+    visits = [None] * BOARD_COLS
+    values = [None] * BOARD_COLS
+    for child, action in zip(root_node.children, root_node.child_actions):
+        visits[action] = int(child.visits)
+        values[action] = float(child.wins / child.visits)
+    # Every iteration adds the visits of its playouts to the root node
+    playouts = int(root_node.visits - inherited_visits)
+    return {"source": "search", "iterations": playouts // n_playouts, "playouts": playouts, "tree_size": n_nodes,
+            "tree_bytes": n_bytes, "max_depth": max_depth, "child_visits": visits, "child_values": values}
+
+
+def prune_unreachable(table: Dict[int, Node], root_node: Node):
+    """
+    Removes the nodes that cannot be reached from the root node from the table of a search on a DAG. Children that
+    are not in the table anymore are removed from their parents, the actions that led to them can be expanded again
+    :param table: Nodes by the hash of their board
+    :param root_node: Root node of the search
+    """
+    reachable = {}
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        if node.hash in reachable:
+            continue
+        reachable[node.hash] = node
+        kept = [table.get(child.hash) is child for child in node.children]
+        if not all(kept):
+            evicted = [action for action, keep in zip(node.child_actions, kept) if not keep]
+            node.untried_actions = np.union1d(node.untried_actions, evicted)
+            node.children = [child for child, keep in zip(node.children, kept) if keep]
+            node.child_actions = [action for action, keep in zip(node.child_actions, kept) if keep]
+        stack.extend(node.children)
+    table.clear()
+    table.update(reachable)
+
+
+def evict_nodes(table: Dict[int, Node], root_node: Node, max_nodes: int):
+    """
+    Shrinks the table of a search on a DAG to at most 3/4 of max_nodes nodes by removing the nodes with the fewest
+    visits (and the nodes that are only reachable through them)
+    :param table: Nodes by the hash of their board
+    :param root_node: Root node of the search (never removed)
+    :param max_nodes: Maximal number of nodes of the table
+    """
+    nodes = sorted(table.values(), key=lambda node: node.visits)
+    for node in nodes[:len(nodes) - 3 * max_nodes // 4]:
+        if node is not root_node:
+            del table[node.hash]
+    prune_unreachable(table, root_node)
+
+
+def count_nodes(root_node: Node) -> int:
+    """
+    :param root_node: Root node of a search tree
+    :return: Number of nodes of the tree
+    """
+    n_nodes = 0
+    stack = [root_node]
+    while stack:
+        node = stack.pop()
+        n_nodes += 1
+        stack.extend(node.children)
+    return n_nodes
+
+
+def prune_tree(root_node: Node, max_nodes: int) -> int:
+    """
+    Shrinks a search tree to at most 3/4 of max_nodes nodes by cutting off the subtrees of the least visited
+    nodes. A node whose subtree is cut off keeps its visits and wins and becomes a leaf whose actions can be
+    expanded again, so the statistics of the upper part of the tree, which decide the move, are kept. The root
+    node and its children are never removed (the tree cannot shrink below them)
+    :param root_node: Root node of the search tree
+    :param max_nodes: Maximal number of nodes of the tree
+    :return: Number of nodes of the tree after pruning
+    """
+    # Nodes in breadth-first order with the index of their parent and their depth
+    nodes = [root_node]
+    parents = [-1]
+    depths = [0]
+    for i, node in enumerate(nodes):
+        nodes.extend(node.children)
+        parents.extend([i] * len(node.children))
+        depths.extend([depths[i] + 1] * len(node.children))
+    # Number of nodes of the subtree of each node
+    sizes = np.ones(len(nodes), dtype=np.int64)
+    for i in range(len(nodes) - 1, 0, -1):
+        sizes[parents[i]] += sizes[i]
+    n_nodes = len(nodes)
+    # Inner nodes by visits, of equally visited nodes the deeper ones first: descendants are cut before their
+    # ancestors, so the size of an ancestor is always the one of its remaining subtree
+    visits = np.array([node.visits for node in nodes])
+    inner = np.array([i for i in range(1, len(nodes)) if nodes[i].children], dtype=np.int64)
+    order = inner[np.lexsort((-np.array(depths)[inner], visits[inner]))] if inner.size else inner
+    for i in order:
+        if n_nodes <= 3 * max_nodes // 4:
+            break
+        node = nodes[i]
+        removed = sizes[i] - 1
+        # Break the references of the removed nodes to their parents, so that their memory is freed at once
+        stack = list(node.children)
+        while stack:
+            child = stack.pop()
+            child.parent = None
+            stack.extend(child.children)
+        node.untried_actions = np.union1d(node.untried_actions, node.child_actions)
+        node.children = []
+        node.child_actions = []
+        n_nodes -= removed
+        j = i
+        while j >= 0:
+            sizes[j] -= removed
+            j = parents[j]
+    return n_nodes
+
+
+def MCTS(board: np.ndarray, player: BoardPiece, max_time: float, root_node: Optional[Node] = None,
+         seed: Optional[int] = None, n_playouts: int = 1, table: Optional[Dict[int, Node]] = None,
+         max_table_nodes: int = MAX_TABLE_NODES, stop: Optional[threading.Event] = None,
+         max_tree_nodes: Optional[int] = MAX_TREE_NODES) -> Tuple[PlayerAction, Node]:
     """
     Finds the best action given the board using Monte-Carlo-Tree-Search
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player ID of the player for which a good move (that generates a win most probably)
      has to be chosen
     :param max_time: Number of seconds until an action need to be chosen
-    :return: Column in which player wants to make his move (chosen using MCTS)
+    :param root_node: Root node of the search tree (e.g. a subtree of the search of the last move), a new tree is
+    created if not given
+    :param seed: Seed of the random number generator of the simulations
+    :param n_playouts: Number of random playouts per expanded node (if larger than 1, they are run as one batch)
+    :param table: Nodes by the hash of their board. If given, all paths to the same board share one node (the
+    nodes form a DAG, e.g. the nodes of the search of the last move can be passed on)
+    :param max_table_nodes: Maximal number of nodes in the table (see evict_nodes)
+    :param stop: Event that stops the search before max_time is up when it is set (e.g. at the end of pondering)
+    :param max_tree_nodes: Maximal number of nodes of the search tree if no table is given (None: no limit). When
+    it is reached, the tree is pruned (see prune_tree). If pruning cannot shrink the tree, no nodes are expanded
+    anymore and the playouts start at the leaves
+    :return: Column in which player wants to make his move (chosen using MCTS) and root node of the search tree
     """
+    rng = make_rng(seed)
+    batch_rng = np.random.default_rng(seed)
     # Initialize the root of the search tree with the current board state (based on
     # which an action needs to be found) and the player of the opponent
-    root_node = Node(board=board, player=PLAYER1 if player == PLAYER2 else PLAYER2)
+    if root_node is None:
+        root_node = Node(board=board, player=PLAYER1 if player == PLAYER2 else PLAYER2,
+                         board_hash=zobrist_hash(board) if table is not None else None)
+        if table is not None:
+            table[root_node.hash] = root_node
+    if table is not None:
+        max_tree_nodes = None
+    n_nodes = count_nodes(root_node) if max_tree_nodes is not None else 0
 
-    # Perform as many iterations of MCTS as allowed by the maximal time
+    # Perform as many iterations of MCTS as allowed by the maximal time (but at least expand the root node once)
     end_time = time.time() + max_time
-    while time.time() < end_time:
+    while (time.time() < end_time and not (stop is not None and stop.is_set())) or not root_node.children:
+
+        if max_tree_nodes is not None and n_nodes >= max_tree_nodes:
+            n_nodes = prune_tree(root_node, max_tree_nodes)
 
         # Start at the root node at each iteration
         node = root_node
+        path = [node]
 
         # Selection
         # Go down the tree until a terminal node or a node with untried moves is reached
-        while not np.any(node.untried_actions) and node.children != []:
+        while node.untried_actions.size == 0 and node.children != []:
             node = node.selection()
+            path.append(node)
 
         # Expansion
-        # If not all actions were tried, choose a random action and append a child node
-        if np.any(node.untried_actions):
+        # If not all actions were tried, choose a random action and append a child node (unless the tree is full)
+        if node.untried_actions.size > 0 and (max_tree_nodes is None or n_nodes < max_tree_nodes or
+                                              node is root_node):
             # Choose a random action from the untried actions
             action = np.random.choice(node.untried_actions)
             # Expand the current node generating a new child node with a board after the
             # application of the action and remove the action from the untried actions
             # of the current node
-            node = node.expansion(action)
+            node = node.expansion(action, table)
+            path.append(node)
+            n_nodes += 1
 
         # Simulation
-        board = node.board.copy()  # Perform the simulation on a copy of the board
-        win = False
-        player_sim = node.player  # Last player who made a move in the tree path
-        # Generate random moves of the players until the board is full
-        while np.any(poss_actions(board)) and not win:
-            # Choose the other player for the first/next random move
-            player_sim = PLAYER1 if player_sim == PLAYER2 else PLAYER2
-            # Choose a random action
-            action = np.random.choice(poss_actions(board))
-            # Apply the action
-            board = apply_player_action(board, action, player_sim)
-            # Check if the game is won
-            win = connect_four(board, player_sim)
+        # Generate random moves of the players (on the bitboard of the node) until the board is full or one player
+        # won, starting with the opponent of the last player who made a move in the tree path
+        bitboards, heights = board_to_bitboard(node.board)
+        player_sim = PLAYER1 if node.player == PLAYER2 else PLAYER2
+        if connect_four_bitboard(bitboards[node.player - 1]):
+            winners = np.full(n_playouts, node.player)
+        elif n_playouts > 1:
+            # Leaf parallel evaluation: all playouts of the node in one batch
+            winners = batch_random_playouts(np.broadcast_to(node.board, (n_playouts,) + node.board.shape),
+                                            player_sim, batch_rng)
+        else:
+            winners = np.array([random_playout(bitboards, heights, player_sim, rng)])
 
         # Backpropagation
         # Update the number of visits and wins for each node
-        # Check which player won the random simulation and determine the corresponding result
-        if win:
-            if player_sim == player:
-                result = 1  # The player won
-            else:
-                result = -1  # The player lost against the opponent
-        else:
-            result = 0  # Game ended in a draw
-        # Go up the tree until reaching the root node and update the visits and wins property of
-        # each node on the way using the result
-        while node is not None:
-            node.update(result)
-            node = node.parent
+        # Check which player won the random simulations and determine the corresponding result: +1 for each
+        # playout the player won, -1 for each playout the player lost against the opponent (0 for draws)
+        result = np.count_nonzero(winners == player) - np.count_nonzero((winners != player) & (winners != NO_PLAYER))
+        # Update the visits and wins property of each node on the path from the root using the result (on a DAG,
+        # other paths to the nodes do not get the result, they see it through the shared nodes)
+        for node in path:
+            node.update(result, n_playouts)
+        if table is not None and len(table) > max_table_nodes:
+            evict_nodes(table, root_node, max_table_nodes)
 
     # After the max_time has run out, choose the best action based on the ratio of wins and visits
-    best_score = -np.infty
+    best_score = -np.inf
     best_action = None
-    for child in root_node.children:
+    for child, action in zip(root_node.children, root_node.child_actions):
         # Check if one child is a win --> If so return the action (make sure that the agent takes the
         # immediate win possibility)
-        if connect_four(child.board, child.player):
-            return child.action
+        if connect_four(child.board, child.player, action):
+            return action, root_node
         # If no child is a win, compute the win/visit ratio and return the action of the child with the
         # highest ratio
         else:
             score = child.wins / child.visits
             if score > best_score:
-                best_action = child.action
+                best_action = action
                 best_score = score
-    return best_action
+    return best_action, root_node
 
 
 def generate_move_MCTS(board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
-                       max_time: float = 5) \
-        -> Tuple[PlayerAction, SavedState]:
+                       max_time: float = 5, engine: str = "tree", max_nodes: int = MAX_NODES,
+                       seed: Optional[int] = None, n_workers: int = 1, n_playouts: int = 1,
+                       book_file: Optional[str] = DEFAULT_BOOK_FILE, solver_empty_cells: int = SOLVER_EMPTY_CELLS,
+                       solver_nodes: int = SOLVER_NODES, max_table_nodes: int = MAX_TABLE_NODES,
+                       max_tree_nodes: Optional[int] = MAX_TREE_NODES) -> Tuple[PlayerAction, SavedState]:
     """
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player ID
-    :param saved_state: Not used in this implementation of the move generation
-    :param max_time: Time ins sec given to the MCTS agent to find teh next action
+    :param saved_state: State of the agent from the previous move (holds the search tree of the last move and the
+    statistics of its search)
+    :param max_time: Time ins sec given to the MCTS agent to find teh next action (the book and the solver included)
+    :param engine: "tree" to search a tree of Node objects (which is reused in the next move), "dag" to search
+    Node objects that are shared by all paths to the same board (kept for the next move as well) or "array" to
+    search an ArrayTree (e.g. use functools.partial(generate_move_MCTS, engine="array") as GenMove)
+    :param max_nodes: Maximal number of nodes of the ArrayTree
+    :param seed: Seed of the random number generator of the simulations (drawn from np.random if not given, so
+    that np.random.seed makes the search reproducible, e.g. in a tournament)
+    :param n_workers: If larger than 1, n_workers processes search an ArrayTree independently and their
+    statistics of the root are merged (root parallel MCTS, the processes are kept for the next moves)
+    :param n_playouts: Number of random playouts per expanded node of the tree of Node objects
+    :param book_file: File of the opening book that is consulted before searching (None: no book)
+    :param solver_empty_cells: Number of empty cells below which the move is chosen by the exact solver
+    :param solver_nodes: Node budget of the solver for positions with more empty cells (0: never try the solver)
+    :param max_table_nodes: Maximal number of nodes of the table of the "dag" engine
+    :param max_tree_nodes: Maximal number of nodes of the tree of the "tree" engine (None: no limit)
     :return: Column in which player wants to make his move (chosen using MCTS)
     """
-    # Give time sec to the agent to find a good action
-    action = MCTS(board, player, max_time)
-    return PlayerAction(action), SavedState()
+    end_time = time.time() + max_time
+    action = book_move(board, book_file)
+    if action is not None:
+        saved_state = SavedState()
+        saved_state.stats = {"source": "book"}
+        return action, saved_state
+    solved = solver_move(board, player, solver_empty_cells, solver_nodes)
+    if solved is not None:
+        saved_state = SavedState()
+        action, saved_state.stats = solved
+        return action, saved_state
+    if seed is None:
+        seed = int(np.random.randint(2 ** 31))
+    if n_workers > 1:
+        action, (visits, wins) = MCTS_parallel(board, player, max(end_time - time.time(), 0.), n_workers, max_nodes,
+                                               seed)
+        saved_state = SavedState()
+        # The workers run one playout per iteration
+        saved_state.stats = {"source": "search", "iterations": int(np.sum(visits)), "playouts": int(np.sum(visits)),
+                             "workers": n_workers,
+                             "child_visits": [int(v) if v else None for v in visits],
+                             "child_values": [float(w / v) if v else None for v, w in zip(visits, wins)]}
+        return action, saved_state
+    if engine == "array":
+        action, tree = MCTS_array(board, player, max(end_time - time.time(), 0.), max_nodes, seed)
+        saved_state = SavedState()
+        saved_state.stats = array_tree_stats(tree)
+        return action, saved_state
+    if engine == "dag":
+        # Continue the search from the node of the current board if a previous search reached it
+        table = saved_state.table if isinstance(saved_state, MCTSDagState) else {}
+        root_node = table.get(zobrist_hash(board))
+        inherited_visits = 0
+        if root_node is not None:
+            inherited_visits = root_node.visits
+            # Drop the nodes that cannot be reached from the current board anymore
+            prune_unreachable(table, root_node)
+        else:
+            table.clear()
+        action, root_node = MCTS(board, player, max(end_time - time.time(), 0.), root_node, seed, n_playouts, table,
+                                 max_table_nodes)
+        saved_state = MCTSDagState(table, max_table_nodes)
+        saved_state.stats = tree_stats(root_node, inherited_visits, n_playouts)
+        return PlayerAction(action), saved_state
+    # Continue the search in the subtree of the last search that belongs to the current board
+    root_node = reuse_subtree(saved_state, board)
+    inherited_visits = root_node.visits if root_node is not None else 0
+    # Give the time that is left after the book and the solver to the agent to find a good action
+    action, root_node = MCTS(board, player, max(end_time - time.time(), 0.), root_node, seed, n_playouts,
+                             max_tree_nodes=max_tree_nodes)
+    stats = tree_stats(root_node, inherited_visits, n_playouts)
+    # Keep the node after the chosen action for the next move (the rest of the tree can be freed)
+    node = root_node.children[root_node.child_actions.index(action)]
+    node.parent = None
+    saved_state = MCTSState(node, max_tree_nodes)
+    saved_state.inherited_visits = inherited_visits
+    saved_state.stats = stats
+    return PlayerAction(action), saved_state
+
+
+def generate_moves_MCTS(boards: np.ndarray, players: Union[BoardPiece, np.ndarray], n_playouts: int = 100,
+                        seed: Optional[int] = None) -> np.ndarray:
+    """
+    Batched move generation of the MCTS agent. Search trees of many boards do not vectorize, so the batched version
+    only does the first level of MCTS (flat Monte-Carlo): immediate wins and blocks of all boards are detected at
+    once, then every action of every other board gets n_playouts random playouts, which are all run together by
+    batch_random_playouts
+    :param boards: N x 6 x 7 array of boards of games that are still going on
+    :param players: Player IDs of the players to move (one per board or one for all boards)
+    :param n_playouts: Number of random playouts per action
+    :param seed: Seed of the random number generator of the playouts
+    :return: Array of the N actions (the action with the best ratio of wins minus losses and playouts)
+    """
+    players = np.broadcast_to(np.asarray(players, dtype=BoardPiece), (boards.shape[0],))
+    opponents = np.where(players == PLAYER1, PLAYER2, PLAYER1).astype(BoardPiece)
+    wins = winning_action_masks(boards, players)
+    blocks = winning_action_masks(boards, opponents)
+    # Take an immediate win, else block an immediate win of the opponent
+    actions = np.where(wins.any(axis=1), center_first_argmax(wins), center_first_argmax(blocks)).astype(PlayerAction)
+    search = np.flatnonzero(~wins.any(axis=1) & ~blocks.any(axis=1))
+    rng = np.random.default_rng(seed)
+    chunk_size = max(1, BATCH_PLAYOUTS // (BOARD_COLS * n_playouts))
+    for start in range(0, search.size, chunk_size):
+        chunk = search[start:start + chunk_size]
+        children, legal = child_boards(boards[chunk].reshape(chunk.size, -1), players[chunk])
+        boards_index, child_actions = np.nonzero(legal)
+        # n_playouts playouts of every child, the opponent moves first
+        winners = batch_random_playouts(np.repeat(children[boards_index, child_actions], n_playouts, axis=0),
+                                        np.repeat(opponents[chunk][boards_index], n_playouts), rng)
+        winners = winners.reshape(-1, n_playouts)
+        scores = np.full(legal.shape, -np.inf)
+        scores[boards_index, child_actions] = np.count_nonzero(winners == players[chunk][boards_index, None], axis=1) \
+            - np.count_nonzero(winners == opponents[chunk][boards_index, None], axis=1)
+        actions[chunk] = center_first_argmax(scores)
+    return actions
+
+
+def ponder_MCTS(board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
+                stop: threading.Event) -> int:
+    """
+    Searches on the opponent's time (see agents.pondering.Ponderer): the iterations of MCTS are continued from the
+    node of the board after the last move of the agent, so that the subtree of the reply of the opponent already
+    holds visits when the next move of the agent is searched (only the "tree" and the "dag" engine keep a tree)
+    :param board: State of board after the last move of the agent
+    :param player: Player ID of the agent
+    :param saved_state: State of the agent after its last move (holds the search tree)
+    :param stop: Event that is set when pondering has to stop
+    :return: Number of iterations
+    """
+    table = None
+    max_table_nodes = MAX_TABLE_NODES
+    max_tree_nodes = MAX_TREE_NODES
+    if isinstance(saved_state, MCTSState):
+        root_node = saved_state.node
+        max_tree_nodes = saved_state.max_tree_nodes
+    elif isinstance(saved_state, MCTSDagState):
+        table = saved_state.table
+        max_table_nodes = saved_state.max_table_nodes
+        root_node = table.get(zobrist_hash(board))
+    else:
+        return 0
+    if root_node is None or root_node.untried_actions.size == 0 and not root_node.children:
+        return 0
+    visits = root_node.visits
+    # The results are counted for the agent, as in the search of its next move
+    MCTS(board, player, np.inf, root_node, table=table, max_table_nodes=max_table_nodes, stop=stop,
+         max_tree_nodes=max_tree_nodes)
+    return root_node.visits - visits
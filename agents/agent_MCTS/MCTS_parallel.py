@@ -0,0 +1,93 @@
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Optional, Tuple
+from agents.common import PlayerAction, BoardPiece, BOARD_COLS, board_to_bitboard, apply_player_action_bitboard,\
+    connect_four_bitboard
+from agents.agent_MCTS.MCTS_array import MCTS_array, MAX_NODES
+from agents.warmup import warm_up
+
+# Process pools by number of workers. They are kept alive between moves, so that the start of the processes is only
+# paid once
+pools = {}
+
+
+def get_pool(n_workers: int) -> ProcessPoolExecutor:
+    """
+    :param n_workers: Number of worker processes
+    :return: Process pool with n_workers processes (created on the first call). The processes compile the numba
+    functions when they start (see warm_up), the call returns after they started, so that this does not land in
+    the time budget of the first search
+    """
+    if n_workers not in pools:
+        pools[n_workers] = ProcessPoolExecutor(max_workers=n_workers, initializer=warm_up)
+        # A process takes tasks only after its initializer finished
+        wait([pools[n_workers].submit(time.sleep, 0.01) for _ in range(n_workers)])
+    return pools[n_workers]
+
+
+def shutdown_pools():
+    """
+    Stops the worker processes of all pools
+    """
+    for pool in pools.values():
+        pool.shutdown()
+    pools.clear()
+
+
+def search_root(board: np.ndarray, player: BoardPiece, max_time: float, max_nodes: int, seed: int) \
+        -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs an independent MCTS search in a worker process
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param player: Player ID of the player who is to move
+    :param max_time: Number of seconds of the search
+    :param max_nodes: Maximal number of nodes of the search tree
+    :param seed: Seed of the random number generator of the simulations
+    :return: Number of visits and wins of the children of the root (one entry per action, 0 for full columns)
+    """
+    _, tree = MCTS_array(board, player, max_time, max_nodes, seed)
+    children = slice(tree.first_child[0], tree.first_child[0] + BOARD_COLS)
+    return tree.visits[children].copy(), tree.wins[children].copy()
+
+
+def MCTS_parallel(board: np.ndarray, player: BoardPiece, max_time: float, n_workers: int,
+                  max_nodes: int = MAX_NODES, seed: Optional[int] = None) \
+        -> Tuple[PlayerAction, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Finds the best action using root parallel Monte-Carlo-Tree-Search: n_workers processes search independently
+    from the root (with different seeds) and their statistics of the children of the root are merged
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param player: Player ID of the player for which a good move has to be chosen
+    :param max_time: Number of seconds until an action need to be chosen
+    :param n_workers: Number of worker processes
+    :param max_nodes: Maximal number of nodes of the search tree of each worker
+    :param seed: Seed from which the seeds of the workers are derived
+    :return: Column in which player wants to make his move and the merged visits and wins of the children of
+    the root
+    """
+    seeds = np.random.SeedSequence(seed).generate_state(n_workers, dtype=np.uint64)
+    pool = get_pool(n_workers)
+    futures = [pool.submit(search_root, board, player, max_time, max_nodes, int(worker_seed))
+               for worker_seed in seeds]
+    visits = np.zeros(BOARD_COLS, dtype=np.int64)
+    wins = np.zeros(BOARD_COLS, dtype=np.int64)
+    for future in futures:
+        worker_visits, worker_wins = future.result()
+        visits += worker_visits
+        wins += worker_wins
+
+    # Take an immediate win if there is one, else choose the action with the best ratio of wins and visits
+    root_bitboards, root_heights = board_to_bitboard(board)
+    best_score = -np.inf
+    best_action = None
+    for action in np.flatnonzero(visits):
+        bitboards, heights = root_bitboards.copy(), root_heights.copy()
+        apply_player_action_bitboard(bitboards, heights, PlayerAction(action), player)
+        if connect_four_bitboard(bitboards[player - 1]):
+            return PlayerAction(action), (visits, wins)
+        score = wins[action] / visits[action]
+        if score > best_score:
+            best_action = action
+            best_score = score
+    return PlayerAction(best_action), (visits, wins)
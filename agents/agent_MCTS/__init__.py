@@ -1 +1 @@
-from .MCTS_move import generate_move_MCTS as MCTS_move
\ No newline at end of file
+from .MCTS_move import generate_move_MCTS as MCTS_move, generate_moves_MCTS as MCTS_moves, ponder_MCTS
\ No newline at end of file
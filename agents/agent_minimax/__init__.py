@@ -1 +1 @@
-from .minimax_move import generate_move_minimax as minimax_move
\ No newline at end of file
+from .minimax_move import generate_move_minimax as minimax_move, generate_moves_minimax as minimax_moves, ponder_minimax
\ No newline at end of file
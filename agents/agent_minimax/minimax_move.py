@@ -1,66 +1,265 @@
 import numpy as np
+import threading
+import time
+from numba import njit
 from typing import Optional, Tuple, List, Union
 from agents.common import PlayerAction, BoardPiece, SavedState, apply_player_action, check_end_state,\
-    GameState, CONNECT_N, PLAYER1, PLAYER2, NO_PLAYER
+    GameState, PLAYER1, PLAYER2, NO_PLAYER, WINDOW_INDICES, BOARD_COLS, zobrist_hash, zobrist_key, mirror_board,\
+    mirror_action, canonical_key, child_boards, winning_action_masks, center_first_argmax
+from agents.opening_book import book_move, DEFAULT_BOOK_FILE
+from agents.solver import solver_move, SOLVER_EMPTY_CELLS, SOLVER_NODES
 
+WIN_VALUE = 10**10  # Value of a won game for the maximizer (plus the remaining depth to prefer earlier wins)
+CENTER_ORDER = (3, 2, 4, 1, 5, 0, 6)  # Columns ordered by distance to the center (center columns are stronger)
+ASPIRATION_WINDOW = 16  # Half width of the window around the value of the previous search in iterative deepening
+TT_SIZE = 2**20  # Default number of entries of the transposition table (about 20 MB)
+MAX_BATCH_DEPTH = 3  # Largest depth of the vectorized search of generate_moves_minimax (deeper: one search per board)
+# Default depth of generate_moves_minimax. It is lower than the default depth 4 of generate_move_minimax, so that by
+# default all boards are searched by the vectorized search (depth 4 is one search per board, see MAX_BATCH_DEPTH)
+BATCH_DEPTH = 2
+BATCH_CHUNK = 256  # Number of boards that are searched together by batch_minimax (bounds the memory, ~25 MB)
+# Type of the value stored in the transposition table: exact value, lower bound or upper bound
+EXACT, LOWER_BOUND, UPPER_BOUND = 0, 1, 2
 
-def eval_board(board: np.ndarray, players: List[BoardPiece]) -> float:
+
+@njit(cache=True)
+def eval_flat_board(flat_board: np.ndarray, player_max: BoardPiece, player_min: BoardPiece) -> int:
+    """
+    Evaluates a board by scoring all windows of CONNECT_N (here 4) adjacent cells in one pass
+    :param flat_board: State of board, flattened 6 x 7 array with either 0 or player ID [1, 2]
+    :param player_max: Player for which the evaluation should be maximal
+    :param player_min: Rival of player_max
+    :return: Evaluation of the board
+    """
+    value = 0
+    for w in range(WINDOW_INDICES.shape[0]):
+        # Count the occurrences of the players in the window
+        n_max = 0
+        n_min = 0
+        for k in range(WINDOW_INDICES.shape[1]):
+            piece = flat_board[WINDOW_INDICES[w, k]]
+            if piece == player_max:
+                n_max += 1
+            elif piece == player_min:
+                n_min += 1
+        # If the rival has no piece placed in the window, a win could potentially occur. More pieces in such
+        # a window are given a higher evaluation as they are nearer to the win
+        if n_min == 0:
+            value += n_max ** 2
+        if n_max == 0:
+            value -= n_min ** 2
+    return value
+
+
+def eval_board(board: np.ndarray, players: List[BoardPiece]) -> int:
     """
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param players: List of players with player for which the evaluation should be maximal first
-    :return: Evaluation of the board
+    :return: Evaluation of the board: "winning potential" of the maximizing player minus the "winning potential"
+    of the minimizing player
+    """
+    return eval_flat_board(board.ravel(), players[0], players[1])
+
+
+@njit(cache=True)
+def eval_flat_boards(flat_boards: np.ndarray, player_max: BoardPiece, player_min: BoardPiece) -> np.ndarray:
+    """
+    Evaluates a stack of flattened boards (see eval_flat_board)
+    :param flat_boards: N x 42 array of flattened boards
+    :param player_max: Player for which the evaluation should be maximal
+    :param player_min: Rival of player_max
+    :return: Array of the N evaluations
     """
+    values = np.empty(flat_boards.shape[0], dtype=np.int64)
+    for n in range(flat_boards.shape[0]):
+        values[n] = eval_flat_board(flat_boards[n], player_max, player_min)
+    return values
+
 
-    def eval_board_part(board_part: np.ndarray, players_eval: List[BoardPiece]) -> float:
+def eval_boards(boards: np.ndarray, players: List[BoardPiece]) -> np.ndarray:
+    """
+    Evaluates many boards (e.g. all sibling leaves of the search tree) in one call
+    :param boards: N x 6 x 7 array of board states
+    :param players: List of players with player for which the evaluation should be maximal first
+    :return: Array of the N evaluations (see eval_board)
+    """
+    return eval_flat_boards(boards.reshape(boards.shape[0], -1), players[0], players[1])
+
+
+def eval_leaves(boards: np.ndarray, actions: np.ndarray, players: List[BoardPiece], player: BoardPiece) \
+        -> np.ndarray:
+    """
+    Evaluates sibling leaves of the search tree in one call
+    :param boards: N x 6 x 7 array of the boards of the leaves
+    :param actions: Actions of player that led to the boards
+    :param players: List of players with maximizer first
+    :param player: Player who took the actions
+    :return: Array of the values of the leaves for the maximizer (very positive/negative for a win/loss)
+    """
+    values = eval_boards(boards, players)
+    for i, action in enumerate(actions):
+        end_state = check_end_state(boards[i], player, PlayerAction(action))
+        if end_state == GameState.IS_WIN:
+            values[i] = WIN_VALUE if player == players[0] else -WIN_VALUE
+        elif end_state == GameState.IS_DRAW:
+            values[i] = 0
+    return values
+
+
+class TranspositionTable:
+    """
+    Fixed size hash table storing the results of searched positions (by their Zobrist hash, minimax uses the key of
+    canonical_key that a board shares with its mirror image): value, searched depth,
+    type of the value (exact or bound) and best action. If two positions map to the same entry, the one searched
+    deeper is kept (entries of searches for previous moves are always replaced)
+    """
+    def __init__(self, size: int = TT_SIZE):
         """
-        :param board_part: 4 adjacent board pieces
-        :param players_eval: List of players with player for which the winning chance in this board part
-        should be evaluated first
-        :return: Value of the board_part
+        :param size: Number of entries (a power of two)
         """
-        # Count the occurrences of the players in CONNECT_N adjacent cells
-        player_check_n = np.count_nonzero(board_part == players_eval[0])
-        player_riv_n = np.count_nonzero(board_part == players_eval[1])
-        # If the rival has no player placed in that board part, a win could potentially occur
-        if player_riv_n == 0:
-            # More board pieces in a board part where a win could occur are given a higher evaluation as
-            # they are nearer to the win
-            return player_check_n ** 2
-        else:
-            return 0
-
-    rows, cols = board.shape
-    rows_edge = rows - CONNECT_N + 1
-    cols_edge = cols - CONNECT_N + 1
-    players_rev = players[::-1]  # Players with minimizing player first
-    value_max_player = 0
-    value_min_player = 0
-    # Compute the winning potential of each player by looking at all possible CONNECT_N adjacent board cells
-    # and evaluating these board parts
-    for i in range(rows):
-        for j in range(cols_edge):
-            row_part = board[i, j:j + CONNECT_N]
-            value_max_player += eval_board_part(row_part, players)
-            value_min_player += eval_board_part(row_part, players_rev)
-    for i in range(rows_edge):
-        for j in range(cols):
-            col_part = board[i:i + CONNECT_N, j]
-            value_max_player += eval_board_part(col_part, players)
-            value_min_player += eval_board_part(col_part, players_rev)
-    for i in range(rows_edge):
-        for j in range(cols_edge):
-            block = board[i:i + CONNECT_N, j:j + CONNECT_N]
-            value_max_player += eval_board_part(np.diag(block), players)
-            value_min_player += eval_board_part(np.diag(block), players_rev)
-            value_max_player += eval_board_part(np.diag(block[::-1, :]), players)
-            value_min_player += eval_board_part(np.diag(block[::-1, :]), players_rev)
-
-    # Return the "winning potential" of the maximizing player minus the "winning potential"
-    # of the minimizing player
-    return value_max_player - value_min_player
-
-
-def minimax(board: np.ndarray, alpha: int, beta: int, players: List[BoardPiece], depth: int, MaxPlayer: bool) \
+        self.mask = size - 1
+        self.keys = np.zeros(size, dtype=np.int64)
+        self.values = np.zeros(size, dtype=np.float64)
+        self.depths = np.full(size, -1, dtype=np.int8)  # -1 marks an empty entry
+        self.flags = np.zeros(size, dtype=np.int8)
+        self.actions = np.zeros(size, dtype=np.int8)
+        self.generations = np.zeros(size, dtype=np.int16)
+        self.generation = 0  # Number of the current search, increased for every move
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, board_hash: int) -> Optional[int]:
+        """
+        :param board_hash: Zobrist hash of the board
+        :return: Index of the entry of the board or None if the board is not in the table
+        """
+        index = board_hash & self.mask
+        if self.depths[index] >= 0 and self.keys[index] == board_hash:
+            self.hits += 1
+            return index
+        self.misses += 1
+        return None
+
+    def store(self, board_hash: int, value: float, depth: int, flag: int, action: PlayerAction):
+        """
+        Stores the result of the search of a board if the entry is empty, belongs to the same board, comes from an
+        older search or was searched less deep
+        :param board_hash: Zobrist hash of the board
+        :param value: Value of the board for the maximizer
+        :param depth: Depth to which the board was searched
+        :param flag: EXACT, LOWER_BOUND or UPPER_BOUND
+        :param action: Best action found for the board
+        """
+        index = board_hash & self.mask
+        if self.keys[index] == board_hash or self.generations[index] != self.generation \
+                or depth >= self.depths[index]:
+            self.keys[index] = board_hash
+            self.values[index] = value
+            self.depths[index] = depth
+            self.flags[index] = flag
+            self.actions[index] = action
+            self.generations[index] = self.generation
+
+
+class MinimaxState(SavedState):
+    """
+    State of the minimax agent that is kept between the moves of one game
+    """
+    def __init__(self, player: BoardPiece, tt_size: int = TT_SIZE):
+        self.player = player  # Values in the transposition table are stored for this player
+        self.transposition_table = TranspositionTable(tt_size)
+
+
+class SearchTimeout(Exception):
+    """
+    Raised inside the search when the deadline of the search is reached
+    """
+
+
+class SearchContext:
+    """
+    Holds the move ordering heuristics (killer moves and history heuristic) and the node counters that are shared
+    by all nodes of one minimax search
+    """
+    def __init__(self, deadline: Optional[float] = None, transposition_table: Optional[TranspositionTable] = None,
+                 stop: Optional[threading.Event] = None):
+        self.killers = {}  # Up to two actions per remaining depth that caused a cutoff in a sibling node
+        self.history = np.zeros((2, BOARD_COLS))  # Score per player and column, increased on every cutoff
+        self.nodes = 0  # Number of visited nodes (including leaves)
+        self.depth = 0  # Depth of the last completed search
+        self.cutoffs = 0  # Number of alpha/beta cutoffs
+        self.deadline = deadline  # Time (time.time()) at which the search has to be stopped
+        self.stop = stop  # Event that stops the search when it is set (e.g. at the end of pondering)
+        # Results of searched positions (also of the previous searches, e.g. the principal variation)
+        self.transposition_table = transposition_table if transposition_table is not None else TranspositionTable()
+
+    def order_actions(self, board: np.ndarray, player: BoardPiece, depth: int,
+                      tt_action: Optional[PlayerAction] = None) -> List[PlayerAction]:
+        """
+        Orders the actions such that the actions that most likely cause a cutoff are searched first: the best
+        action of a previous search of the board first (e.g. of the principal variation), then killer moves, then
+        by history score and then center columns first
+        :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+        :param player: Player who takes the action
+        :param depth: Remaining depth of the node
+        :param tt_action: Best action of the board stored in the transposition table
+        :return: List of ordered possible actions (not already full columns)
+        """
+        killers = self.killers.get(depth, [])
+        center_first = [PlayerAction(action) for action in CENTER_ORDER if board[0, action] == NO_PLAYER]
+        # Sorting is stable, so actions with the same score stay in center first order
+        return sorted(center_first,
+                      key=lambda action: (action == tt_action, action in killers, self.history[player - 1, action]),
+                      reverse=True)
+
+    def store_cutoff(self, action: PlayerAction, player: BoardPiece, depth: int):
+        """
+        Updates the killer moves and the history heuristic after an action caused a cutoff
+        :param action: Action that caused the cutoff
+        :param player: Player who took the action
+        :param depth: Remaining depth of the node
+        """
+        self.cutoffs += 1
+        killers = self.killers.setdefault(depth, [])
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[2:]
+        # Cutoffs high up in the tree save more nodes and are weighted more
+        self.history[player - 1, action] += depth ** 2
+
+
+def value_to_tt(value: float, depth: int) -> float:
+    """
+    :param value: Value of a board that was searched with the remaining depth
+    :param depth: Remaining depth of the search at the board
+    :return: Value to store in the transposition table. The value of a won game depends on the remaining depth at
+    the end of the game, so it is stored relative to the board (WIN_VALUE minus the number of moves until the end)
+    """
+    if value >= WIN_VALUE:
+        return value - depth
+    if value <= -WIN_VALUE:
+        return value + depth
+    return value
+
+
+def value_from_tt(value: float, depth: int) -> float:
+    """
+    :param value: Value of the transposition table (see value_to_tt)
+    :param depth: Remaining depth of the search at the board
+    :return: Value of the board for the remaining depth (a win beyond the remaining depth counts as a win at the
+    bottom of the search)
+    """
+    # Values of won games are far from the evaluations of boards
+    if value >= WIN_VALUE / 2:
+        return max(value + depth, WIN_VALUE)
+    if value <= -WIN_VALUE / 2:
+        return min(value - depth, -WIN_VALUE)
+    return value
+
+
+def minimax(board: np.ndarray, alpha: int, beta: int, players: List[BoardPiece], depth: int, MaxPlayer: bool,
+            last_action: Optional[PlayerAction] = None, context: Optional[SearchContext] = None,
+            root: bool = False, board_hashes: Optional[Tuple[int, int]] = None) \
         -> Tuple[any, Union[PlayerAction, None]]:
     """
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
@@ -69,16 +268,32 @@ def minimax(board: np.ndarray, alpha: int, beta: int, players: List[BoardPiece],
     :param players: List of players with maximizer first
     :param depth: Steps that should be evaluated
     :param MaxPlayer: Bool if it is the maximizers turn
+    :param last_action: Action that led to the board (only the lines through it are checked for a win)
+    :param context: Move ordering heuristics and counters of the search (a new one is created if not given)
+    :param root: Bool if the node is the root of the search. At the root the exact values of all actions that
+    are as good as the best one are determined, so that one of them can be chosen randomly
+    :param board_hashes: Zobrist hashes of the board and of its mirror image (computed if not given). The board and
+    its mirror image share one entry of the transposition table
     :return: Best value for maximizer or minimizer and the corresponding action
     """
+    if context is None:
+        context = SearchContext()
+    if board_hashes is None:
+        board_hashes = (zobrist_hash(board), zobrist_hash(mirror_board(board)))
+    if context.deadline is not None and time.time() > context.deadline:
+        raise SearchTimeout()
+    if context.stop is not None and context.stop.is_set():
+        raise SearchTimeout()
+    context.nodes += 1
     # Check endstate of the game after last players move
-    end_state = check_end_state(board, players[0] if not MaxPlayer else players[1])
-    # Return very positive/negative value if the move of the last player won the game
+    end_state = check_end_state(board, players[0] if not MaxPlayer else players[1], last_action)
+    # Return very positive/negative value if the move of the last player won the game (earlier wins, i.e.
+    # a larger remaining depth, are preferred)
     if end_state == GameState.IS_WIN:
         if MaxPlayer:
-            return -10**10, None
+            return -WIN_VALUE - depth, None
         else:
-            return 10**10, None
+            return WIN_VALUE + depth, None
     if end_state == GameState.IS_DRAW:
         return 0, None
     # Only evaluate the board if the game is still going on and the bottom of the tree is reached
@@ -93,55 +308,282 @@ def minimax(board: np.ndarray, alpha: int, beta: int, players: List[BoardPiece],
         best_value = np.inf
         player = players[1]
 
-    # Get all the possible actions (not already full columns)
-    free_columns = np.unique(np.where(board == NO_PLAYER)[1])
-    # Change the order of the actions such that in case that more than one action has the same value,
-    # a random action is selected
-    action_values = []
-    for action in free_columns:
-        # Apply the action and got one steep deep deeper into the tree
-        board_new = apply_player_action(board.copy(), PlayerAction(action), player)
-        value, _ = minimax(board_new, alpha, beta, players, depth - 1, not MaxPlayer)
-        action_values.append((action, value))
+    # Use the result of a previous search of the board if it was searched at least as deep (not at the root, where
+    # the values of all equally good actions are needed)
+    tt = context.transposition_table
+    alpha_original, beta_original = alpha, beta
+    tt_action = None
+    # The actions of mirrored boards are stored for the canonical board
+    key, mirrored = canonical_key(*board_hashes)
+    index = tt.lookup(key)
+    if index is not None:
+        tt_action = mirror_action(tt.actions[index]) if mirrored else tt.actions[index]
+        if not root and tt.depths[index] >= depth:
+            tt_value = value_from_tt(tt.values[index], depth)
+            if tt.flags[index] == EXACT:
+                return tt_value, tt_action
+            elif tt.flags[index] == LOWER_BOUND:
+                alpha = max(alpha, tt_value)
+            else:
+                beta = min(beta, tt_value)
+            if beta <= alpha:
+                return tt_value, tt_action
+
+    # Get all the possible actions (not already full columns) in the order in which they should be searched
+    actions = context.order_actions(board, player, depth, tt_action)
+    # Apply the actions to get the boards one step deeper into the tree
+    children = np.stack([apply_player_action(board.copy(), action, player) for action in actions])
+    if depth == 1:
+        # All children are leaves: evaluate them in one call
+        leaf_values = eval_leaves(children, actions, players, player)
+        context.nodes += len(actions)
+    else:
+        # The hashes of the children are only needed for their transposition table lookups
+        child_hashes = [(board_hashes[0] ^ zobrist_key(board, action, player),
+                         board_hashes[1] ^ zobrist_key(mirror_board(board), mirror_action(action), player))
+                        for action in actions]
+    best_actions = []
+    for i, action in enumerate(actions):
+        if depth == 1:
+            value = leaf_values[i]
+        else:
+            value, _ = minimax(children[i], alpha, beta, players, depth - 1, not MaxPlayer, action, context,
+                               board_hashes=child_hashes[i])
         # If the action results in a board that is better than all the previously checked actions
         # for the current player, save it and the corresponding evaluation of the board
-        if MaxPlayer and value >= best_value:
+        if (MaxPlayer and value > best_value) or (not MaxPlayer and value < best_value):
             best_value = value
-            best_action = action
-            #alpha = max(alpha, best_value)
-            #if beta <= alpha:
-               # break
-        if not MaxPlayer and value <= best_value:
-            best_value = value
-            best_action = action
-            #beta = min(beta, best_value)
-            #if beta <= alpha:
-                #break
-    #if depth == 4:
-        #print(action_values)
+            best_actions = [action]
+        elif value == best_value:
+            best_actions.append(action)
+        if MaxPlayer:
+            # At the root, keep the window open for actions with the same value as the best one (values are integers)
+            alpha = max(alpha, best_value - 1 if root else best_value)
+        else:
+            beta = min(beta, best_value)
+        if beta <= alpha:
+            context.store_cutoff(action, player, depth)
+            break
 
+    # Choose randomly between actions with the same value
+    best_action = best_actions[np.random.randint(len(best_actions))] if root else best_actions[0]
+    if best_value <= alpha_original:
+        flag = UPPER_BOUND
+    elif best_value >= beta_original:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    tt.store(key, value_to_tt(best_value, depth), depth, flag, mirror_action(best_action) if mirrored else best_action)
     return best_value, best_action
 
 
+def iterative_deepening(board: np.ndarray, players: List[BoardPiece], max_time: float,
+                        transposition_table: Optional[TranspositionTable] = None,
+                        context: Optional[SearchContext] = None) -> PlayerAction:
+    """
+    Searches the board with increasing depth until the time is up. Each search uses the principal variation of
+    the previous one (stored in the transposition table) for the move ordering and an aspiration window around
+    its value
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param players: List of players with player who moves first
+    :param max_time: Time in sec after which the search is stopped
+    :param transposition_table: Transposition table used by the searches
+    :param context: Context of the searches (holds the statistics of the searches afterwards), a new one is created
+    if not given
+    :return: Best action of the deepest search that was completed in time
+    """
+    if context is None:
+        context = SearchContext(transposition_table=transposition_table)
+    context.deadline = time.time() + max_time
+    # If not even the search of depth 1 can be completed, take the most central free column
+    best_action = context.order_actions(board, players[0], 1)[0]
+    value = None
+    n_empty = np.count_nonzero(board == NO_PLAYER)
+    try:
+        for depth in range(1, n_empty + 1):
+            if value is None or abs(value) >= WIN_VALUE:
+                alpha, beta = -np.inf, np.inf
+            else:
+                alpha, beta = value - ASPIRATION_WINDOW, value + ASPIRATION_WINDOW
+            value, action = minimax(board, alpha, beta, players, depth, True, context=context, root=True)
+            # If the value is outside of the aspiration window, it is only a bound: search again with a full window
+            if not alpha < value < beta:
+                value, action = minimax(board, -np.inf, np.inf, players, depth, True, context=context, root=True)
+            best_action = action
+            context.depth = depth
+            # Stop if the outcome of the game is already decided
+            if abs(value) >= WIN_VALUE:
+                break
+    except SearchTimeout:
+        pass
+    return best_action
+
+
 def generate_move_minimax(board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
-                          depth: int = 4) -> Tuple[PlayerAction, SavedState]:
+                          depth: Union[int, float] = 4, book_file: Optional[str] = DEFAULT_BOOK_FILE,
+                          solver_empty_cells: int = SOLVER_EMPTY_CELLS, solver_nodes: int = SOLVER_NODES,
+                          tt_size: int = TT_SIZE) -> Tuple[PlayerAction, SavedState]:
     """
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player ID
-    :param saved_state: Not used in this implementation of the minimax move generation
-    :param depth: Depth of the minimax agent / how many steps should be searched ahead
+    :param saved_state: State of the agent from the previous move (holds the transposition table and the
+    statistics of the search of the last move)
+    :param depth: Depth of the minimax agent / how many steps should be searched ahead. If a float is given, it is
+    the time in sec given to the agent for the whole move (the book and the solver included) and the depth is
+    increased until the time is up (iterative deepening)
+    :param book_file: File of the opening book that is consulted before searching (None: no book)
+    :param solver_empty_cells: Number of empty cells below which the move is chosen by the exact solver
+    :param solver_nodes: Node budget of the solver for positions with more empty cells (0: never try the solver)
+    :param tt_size: Number of entries of the transposition table (21 bytes each) if a new one is created
     :return: Column in which player wants to make his move (chosen using the minimax algorithm)
     """
+    end_time = time.time() + depth if isinstance(depth, float) else None
+    action = book_move(board, book_file)
     # If the minimax agent can make the first move, make sure it is always in the middle (position 3)
-    if not board.any():
-        return PlayerAction(3), SavedState()
+    if action is None and not board.any():
+        action = PlayerAction(3)
+    if action is not None:
+        # No transposition table is allocated for a move of the book (the one of previous moves is kept)
+        if not isinstance(saved_state, MinimaxState) or saved_state.player != player:
+            saved_state = SavedState()
+        saved_state.stats = {"source": "book"}
+        return action, saved_state
+
+    # Keep the transposition table of the previous moves of the game
+    if not isinstance(saved_state, MinimaxState) or saved_state.player != player:
+        saved_state = MinimaxState(player, tt_size)
+    tt = saved_state.transposition_table
+    tt.generation += 1
+
+    solved = solver_move(board, player, solver_empty_cells, solver_nodes)
+    if solved is not None:
+        action, saved_state.stats = solved
+        return action, saved_state
 
     # Create a list that holds the player first, and the opponent second
     players = [PLAYER1, PLAYER2]
     players.remove(player)
     ordered_players = [player] + players
 
-    # Determine the best action using a minimax algorithm with alpha-bet-pruning which looks 4 steps ahead
-    # (two for each player)
-    _, action = minimax(board, -np.inf, np.inf, ordered_players, depth, True)
-    return PlayerAction(action), SavedState()
+    tt_hits, tt_misses = tt.hits, tt.misses
+    context = SearchContext(transposition_table=tt)
+    if isinstance(depth, float):
+        # Only the time that is left after the book and the solver is given to the search
+        action = iterative_deepening(board, ordered_players, max(end_time - time.time(), 0.), context=context)
+    else:
+        # Determine the best action using a minimax algorithm with alpha-beta-pruning which looks depth steps ahead
+        _, action = minimax(board, -np.inf, np.inf, ordered_players, depth, True, context=context, root=True)
+        context.depth = depth
+    saved_state.stats = {"source": "search", "nodes": context.nodes, "depth": context.depth,
+                         "cutoffs": context.cutoffs, "tt_hits": tt.hits - tt_hits, "tt_misses": tt.misses - tt_misses}
+    return PlayerAction(action), saved_state
+
+
+def batch_minimax(boards: np.ndarray, players: np.ndarray, depth: int) -> np.ndarray:
+    """
+    Vectorized minimax of many boards at once: the search trees of all boards are expanded level by level with full
+    width (no pruning), the wins of all nodes of a level are detected at once and all leaves are evaluated in one
+    call. The values are the ones of minimax with the same depth
+    :param boards: N x 6 x 7 array of boards of games that are still going on
+    :param players: Array of the N player IDs of the players to move (the maximizers)
+    :param depth: Depth of the search (the memory grows with 7 ** depth per board)
+    :return: N x 7 array of the values of the actions for the players (-inf for full columns)
+    """
+    n = boards.shape[0]
+    opponents = np.where(players == PLAYER1, PLAYER2, PLAYER1).astype(BoardPiece)
+    nodes = boards.reshape(n, -1)
+    roots = np.arange(n)  # Index of the board of the search tree of each node
+    # Values of the children of the nodes of each level that end the search (wins, draws and full columns), NaN for
+    # children whose value comes from the level below
+    fixed_values = []
+    for level in range(depth):
+        max_level = level % 2 == 0
+        movers = players[roots] if max_level else opponents[roots]
+        children, legal = child_boards(nodes, movers)
+        won = np.all(children[:, :, WINDOW_INDICES] == movers[:, None, None, None], axis=3).any(axis=2) & legal
+        full = ~(children[:, :, :BOARD_COLS] == NO_PLAYER).any(axis=2)
+        values = np.full(legal.shape, np.nan)
+        values[full & legal] = 0
+        # Earlier wins (a larger remaining depth) are preferred, as in minimax
+        values[won] = (WIN_VALUE + depth - level - 1) * (1 if max_level else -1)
+        values[~legal] = -np.inf if max_level else np.inf
+        fixed_values.append(values)
+        nodes = children.reshape(-1, nodes.shape[1])
+        roots = np.repeat(roots, BOARD_COLS)
+
+    # Evaluate the leaves of all boards (per player of the roots, the maximizer)
+    leaf_values = fixed_values[-1].ravel()
+    for player in (PLAYER1, PLAYER2):
+        leaves = np.flatnonzero(np.isnan(leaf_values) & (players[roots] == player))
+        leaf_values[leaves] = eval_flat_boards(nodes[leaves], player, PLAYER1 if player == PLAYER2 else PLAYER2)
+    # Back up the values: maximum over the children at the levels of the maximizer, minimum at the others
+    values = leaf_values.reshape(-1, BOARD_COLS)
+    for level in range(depth - 1, 0, -1):
+        node_values = values.max(axis=1) if level % 2 == 0 else values.min(axis=1)
+        values = np.where(np.isnan(fixed_values[level - 1]), node_values.reshape(-1, BOARD_COLS),
+                          fixed_values[level - 1])
+    return values
+
+
+def generate_moves_minimax(boards: np.ndarray, players: Union[BoardPiece, np.ndarray],
+                           depth: int = BATCH_DEPTH) -> np.ndarray:
+    """
+    Batched move generation of the minimax agent: immediate wins and blocks of all boards are detected at once,
+    the other boards are searched together with batch_minimax (one search per board with minimax if depth is
+    larger than MAX_BATCH_DEPTH). The opening book and the solver of generate_move_minimax are not used
+    :param boards: N x 6 x 7 array of boards of games that are still going on
+    :param players: Player IDs of the players to move (one per board or one for all boards)
+    :param depth: Depth of the search (by default BATCH_DEPTH, which is lower than the default depth of
+    generate_move_minimax, pass depth=4 to search as deep)
+    :return: Array of the N actions (of equally good actions the most central one)
+    """
+    players = np.broadcast_to(np.asarray(players, dtype=BoardPiece), (boards.shape[0],))
+    opponents = np.where(players == PLAYER1, PLAYER2, PLAYER1).astype(BoardPiece)
+    wins = winning_action_masks(boards, players)
+    blocks = winning_action_masks(boards, opponents)
+    # Take an immediate win, else block an immediate win of the opponent
+    actions = np.where(wins.any(axis=1), center_first_argmax(wins), center_first_argmax(blocks)).astype(PlayerAction)
+    search = np.flatnonzero(~wins.any(axis=1) & ~blocks.any(axis=1))
+    if depth > MAX_BATCH_DEPTH:
+        # The values in a transposition table are stored for one maximizer, so each player gets its own
+        contexts = {PLAYER1: SearchContext(), PLAYER2: SearchContext()}
+        for i in search:
+            _, actions[i] = minimax(boards[i], -np.inf, np.inf, [players[i], opponents[i]], depth, True,
+                                    context=contexts[players[i]])
+        return actions
+    for start in range(0, search.size, BATCH_CHUNK):
+        chunk = search[start:start + BATCH_CHUNK]
+        actions[chunk] = center_first_argmax(batch_minimax(boards[chunk], players[chunk], depth))
+    return actions
+
+
+def ponder_minimax(board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState],
+                   stop: threading.Event) -> int:
+    """
+    Searches on the opponent's time (see agents.pondering.Ponderer): the boards after all replies of the opponent
+    are searched with increasing depth, as the search of the next move of the agent would search them, so that
+    this search finds their results in the transposition table
+    :param board: State of board after the last move of the agent
+    :param player: Player ID of the agent
+    :param saved_state: State of the agent after its last move (holds the transposition table)
+    :param stop: Event that is set when pondering has to stop
+    :return: Number of searched nodes
+    """
+    if not isinstance(saved_state, MinimaxState) or saved_state.player != player:
+        return 0
+    opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+    context = SearchContext(transposition_table=saved_state.transposition_table, stop=stop)
+    # Boards after the replies of the opponent that do not end the game, most likely replies first
+    boards = []
+    for action in context.order_actions(board, opponent, 1):
+        child = apply_player_action(board.copy(), action, opponent)
+        if check_end_state(child, opponent, action) == GameState.STILL_PLAYING:
+            boards.append(child)
+    try:
+        for depth in range(1, np.count_nonzero(board == NO_PLAYER)):
+            for child in boards:
+                minimax(child, -np.inf, np.inf, [player, opponent], depth, True, context=context, root=True)
+            context.depth = depth
+    except SearchTimeout:
+        pass
+    return context.nodes
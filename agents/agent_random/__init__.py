@@ -1 +1 @@
-from .random_move import generate_move_random as random_move
\ No newline at end of file
+from .random_move import generate_move_random as random_move, generate_moves_random as random_moves
\ No newline at end of file
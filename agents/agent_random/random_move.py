@@ -1,6 +1,6 @@
 import numpy as np
-from typing import Optional, Tuple
-from agents.common import PlayerAction, BoardPiece, SavedState, NO_PLAYER
+from typing import Optional, Tuple, Union
+from agents.common import PlayerAction, BoardPiece, SavedState, NO_PLAYER, legal_action_masks
 
 
 def generate_move_random(board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState], args=None) \
@@ -15,3 +15,20 @@ def generate_move_random(board: np.ndarray, player: BoardPiece, saved_state: Opt
     # Get column indexes where there is no player and choose one empty column randomly
     action = np.random.choice(np.unique(np.where(board == NO_PLAYER)[1]))
     return PlayerAction(action), SavedState()
+
+
+def generate_moves_random(boards: np.ndarray, players: Union[BoardPiece, np.ndarray] = None, args=None,
+                          rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Batched move generation of the random agent
+    :param boards: N x 6 x 7 array of boards
+    :param players: Not used in this implementation of the random move generation
+    :param args: Optional parameter
+    :param rng: Random number generator (a new one if not given)
+    :return: Array of the N actions (chosen randomly among the columns that are not full)
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    # The free column with the largest random key
+    return np.argmax(rng.random((boards.shape[0], boards.shape[2])) * legal_action_masks(boards), axis=1)\
+        .astype(PlayerAction)
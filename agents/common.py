@@ -10,6 +10,105 @@ PLAYER1 = BoardPiece(1)  # board[i, j] == PLAYER1 where player 1 has a piece
 PLAYER2 = BoardPiece(2)  # board[i, j] == PLAYER2 where player 2 has a piece
 CONNECT_N = 4  # Number of connected board pieces needed for a win
 PlayerAction = np.int8  # The column to be played
+BOARD_ROWS = 6  # Number of rows of the board
+BOARD_COLS = 7  # Number of columns of the board
+# The bitboard is used by the MCTS playouts and the solver, minimax still searches on the 6 x 7 array board
+# Height of one column in the bitboard representation: every column gets one extra (always empty) bit on top,
+# so that shifted pieces of one column can never spill over into the next column
+BITBOARD_HEIGHT = BOARD_ROWS + 1
+# Shifts between neighbouring cells in the bitboard: vertical, horizontal, diagonal (/) and anti-diagonal (\)
+BITBOARD_SHIFTS = (1, BITBOARD_HEIGHT, BITBOARD_HEIGHT + 1, BITBOARD_HEIGHT - 1)
+
+
+def winning_windows() -> np.ndarray:
+    """
+    Creates the table of all CONNECT_N (here 4) adjacent cells of the board in which a win can occur
+    :return: Array of shape (69, 4) holding the flat indices (index into board.ravel()) of the cells of each window
+    """
+    flat_index = np.arange(BOARD_ROWS * BOARD_COLS).reshape(BOARD_ROWS, BOARD_COLS)
+    rows_edge = BOARD_ROWS - CONNECT_N + 1
+    cols_edge = BOARD_COLS - CONNECT_N + 1
+    windows = []
+    for i in range(BOARD_ROWS):
+        for j in range(cols_edge):
+            windows.append(flat_index[i, j:j + CONNECT_N])
+    for i in range(rows_edge):
+        for j in range(BOARD_COLS):
+            windows.append(flat_index[i:i + CONNECT_N, j])
+    for i in range(rows_edge):
+        for j in range(cols_edge):
+            block = flat_index[i:i + CONNECT_N, j:j + CONNECT_N]
+            windows.append(np.diag(block))
+            windows.append(np.diag(block[::-1, :]))
+    return np.array(windows, dtype=np.int64)
+
+
+WINDOW_INDICES = winning_windows()  # Flat indices of the cells of all windows in which a win can occur
+
+# Random keys for the Zobrist hash of a board: one key per player and cell. The keys are drawn with a fixed seed, so
+# that hashes are the same in every process (e.g. for files that store positions by their hash)
+ZOBRIST_KEYS = np.random.default_rng(4).integers(0, 2**63, size=(2, BOARD_ROWS, BOARD_COLS), dtype=np.int64)
+
+
+def zobrist_hash(board: np.ndarray) -> int:
+    """
+    Computes the Zobrist hash of a board: the XOR of the keys of all pieces on the board. After an action the hash
+    can be updated incrementally by XOR-ing the key of the dropped piece (see zobrist_key)
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :return: Hash of the board
+    """
+    rows, cols = np.nonzero(board)
+    return int(np.bitwise_xor.reduce(ZOBRIST_KEYS[board[rows, cols] - 1, rows, cols]))
+
+
+def zobrist_key(board: np.ndarray, action: PlayerAction, player: BoardPiece) -> int:
+    """
+    Determines the Zobrist key of the piece that the player drops into the column action
+    :param board: State of board before the action was applied
+    :param action: Column where player is dropped
+    :param player: Player ID [1, 2]
+    :return: Key that has to be XOR-ed with the hash of board to get the hash of the board after the action
+    """
+    row = np.count_nonzero(board[:, action] == NO_PLAYER) - 1
+    return int(ZOBRIST_KEYS[player - 1, row, action])
+
+
+def mirror_board(board: np.ndarray) -> np.ndarray:
+    """
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :return: Mirror image of the board (columns in reverse order, a view of the board)
+    """
+    return board[:, ::-1]
+
+
+def mirror_action(action: PlayerAction) -> PlayerAction:
+    """
+    :param action: Column of the board
+    :return: Column of the mirror image of the board that corresponds to the column
+    """
+    return PlayerAction(BOARD_COLS - 1 - action)
+
+
+def canonical_key(board_hash: int, mirror_hash: int) -> Tuple[int, bool]:
+    """
+    Determines the key that a board and its mirror image share (the smaller of their two Zobrist hashes)
+    :param board_hash: Zobrist hash of the board
+    :param mirror_hash: Zobrist hash of the mirror image of the board
+    :return: Key of the board and bool if the key is the hash of the mirror image (actions stored under the key
+    have to be mirrored with mirror_action to be applied to the board)
+    """
+    if mirror_hash < board_hash:
+        return mirror_hash, True
+    return board_hash, False
+
+
+def canonical_hash(board: np.ndarray) -> Tuple[int, bool]:
+    """
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :return: Key that the board and its mirror image share and bool if the key belongs to the mirror image (see
+    canonical_key)
+    """
+    return canonical_key(zobrist_hash(board), zobrist_hash(mirror_board(board)))
 
 
 # Class indicating whether the game is still going on, ended in a draw (full board) or one of the players won
@@ -20,7 +119,9 @@ class GameState(Enum):
 
 
 class SavedState:
-    pass
+    # Statistics of the search of the last move (e.g. searched nodes), filled in by the agents. A dict of numbers,
+    # strings and lists, so that it can be written as JSON
+    stats: Optional[dict] = None
 
 
 # Arguments and return type for the generate_move function: Add Optional[Union[int, float, None]]] to give the
@@ -30,6 +131,10 @@ GenMove = Callable[
     Tuple[PlayerAction, Optional[SavedState]]
 ]
 
+# Arguments and return type of the batched generate_moves functions: N x 6 x 7 array of boards, player IDs of the
+# players to move (one per board or one for all boards) and the parameter of the agent -> array of the N actions
+GenMoves = Callable[[np.ndarray, Union[BoardPiece, np.ndarray], Optional[Union[int, float, None]]], np.ndarray]
+
 
 def initialize_game_state() -> np.ndarray:
     """
@@ -94,7 +199,7 @@ def apply_player_action(
     except:
         raise Exception("Tried to apply an action in a non existent or full column")
 
-@njit()
+@njit(cache=True)
 def connect_four(
         board: np.ndarray, player: BoardPiece, last_action: Optional[PlayerAction] = None) \
         -> bool:
@@ -102,10 +207,31 @@ def connect_four(
     Determines if a player has at least CONNECT_N (here 4) adjacent pieces on the board
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player ID for which victory should be checked
-    :param last_action: last column where player was dropped
+    :param last_action: last column where player was dropped. If given, only the lines through the piece that
+    was dropped last are checked (i.e. it is assumed that there was no win on the board before that action)
     :return: Decision on whether the player won (whether he has N adjacent pieces on the board)
     """
     rows, cols = board.shape
+    if last_action is not None:
+        # Find the row of the piece that was dropped last (the highest piece in the column)
+        row = 0
+        while row < rows and board[row, last_action] == NO_PLAYER:
+            row += 1
+        if row == rows or board[row, last_action] != player:
+            return False
+        # Count the adjacent pieces of the player in both directions of the four lines through the piece
+        for d_row, d_col in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            n_adjacent = 1
+            for sign in (1, -1):
+                i = row + sign * d_row
+                j = last_action + sign * d_col
+                while 0 <= i < rows and 0 <= j < cols and board[i, j] == player:
+                    n_adjacent += 1
+                    i += sign * d_row
+                    j += sign * d_col
+            if n_adjacent >= CONNECT_N:
+                return True
+        return False
     rows_edge = rows - CONNECT_N + 1
     cols_edge = cols - CONNECT_N + 1
     # Check for a win in thes row
@@ -136,14 +262,173 @@ def check_end_state(
     Determines the state of the game
     :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
     :param player: Player ID for which GameState should be checked
-    :param last_action: last column where player was dropped
+    :param last_action: last column where player was dropped (if given, only the lines through that piece are
+    checked for a win)
     :return: State of Game: Either the player won, the game is drawn or is still going on
     """
 
-    if connect_four(board, player):
+    if connect_four(board, player, last_action):
         return GameState.IS_WIN
     else:
-        if 0 in board:
-            return GameState.STILL_PLAYING
-        else:
+        # The board is full if there is no empty cell left in the top row
+        if board[0].all():
             return GameState.IS_DRAW
+        else:
+            return GameState.STILL_PLAYING
+
+
+# Batched primitives
+# ------------------
+# Functions on a stack of N boards (N x 6 x 7 array) of games that are still going on, vectorized across all boards.
+# They are the shared steps of the batched move generation of the agents (e.g. generate_moves_minimax).
+
+
+def legal_action_masks(boards: np.ndarray) -> np.ndarray:
+    """
+    :param boards: N x 6 x 7 array of boards
+    :return: N x 7 array that is True for the columns that are not full
+    """
+    return boards[:, 0, :] == NO_PLAYER
+
+
+def child_boards(flat_boards: np.ndarray, players: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Applies every action to every board at once
+    :param flat_boards: N x 42 array of flattened boards
+    :param players: Array of the N player IDs of the players who take the actions
+    :return: N x 7 x 42 array of the flattened boards after each action (the unchanged board for full columns)
+    and the N x 7 array that is True for the actions of columns that are not full
+    """
+    n = flat_boards.shape[0]
+    # Row in which the piece of each action lands: the number of empty cells of the column minus one
+    rows = np.count_nonzero(flat_boards.reshape(n, BOARD_ROWS, BOARD_COLS) == NO_PLAYER, axis=1) - 1
+    legal = rows >= 0
+    children = np.repeat(flat_boards[:, None, :], BOARD_COLS, axis=1)
+    boards_index, actions = np.nonzero(legal)
+    children[boards_index, actions, rows[boards_index, actions] * BOARD_COLS + actions] = players[boards_index]
+    return children, legal
+
+
+def winning_action_masks(boards: np.ndarray, players: Union[BoardPiece, np.ndarray]) -> np.ndarray:
+    """
+    Finds the actions that win the game at once on many boards (immediate blocks are the winning actions of the
+    opponent)
+    :param boards: N x 6 x 7 array of boards
+    :param players: Player IDs of the players who take the actions (one per board or one for all boards)
+    :return: N x 7 array that is True for the actions that win the game
+    """
+    players = np.broadcast_to(np.asarray(players, dtype=BoardPiece), (boards.shape[0],))
+    children, legal = child_boards(boards.reshape(boards.shape[0], -1), players)
+    won = np.all(children[:, :, WINDOW_INDICES] == players[:, None, None, None], axis=3).any(axis=2)
+    return won & legal
+
+
+def center_first_argmax(scores: np.ndarray) -> np.ndarray:
+    """
+    :param scores: N x 7 array of scores of the actions
+    :return: Array of the N actions with the largest score (of equally good actions the most central one)
+    """
+    center_order = np.array([3, 2, 4, 1, 5, 0, 6])
+    return center_order[np.argmax(scores[:, center_order], axis=1)].astype(PlayerAction)
+
+
+# Bitboard representation of the game state
+# -----------------------------------------
+# Each player is represented by one 64-bit integer mask. Bit (col * BITBOARD_HEIGHT + row) is set if the player has a
+# piece in column col, row row (counted from the bottom of the board, i.e. row 0 of the bitboard is row 5 of the
+# ndarray board). The two masks are stored in an array of length 2 (index player - 1), the number of pieces per
+# column is stored in a separate heights array of length 7. All primitives below only need a few integer operations.
+
+
+@njit(cache=True)
+def board_to_bitboard(board: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts a board given as an array into its bitboard representation
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2] (pieces are assumed to obey gravity)
+    :return: Array of the two player masks (index player - 1) and array of the number of pieces per column
+    """
+    rows, cols = board.shape
+    bitboards = np.zeros(2, dtype=np.int64)
+    heights = np.zeros(cols, dtype=np.int8)
+    for j in range(cols):
+        # Go up the column until the first empty cell is reached
+        for i in range(rows - 1, -1, -1):
+            piece = board[i, j]
+            if piece == NO_PLAYER:
+                break
+            bitboards[piece - 1] |= np.int64(1) << (j * BITBOARD_HEIGHT + rows - 1 - i)
+            heights[j] += 1
+    return bitboards, heights
+
+
+@njit(cache=True)
+def bitboard_to_board(bitboards: np.ndarray, heights: np.ndarray) -> np.ndarray:
+    """
+    Converts a bitboard back into a board given as an array
+    :param bitboards: Array of the two player masks (index player - 1)
+    :param heights: Array of the number of pieces per column
+    :return: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    """
+    board = np.zeros((BOARD_ROWS, BOARD_COLS), dtype=BoardPiece)
+    for j in range(BOARD_COLS):
+        for h in range(heights[j]):
+            bit = np.int64(1) << (j * BITBOARD_HEIGHT + h)
+            board[BOARD_ROWS - 1 - h, j] = PLAYER1 if bitboards[0] & bit else PLAYER2
+    return board
+
+
+@njit(cache=True)
+def apply_player_action_bitboard(
+        bitboards: np.ndarray, heights: np.ndarray, action: PlayerAction, player: BoardPiece) -> None:
+    """
+    Applies the action of the player to the bitboard (in place)
+    :param bitboards: Array of the two player masks (index player - 1)
+    :param heights: Array of the number of pieces per column
+    :param action: Column where player should be dropped
+    :param player: player ID for which action should be applied [1, 2]
+    """
+    if action < 0 or action >= BOARD_COLS or heights[action] >= BOARD_ROWS:
+        raise Exception("Tried to apply an action in a non existent or full column")
+    bitboards[player - 1] |= np.int64(1) << (action * BITBOARD_HEIGHT + heights[action])
+    heights[action] += 1
+
+
+@njit(cache=True)
+def connect_four_bitboard(bitboard: np.int64) -> bool:
+    """
+    Determines if the pieces of one player (given as a bitboard mask) contain CONNECT_N (here 4) adjacent pieces
+    :param bitboard: Mask of the pieces of the player
+    :return: Decision on whether the player won
+    """
+    for shift in BITBOARD_SHIFTS:
+        # Pairs of adjacent pieces in the direction of the shift, then pairs of these pairs
+        pairs = bitboard & (bitboard >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+@njit(cache=True)
+def poss_actions_bitboard(heights: np.ndarray) -> np.ndarray:
+    """
+    Determines the legal actions (not full columns) of a bitboard
+    :param heights: Array of the number of pieces per column
+    :return: Array of free columns
+    """
+    return np.where(heights < BOARD_ROWS)[0]
+
+
+def check_end_state_bitboard(bitboards: np.ndarray, heights: np.ndarray, player: BoardPiece) -> GameState:
+    """
+    Determines the state of the game given as a bitboard
+    :param bitboards: Array of the two player masks (index player - 1)
+    :param heights: Array of the number of pieces per column
+    :param player: Player ID for which GameState should be checked
+    :return: State of Game: Either the player won, the game is drawn or is still going on
+    """
+    if connect_four_bitboard(bitboards[player - 1]):
+        return GameState.IS_WIN
+    elif np.all(heights == BOARD_ROWS):
+        return GameState.IS_DRAW
+    else:
+        return GameState.STILL_PLAYING
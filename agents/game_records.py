@@ -0,0 +1,166 @@
+import os
+import numpy as np
+from typing import Optional, Sequence, Union
+from agents.common import BoardPiece, PLAYER1, PLAYER2, BOARD_ROWS, BOARD_COLS
+
+# A game record consists of the number of moves, the result (player ID of the winner, NO_PLAYER for a draw or an
+# unfinished game) and the moves packed into 4 bits each (the first move of a pair in the low bits). A game of 42
+# moves takes 23 bytes. The records of all games are appended to one file, the offsets of the records are
+# appended to an index file (INDEX_SUFFIX) of little-endian uint64. The records only describe the positions: which
+# agent played which side is not stored (see tournament.run_tournament, whose records are in the order of its
+# results file)
+RECORD_HEADER = 2  # Number of bytes of a record before the moves
+MAX_MOVES = BOARD_ROWS * BOARD_COLS
+INDEX_SUFFIX = ".idx"
+Indices = Union[int, slice, Sequence[int], np.ndarray, None]
+
+
+def pack_moves(moves: Sequence[int], winner: BoardPiece) -> bytes:
+    """
+    :param moves: Actions of the game (the player who moves first is PLAYER1)
+    :param winner: Player ID of the winner, NO_PLAYER for a draw or an unfinished game
+    :return: Record of the game
+    """
+    moves = np.asarray(moves, dtype=np.uint8)
+    if moves.size > MAX_MOVES or np.any(moves >= BOARD_COLS):
+        raise ValueError("A game has at most 42 moves in the columns 0 to 6")
+    if moves.size and np.bincount(moves, minlength=BOARD_COLS).max() > BOARD_ROWS:
+        raise ValueError("A column takes at most 6 moves")
+    padded = np.zeros(2 * ((moves.size + 1) // 2), dtype=np.uint8)
+    padded[:moves.size] = moves
+    return bytes([moves.size, winner]) + (padded[0::2] | (padded[1::2] << 4)).tobytes()
+
+
+def index_array(indices: Indices, n: int) -> np.ndarray:
+    """
+    :param indices: Index, slice or indices of games (all games if None)
+    :param n: Number of games
+    :return: Array of the indices
+    """
+    if indices is None:
+        return np.arange(n)
+    if isinstance(indices, slice):
+        return np.arange(n)[indices]
+    return np.atleast_1d(np.asarray(indices, dtype=np.int64))
+
+
+class GameRecordWriter:
+    """
+    Appends game records to a records file and its index (creates them if they do not exist). A record is
+    referenced by the index only after it was written completely, so the file stays readable if the writer is
+    interrupted
+    """
+    def __init__(self, records_file: str, append: bool = True):
+        """
+        :param records_file: File of the records
+        :param append: False if the records of the file should be replaced
+        """
+        self.records_file = records_file
+        # Drop a partly written last entry of the index (of an interrupted writer)
+        index_file = records_file + INDEX_SUFFIX
+        if append and os.path.exists(index_file) and os.path.getsize(index_file) % 8:
+            os.truncate(index_file, os.path.getsize(index_file) // 8 * 8)
+        self.data = open(records_file, "ab" if append else "wb")
+        self.index = open(records_file + INDEX_SUFFIX, "ab" if append else "wb")
+        self.offset = self.data.seek(0, os.SEEK_END)
+
+    def write(self, moves: Sequence[int], winner: BoardPiece):
+        """
+        :param moves: Actions of the game (the player who moves first is PLAYER1)
+        :param winner: Player ID of the winner, NO_PLAYER for a draw or an unfinished game
+        """
+        record = pack_moves(moves, winner)
+        self.data.write(record)
+        self.data.flush()
+        self.index.write(np.uint64(self.offset).astype("<u8").tobytes())
+        self.index.flush()
+        self.offset += len(record)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+    def __enter__(self) -> "GameRecordWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GameRecords:
+    """
+    Read-only game records: the records file and its index are memory-mapped (only the pages of the games that are
+    read are loaded from disk). Any position of any game can be rebuilt on demand, many at once with replay
+    """
+    def __init__(self, records_file: str):
+        """
+        :param records_file: File written by GameRecordWriter
+        """
+        index_file = records_file + INDEX_SUFFIX
+        if os.path.getsize(records_file) == 0 or os.path.getsize(index_file) < 8:
+            self.data = np.zeros(0, dtype=np.uint8)
+            self.offsets = np.zeros(0, dtype="<u8")
+        else:
+            self.data = np.memmap(records_file, dtype=np.uint8, mode="r")
+            # A partly written last entry of the index (of an interrupted writer) is ignored
+            self.offsets = np.memmap(index_file, dtype="<u8", mode="r", shape=(os.path.getsize(index_file) // 8,))
+        self.lengths = self.data[self.offsets]  # Number of moves of every game
+        self.results = self.data[self.offsets + 1].view(BoardPiece)  # Winner of every game
+
+    def __len__(self) -> int:
+        return self.offsets.shape[0]
+
+    def moves(self, index: int) -> np.ndarray:
+        """
+        :param index: Index of the game
+        :return: Actions of the game
+        """
+        return self.move_matrix([index])[0, :self.lengths[index]]
+
+    def move_matrix(self, indices: Indices = None) -> np.ndarray:
+        """
+        :param indices: Indices of the games (all games if not given)
+        :return: N x 42 array of the actions of the games (-1 after the last move of a game)
+        """
+        offsets = self.offsets[index_array(indices, len(self))].astype(np.int64)
+        lengths = self.data[offsets]
+        # Gather the packed bytes of all games at once (bytes after the end of the file are masked)
+        cells = offsets[:, None] + RECORD_HEADER + np.arange(MAX_MOVES // 2)
+        packed = self.data[np.minimum(cells, self.data.shape[0] - 1)] if self.data.shape[0] else \
+            np.zeros(cells.shape, dtype=np.uint8)
+        moves = np.empty((offsets.shape[0], MAX_MOVES), dtype=np.int8)
+        moves[:, 0::2] = packed & 0x0F
+        moves[:, 1::2] = packed >> 4
+        moves[np.arange(MAX_MOVES) >= lengths[:, None]] = -1
+        return moves
+
+    def replay(self, indices: Indices = None, plies: Union[int, np.ndarray, None] = None) -> np.ndarray:
+        """
+        Rebuilds positions of many games at once: the moves of all games are applied ply by ply
+        :param indices: Indices of the games (all games if not given)
+        :param plies: Number of moves after which the position is taken, per game or for all games (games with
+        fewer moves end at their last move). The final positions if not given
+        :return: N x 6 x 7 array of the boards
+        """
+        moves = self.move_matrix(indices)
+        lengths = np.count_nonzero(moves >= 0, axis=1)
+        plies = lengths if plies is None else np.minimum(np.broadcast_to(plies, lengths.shape), lengths)
+        boards = np.zeros((moves.shape[0], BOARD_ROWS, BOARD_COLS), dtype=BoardPiece)
+        heights = np.zeros((moves.shape[0], BOARD_COLS), dtype=np.int64)
+        for ply in range(int(plies.max()) if plies.size else 0):
+            active = np.flatnonzero(plies > ply)
+            actions = moves[active, ply]
+            # Pieces fill a column from the last row upwards
+            rows = BOARD_ROWS - 1 - heights[active, actions]
+            boards[active, rows, actions] = PLAYER1 if ply % 2 == 0 else PLAYER2
+            heights[active, actions] += 1
+        return boards
+
+    def position(self, index: int, ply: Optional[int] = None) -> np.ndarray:
+        """
+        :param index: Index of the game
+        :param ply: Number of moves after which the position is taken (the final position if not given)
+        :return: Board of the position
+        """
+        return self.replay([index], ply)[0]
+
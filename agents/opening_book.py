@@ -0,0 +1,122 @@
+import os
+import numpy as np
+from typing import Optional, Dict, Tuple, Union
+from agents.common import PlayerAction, PLAYER1, PLAYER2, initialize_game_state, apply_player_action, connect_four,\
+    canonical_hash, mirror_action
+
+# Record of the book file: key of a position (see canonical_hash, a position and its mirror image share one record)
+# and the best action in the canonical position (9 bytes per position)
+BOOK_DTYPE = np.dtype([("hash", "<u8"), ("action", "u1")])
+# Book consulted by the agents if no other file is given (created with python -m agents.opening_book)
+DEFAULT_BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+
+
+class OpeningBook:
+    """
+    Read-only opening book: a file of BOOK_DTYPE records sorted by hash, which is memory-mapped (only the pages
+    touched by the binary search are read from disk) and searched with binary search
+    """
+    def __init__(self, book_file: str):
+        """
+        :param book_file: File written by build_opening_book
+        """
+        if os.path.getsize(book_file) == 0:
+            self.records = np.zeros(0, dtype=BOOK_DTYPE)
+        else:
+            self.records = np.memmap(book_file, dtype=BOOK_DTYPE, mode="r")
+        self.hashes = self.records["hash"]
+
+    def __len__(self) -> int:
+        return self.records.shape[0]
+
+    def lookup(self, board: np.ndarray) -> Optional[PlayerAction]:
+        """
+        :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+        :return: Best action in the position if it is in the book, else None
+        """
+        key, mirrored = canonical_hash(board)
+        key = np.uint64(key)
+        index = np.searchsorted(self.hashes, key)
+        if index < len(self) and self.hashes[index] == key:
+            action = PlayerAction(self.records["action"][index])
+            return mirror_action(action) if mirrored else action
+        return None
+
+
+# Opened books by file name, so that every process maps a file only once
+books = {}
+
+
+def load_opening_book(book_file: Optional[str] = DEFAULT_BOOK_FILE) -> Optional[OpeningBook]:
+    """
+    :param book_file: File of the opening book (None: no book)
+    :return: Opening book of the file (opened on the first call), None if the file does not exist
+    """
+    if book_file is None:
+        return None
+    if book_file not in books:
+        # A missing file is not cached, so that a book that is built later is found
+        if not os.path.exists(book_file):
+            return None
+        books[book_file] = OpeningBook(book_file)
+    return books[book_file]
+
+
+def book_move(board: np.ndarray, book_file: Optional[str] = DEFAULT_BOOK_FILE) -> Optional[PlayerAction]:
+    """
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param book_file: File of the opening book (None: no book)
+    :return: Action of the opening book for the board, None if there is no book or the position is not in it
+    """
+    book = load_opening_book(book_file)
+    return None if book is None else book.lookup(board)
+
+
+def build_opening_book(book_file: str = DEFAULT_BOOK_FILE, depth: int = 4,
+                       search_depth: Union[int, float] = 6) -> int:
+    """
+    Builds an opening book offline: every position that can occur in the first depth moves of a game (and is not
+    won yet) is searched with the minimax agent and its best action is written to the book (mirror images share
+    one record)
+    :param book_file: File to which the book is written
+    :param depth: Number of moves (plies) of the positions of the book
+    :param search_depth: Depth of the minimax search of each position (a float is the time in sec per position)
+    :return: Number of positions in the book
+    """
+    from agents.agent_minimax import minimax_move
+
+    # Collect the positions ply by ply. Positions that are reached by different move orders and mirror images of
+    # positions are only kept once
+    positions: Dict[int, Tuple[np.ndarray, bool]] = {canonical_hash(initialize_game_state())[0]:
+                                                     (initialize_game_state(), False)}
+    layer = [board for board, _ in positions.values()]
+    for ply in range(depth):
+        player = PLAYER1 if ply % 2 == 0 else PLAYER2
+        next_layer = []
+        for board in layer:
+            for action in np.flatnonzero(board[0] == 0):
+                child = board.copy()
+                apply_player_action(child, PlayerAction(action), player)
+                key, mirrored = canonical_hash(child)
+                if key not in positions and not connect_four(child, player, PlayerAction(action)):
+                    positions[key] = (child, mirrored)
+                    next_layer.append(child)
+        layer = next_layer
+
+    # One saved state per player, so that the transposition table is shared by the searches of the same player
+    saved_states = {PLAYER1: None, PLAYER2: None}
+    records = np.zeros(len(positions), dtype=BOOK_DTYPE)
+    for i, (key, (board, mirrored)) in enumerate(positions.items()):
+        player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+        action, saved_states[player] = minimax_move(board.copy(), player, saved_states[player], search_depth,
+                                                    book_file=None)
+        records[i] = (key, mirror_action(action) if mirrored else action)
+    records.sort(order="hash")
+    records.tofile(book_file)
+    # Reopen the book if it was loaded before
+    books.pop(book_file, None)
+    return records.shape[0]
+
+
+if __name__ == "__main__":
+    print(f"{build_opening_book()} positions written to {DEFAULT_BOOK_FILE}")
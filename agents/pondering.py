@@ -0,0 +1,64 @@
+import threading
+import time
+import numpy as np
+from typing import Callable, Optional, Tuple
+from agents.common import BoardPiece, SavedState
+
+# Pondering function of an agent: (board after the last move of the agent, player ID of the agent, saved state of
+# the agent after the move, event that is set when pondering has to stop) -> work done (e.g. iterations or nodes).
+# It searches on the opponent's time and stores the results in the saved state (search tree or transposition
+# table), so that the search of the next move of the agent can use them
+PonderFunc = Callable[[np.ndarray, BoardPiece, Optional[SavedState], threading.Event], int]
+
+
+class Ponderer:
+    """
+    Runs the pondering function of an agent in a background thread while the opponent is thinking (or the user is
+    typing). The thread works on the saved state of the agent, so stop has to be called before the agent makes its
+    next move
+    """
+    def __init__(self, ponder: PonderFunc):
+        """
+        :param ponder: Pondering function of the agent
+        """
+        self.ponder = ponder
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.start_time = 0.
+        self.end_time = None  # Time at which the pondering function returned (None while it is running)
+        self.work = 0
+
+    def start(self, board: np.ndarray, player: BoardPiece, saved_state: Optional[SavedState]):
+        """
+        Starts pondering on the board after the last move of the agent
+        :param board: State of board after the last move of the agent (not modified by the caller while pondering)
+        :param player: Player ID of the agent
+        :param saved_state: State of the agent after its last move
+        """
+        self.stop()
+        self.stop_event = threading.Event()
+        self.start_time = time.time()
+        self.end_time = None
+        self.work = 0
+
+        def run():
+            try:
+                self.work = self.ponder(board, player, saved_state, self.stop_event)
+            finally:
+                self.end_time = time.time()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> Tuple[float, int]:
+        """
+        Stops pondering and waits until the saved state of the agent is not used by the thread anymore
+        :return: Time in sec the agent pondered and the work done by the pondering function (0 if it did not
+        ponder)
+        """
+        if self.thread is None:
+            return 0., 0
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+        return self.end_time - self.start_time, self.work
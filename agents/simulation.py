@@ -0,0 +1,102 @@
+import numpy as np
+from numba import njit
+from typing import Optional
+from agents.common import BoardPiece, NO_PLAYER, PLAYER1, PLAYER2, BOARD_ROWS, BOARD_COLS, BITBOARD_HEIGHT,\
+    WINDOW_INDICES, connect_four_bitboard
+
+
+def make_rng(seed: Optional[int] = None) -> np.ndarray:
+    """
+    Creates the state of the random number generator used by the compiled simulation kernels
+    :param seed: Seed of the random number generator (a random seed is drawn if not given)
+    :return: Array holding the (non-zero) 64-bit state of the generator, modified in place by the kernels
+    """
+    state = np.random.SeedSequence(seed).generate_state(1, dtype=np.uint64)
+    state[0] |= np.uint64(1)  # The state of xorshift must never be zero
+    return state
+
+
+@njit(cache=True)
+def random_uint(rng: np.ndarray, n: int) -> int:
+    """
+    Draws a random integer in [0, n) with a xorshift64* generator
+    :param rng: State of the generator (see make_rng)
+    :param n: Upper bound (exclusive)
+    :return: Random integer
+    """
+    x = rng[0]
+    x ^= x >> np.uint64(12)
+    x ^= x << np.uint64(25)
+    x ^= x >> np.uint64(27)
+    rng[0] = x
+    return int(((x * np.uint64(2685821657736338717)) >> np.uint64(33)) % np.uint64(n))
+
+
+@njit(cache=True)
+def random_playout(bitboards: np.ndarray, heights: np.ndarray, player: BoardPiece, rng: np.ndarray) -> BoardPiece:
+    """
+    Plays random moves of both players until one player won or the board is full
+    :param bitboards: Player masks of the bitboard of the start position (not modified)
+    :param heights: Heights of the bitboard of the start position (not modified)
+    :param player: Player who makes the first move
+    :param rng: State of the random number generator (see make_rng)
+    :return: Player ID of the winner, NO_PLAYER if the game ended in a draw
+    """
+    masks = bitboards.copy()
+    col_heights = heights.copy()
+    n_free = 0
+    for j in range(BOARD_COLS):
+        if col_heights[j] < BOARD_ROWS:
+            n_free += 1
+    while n_free > 0:
+        # Choose the k-th free column
+        k = random_uint(rng, n_free)
+        action = 0
+        for j in range(BOARD_COLS):
+            if col_heights[j] < BOARD_ROWS:
+                if k == 0:
+                    action = j
+                    break
+                k -= 1
+        masks[player - 1] |= np.int64(1) << (action * BITBOARD_HEIGHT + col_heights[action])
+        col_heights[action] += 1
+        if col_heights[action] == BOARD_ROWS:
+            n_free -= 1
+        if connect_four_bitboard(masks[player - 1]):
+            return player
+        player = PLAYER1 if player == PLAYER2 else PLAYER2
+    return NO_PLAYER
+
+
+def batch_random_playouts(boards: np.ndarray, players: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Plays random games on many boards at once: all boards of the batch are stepped ply by ply with vectorized
+    move sampling, piece drops and win checks. Games that ended are removed from the batch
+    :param boards: N x 6 x 7 array of start positions (not modified, must not contain a win already)
+    :param players: Array of the N player IDs of the players who make the first move
+    :param rng: Random number generator
+    :return: Array of the N player IDs of the winners, NO_PLAYER for games that ended in a draw
+    """
+    boards = boards.reshape(-1, BOARD_ROWS * BOARD_COLS).copy()
+    players = np.broadcast_to(np.asarray(players, dtype=BoardPiece), (boards.shape[0],)).copy()
+    winners = np.full(boards.shape[0], NO_PLAYER, dtype=BoardPiece)
+    # Indices of the games that are still going on (games on a full board are a draw)
+    active = np.flatnonzero((boards[:, :BOARD_COLS] == NO_PLAYER).any(axis=1))
+    while active.size:
+        board = boards[active]
+        player = players[active]
+        # Choose a random free column per game: the free column with the largest random key
+        free = board[:, :BOARD_COLS] == NO_PLAYER
+        actions = np.argmax(rng.random(free.shape) * free, axis=1)
+        # Drop the pieces into the lowest empty cell of the chosen columns
+        column_cells = actions[:, None] + BOARD_COLS * np.arange(BOARD_ROWS)
+        rows = np.count_nonzero(np.take_along_axis(board, column_cells, axis=1) == NO_PLAYER, axis=1) - 1
+        board[np.arange(active.size), rows * BOARD_COLS + actions] = player
+        boards[active] = board
+        # Check all windows for a win of the player who just moved
+        won = np.all(board[:, WINDOW_INDICES] == player[:, None, None], axis=2).any(axis=1)
+        winners[active[won]] = player[won]
+        full = ~(board[:, :BOARD_COLS] == NO_PLAYER).any(axis=1)
+        players[active] = np.where(player == PLAYER1, PLAYER2, PLAYER1)
+        active = active[~(won | full)]
+    return winners
@@ -0,0 +1,345 @@
+import numpy as np
+import time
+from numba import njit
+from typing import Optional, Tuple, Dict
+from agents.common import PlayerAction, BoardPiece, PLAYER1, PLAYER2, BOARD_ROWS, BOARD_COLS, BITBOARD_HEIGHT,\
+    board_to_bitboard, initialize_game_state, apply_player_action, connect_four
+
+# The solver works on the bitboard of common.py, but with the pieces of the player to move (current) and of both
+# players (mask) instead of the two player masks. A move is a single bit, playing it gives current ^ mask (the
+# pieces of the opponent, who is to move next) and mask | move.
+N_CELLS = BOARD_ROWS * BOARD_COLS
+BOTTOM_MASK = sum(1 << (col * BITBOARD_HEIGHT) for col in range(BOARD_COLS))  # Bottom cell of every column
+BOARD_MASK = BOTTOM_MASK * ((1 << BOARD_ROWS) - 1)  # All cells of the board
+CENTER_ORDER = (3, 2, 4, 1, 5, 0, 6)  # Columns ordered by distance to the center (searched first)
+# Shifts of the horizontal and the two diagonal directions (vertical lines are handled separately)
+BITBOARD_SHIFTS_LINES = (BITBOARD_HEIGHT, BITBOARD_HEIGHT + 1, BITBOARD_HEIGHT - 1)
+SOLVER_TT_SIZE = 1048583  # Default number of entries of the transposition table (a prime, about 10 MB)
+SOLVER_EMPTY_CELLS = 14  # Positions with at most this many empty cells are always solved by the agents
+SOLVER_NODES = 20000  # Node budget of the agents for trying to solve positions with more empty cells
+# Type of the value stored in the transposition table (0 marks an empty entry)
+EXACT, LOWER_BOUND, UPPER_BOUND = 1, 2, 3
+# Indices of the array of node counters: searched nodes and the node budget of the search
+NODES, BUDGET = 0, 1
+
+
+@njit(cache=True)
+def column_mask(col: int) -> np.int64:
+    """
+    :param col: Column of the board
+    :return: Bitmask of all cells of the column
+    """
+    return np.int64((1 << BOARD_ROWS) - 1) << (col * BITBOARD_HEIGHT)
+
+
+@njit(cache=True)
+def popcount(bitboard: np.int64) -> int:
+    """
+    :param bitboard: Bitmask
+    :return: Number of set bits
+    """
+    n = 0
+    while bitboard:
+        bitboard &= bitboard - 1
+        n += 1
+    return n
+
+
+@njit(cache=True)
+def winning_cells(position: np.int64, mask: np.int64) -> np.int64:
+    """
+    Determines all empty cells (playable or not) that would complete CONNECT_N (here 4) pieces of a player
+    :param position: Pieces of the player
+    :param mask: Pieces of both players
+    :return: Bitmask of the winning cells of the player
+    """
+    # Vertical: three pieces below the cell
+    r = (position << 1) & (position << 2) & (position << 3)
+    for shift in BITBOARD_SHIFTS_LINES:
+        # Two neighbours on one side of the cell and the third on either side
+        p = (position << shift) & (position << 2 * shift)
+        r |= p & (position << 3 * shift)
+        r |= p & (position >> shift)
+        p = (position >> shift) & (position >> 2 * shift)
+        r |= p & (position << shift)
+        r |= p & (position >> 3 * shift)
+    return r & (BOARD_MASK ^ mask)
+
+
+@njit(cache=True)
+def non_losing_moves(current: np.int64, mask: np.int64) -> np.int64:
+    """
+    :param current: Pieces of the player to move
+    :param mask: Pieces of both players
+    :return: Bitmask of the playable cells after which the opponent cannot win directly (0 if there are none)
+    """
+    possible = (mask + BOTTOM_MASK) & BOARD_MASK
+    opponent_win = winning_cells(current ^ mask, mask)
+    forced = possible & opponent_win
+    if forced:
+        # The opponent has two winning cells that can be played, at most one of them can be blocked
+        if forced & (forced - 1):
+            return np.int64(0)
+        possible = forced
+    # Do not play directly below a winning cell of the opponent
+    return possible & ~(opponent_win >> 1)
+
+
+@njit(cache=True)
+def negamax(current: np.int64, mask: np.int64, moves: int, alpha: int, beta: int, tt_keys: np.ndarray,
+            tt_values: np.ndarray, tt_flags: np.ndarray, counters: np.ndarray) -> int:
+    """
+    Solves a position with negamax and alpha-beta pruning. The player to move must not be able to win directly.
+    The score of a position is 0 for a draw, (N_CELLS + 1 - n) // 2 if the player to move wins with their n-th
+    piece (faster wins are better) and the negative score of the opponent if the player to move loses
+    :param current: Pieces of the player to move
+    :param mask: Pieces of both players
+    :param moves: Number of pieces on the board
+    :param alpha: Lower bound of the search window
+    :param beta: Upper bound of the search window
+    :param tt_keys, tt_values, tt_flags: Arrays of the transposition table
+    :param counters: Number of searched nodes and node budget (the search is aborted once the budget is exceeded,
+    its result is invalid then)
+    :return: Score of the position if it lies in the window, else a bound of the score
+    """
+    counters[NODES] += 1
+    if counters[NODES] > counters[BUDGET]:
+        return 0
+    moves_left = non_losing_moves(current, mask)
+    if moves_left == 0:
+        return -((N_CELLS - moves) // 2)
+    if moves >= N_CELLS - 2:
+        return 0
+    # Bounds of the score: the opponent cannot win with their next piece, the player cannot win with this one
+    alpha = max(alpha, -((N_CELLS - 2 - moves) // 2))
+    beta = min(beta, (N_CELLS - 1 - moves) // 2)
+    if alpha >= beta:
+        return alpha
+
+    key = current + mask
+    index = key % tt_keys.shape[0]
+    if tt_flags[index] != 0 and tt_keys[index] == key:
+        value = tt_values[index]
+        if tt_flags[index] == EXACT:
+            return value
+        if tt_flags[index] == LOWER_BOUND:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value
+
+    # Move ordering: moves that create more winning cells first, center columns first among equal moves
+    ordered = np.zeros(BOARD_COLS, dtype=np.int64)
+    scores = np.zeros(BOARD_COLS, dtype=np.int64)
+    n = 0
+    for col in CENTER_ORDER:
+        move = moves_left & column_mask(col)
+        if move:
+            score = popcount(winning_cells(current | move, mask))
+            i = n
+            while i > 0 and scores[i - 1] < score:
+                ordered[i] = ordered[i - 1]
+                scores[i] = scores[i - 1]
+                i -= 1
+            ordered[i] = move
+            scores[i] = score
+            n += 1
+
+    alpha_orig = alpha
+    for i in range(n):
+        value = -negamax(current ^ mask, mask | ordered[i], moves + 1, -beta, -alpha, tt_keys, tt_values, tt_flags,
+                         counters)
+        if counters[NODES] > counters[BUDGET]:
+            return 0
+        if value >= beta:
+            tt_keys[index] = key
+            tt_values[index] = value
+            tt_flags[index] = LOWER_BOUND
+            return value
+        if value > alpha:
+            alpha = value
+    tt_keys[index] = key
+    tt_values[index] = alpha
+    tt_flags[index] = EXACT if alpha > alpha_orig else UPPER_BOUND
+    return alpha
+
+
+@njit(cache=True)
+def solve_bitboard(current: np.int64, mask: np.int64, moves: int, tt_keys: np.ndarray, tt_values: np.ndarray,
+                   tt_flags: np.ndarray, counters: np.ndarray) -> int:
+    """
+    Solves a position by a sequence of null window searches that narrow down the score (each search only decides
+    whether the score is above a value, which prunes much more than a search with the full window)
+    :param current: Pieces of the player to move
+    :param mask: Pieces of both players
+    :param moves: Number of pieces on the board
+    :param tt_keys, tt_values, tt_flags: Arrays of the transposition table
+    :param counters: Number of searched nodes and node budget
+    :return: Score of the position (see negamax), invalid if the node budget was exceeded
+    """
+    possible = (mask + BOTTOM_MASK) & BOARD_MASK
+    if winning_cells(current, mask) & possible:
+        return (N_CELLS + 1 - moves) // 2
+    lower = -((N_CELLS - moves) // 2)
+    upper = (N_CELLS + 1 - moves) // 2
+    while lower < upper:
+        med = lower + (upper - lower) // 2
+        # Search closer to 0 first (most positions are close to a draw)
+        if med <= 0 and -((-lower) // 2) < med:
+            med = -((-lower) // 2)
+        elif med >= 0 and upper // 2 > med:
+            med = upper // 2
+        value = negamax(current, mask, moves, med, med + 1, tt_keys, tt_values, tt_flags, counters)
+        if counters[NODES] > counters[BUDGET]:
+            return 0
+        if value <= med:
+            upper = value
+        else:
+            lower = value
+    return lower
+
+
+class Solver:
+    """
+    Perfect play solver of positions (negamax with alpha-beta pruning, a transposition table and move ordering).
+    Entries of the transposition table stay valid for all positions, so it is kept between searches
+    """
+    def __init__(self, tt_size: int = SOLVER_TT_SIZE):
+        """
+        :param tt_size: Number of entries of the transposition table
+        """
+        self.tt_keys = np.zeros(tt_size, dtype=np.int64)
+        self.tt_values = np.zeros(tt_size, dtype=np.int8)
+        self.tt_flags = np.zeros(tt_size, dtype=np.int8)  # 0 marks an empty entry
+        self.nodes = 0  # Number of nodes of the last search
+
+    def solve(self, board: np.ndarray, player: BoardPiece, max_nodes: Optional[int] = None) -> Optional[int]:
+        """
+        :param board: State of board, 6 x 7 with either 0 or player ID [1, 2] (not won by one of the players)
+        :param player: Player ID of the player to move
+        :param max_nodes: Node budget of the search (None: no budget)
+        :return: Score of the position for the player (0: draw, positive: win, the faster the higher, negative:
+        loss), None if the position could not be solved within the node budget
+        """
+        bitboards, heights = board_to_bitboard(board)
+        counters = np.array([0, np.iinfo(np.int64).max if max_nodes is None else max_nodes], dtype=np.int64)
+        score = solve_bitboard(bitboards[player - 1], bitboards[0] | bitboards[1], int(np.sum(heights)),
+                               self.tt_keys, self.tt_values, self.tt_flags, counters)
+        self.nodes = int(counters[NODES])
+        return None if counters[NODES] > counters[BUDGET] else score
+
+    def best_move(self, board: np.ndarray, player: BoardPiece, max_nodes: Optional[int] = None) \
+            -> Optional[Tuple[PlayerAction, int]]:
+        """
+        :param board: State of board, 6 x 7 with either 0 or player ID [1, 2] (not won, not full)
+        :param player: Player ID of the player to move
+        :param max_nodes: Node budget of the searches (None: no budget)
+        :return: Best action and the score of the position for the player (see solve), None if the position could
+        not be solved within the node budget
+        """
+        opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+        best_action, best_score = None, None
+        nodes = 0
+        for action in CENTER_ORDER:
+            if board[0, action] != 0:
+                continue
+            child = board.copy()
+            apply_player_action(child, PlayerAction(action), player)
+            if connect_four(child, player, PlayerAction(action)):
+                self.nodes = nodes
+                return PlayerAction(action), (N_CELLS + 1 - np.count_nonzero(board)) // 2
+            if not child[0].all():
+                score = self.solve(child, opponent, None if max_nodes is None else max_nodes - nodes)
+                nodes += self.nodes
+                if score is None:
+                    self.nodes = nodes
+                    return None
+                score = -score
+            else:
+                score = 0
+            if best_score is None or score > best_score:
+                best_action, best_score = action, score
+        self.nodes = nodes
+        return PlayerAction(best_action), best_score
+
+
+# Solver shared by the agents of this process (the entries of its transposition table are valid for every game)
+solvers = {}
+
+
+def solver_move(board: np.ndarray, player: BoardPiece, empty_cells: int = SOLVER_EMPTY_CELLS,
+                max_nodes: int = SOLVER_NODES) -> Optional[Tuple[PlayerAction, dict]]:
+    """
+    Lets the solver choose the move if the position has at most empty_cells empty cells or if it can be solved
+    within max_nodes nodes
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param player: Player ID of the player to move
+    :param empty_cells: Number of empty cells below which the position is solved without node budget
+    :param max_nodes: Node budget for positions with more empty cells (0: do not try to solve them)
+    :return: Best action and the statistics of the search (score and searched nodes), None if the position was
+    not solved
+    """
+    n_empty = np.count_nonzero(board == 0)
+    if n_empty > empty_cells and max_nodes <= 0:
+        return None
+    if "default" not in solvers:
+        solvers["default"] = Solver()
+    solver = solvers["default"]
+    result = solver.best_move(board, player, None if n_empty <= empty_cells else max_nodes)
+    if result is None:
+        return None
+    action, score = result
+    return action, {"source": "solver", "score": int(score), "nodes": solver.nodes}
+
+
+def random_position(n_empty: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    :param n_empty: Number of empty cells of the position
+    :param rng: Random number generator
+    :return: Position reached by random moves that is not won by one of the players
+    """
+    while True:
+        board = initialize_game_state()
+        player = PLAYER1
+        for _ in range(N_CELLS - n_empty):
+            action = PlayerAction(rng.choice(np.flatnonzero(board[0] == 0)))
+            apply_player_action(board, action, player)
+            if connect_four(board, player, action):
+                break
+            player = PLAYER1 if player == PLAYER2 else PLAYER2
+        else:
+            return board
+
+
+def solve_times(empty_cells: Tuple[int, ...] = (8, 12, 16, 20, 24), n_positions: int = 10, seed: int = 0) \
+        -> Dict[int, Tuple[float, float]]:
+    """
+    Measures how long the solver needs for random positions with a given number of empty cells (each position is
+    solved with an empty transposition table)
+    :param empty_cells: Numbers of empty cells of the positions
+    :param n_positions: Number of positions per number of empty cells
+    :param seed: Seed of the random positions
+    :return: Mean solve time in sec and mean number of nodes by number of empty cells
+    """
+    rng = np.random.default_rng(seed)
+    # Make sure that the compilation of numba functions is not timed
+    Solver(1).solve(random_position(4, rng), PLAYER1)
+    times = {}
+    for n_empty in empty_cells:
+        durations, nodes = [], []
+        for _ in range(n_positions):
+            board = random_position(n_empty, rng)
+            player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+            solver = Solver()
+            t0 = time.time()
+            solver.solve(board, player)
+            durations.append(time.time() - t0)
+            nodes.append(solver.nodes)
+        times[n_empty] = (float(np.mean(durations)), float(np.mean(nodes)))
+    return times
+
+
+if __name__ == "__main__":
+    for n_empty, (duration, nodes) in solve_times().items():
+        print(f"{n_empty} empty cells: {1000 * duration:.2f} ms, {nodes:.0f} nodes")
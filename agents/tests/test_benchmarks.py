@@ -0,0 +1,38 @@
+import numpy as np
+from agents.common import connect_four
+from benchmarks.run import make_corpus, run_micro, run_startup, compare
+
+
+def test_corpus_and_micro_benchmarks():
+    """Test that the corpus is fixed and that every micro benchmark reports a time"""
+
+    corpus = make_corpus(2)
+    assert all(np.array_equal(board, other) for (board, _, _), (other, _, _) in zip(corpus, make_corpus(2)))
+    for board, player, action in corpus:
+        assert not connect_four(board, player, action)
+        assert board[np.argmax(board[:, action] != 0), action] == player
+    results = run_micro(corpus, n_repeats=1)
+    assert all(result["value"] > 0 and result["unit"] == "ns/call" for result in results.values())
+
+
+def test_compare():
+    """Test that compare flags regressions in both directions of the benchmarks"""
+
+    baseline = {"results": {"fast": {"value": 100., "unit": "ns/call", "higher_is_better": False},
+                            "nodes": {"value": 100., "unit": "nodes/s", "higher_is_better": True}}}
+    current = {"results": {"fast": {"value": 130., "unit": "ns/call", "higher_is_better": False},
+                           "nodes": {"value": 130., "unit": "nodes/s", "higher_is_better": True},
+                           "new": {"value": 1., "unit": "nodes/s", "higher_is_better": True}}}
+    rows = {row[0]: row for row in compare(baseline, current, tolerance=0.2)}
+    assert set(rows) == {"fast", "nodes"}
+    assert rows["fast"][-1] and np.isclose(rows["fast"][3], -0.3)
+    assert not rows["nodes"][-1] and np.isclose(rows["nodes"][3], 0.3)
+    assert not compare(baseline, current, tolerance=0.5)[0][-1]
+
+
+def test_startup_benchmarks():
+    """Test that the startup benchmarks time fresh processes"""
+
+    results = run_startup(n_repeats=1, cold=False)
+    assert set(results) == {"startup_import_main", "startup_warm_up_cached"}
+    assert all(result["value"] > 0 and result["unit"] == "ms" for result in results.values())
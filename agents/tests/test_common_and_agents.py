@@ -1,9 +1,22 @@
 import numpy as np
 import pytest
 from agents.common import initialize_game_state, pretty_print_board, apply_player_action, connect_four, \
-     string_to_board, check_end_state, PLAYER1, PLAYER2, PlayerAction, CONNECT_N, GameState
+     string_to_board, check_end_state, PLAYER1, PLAYER2, PlayerAction, CONNECT_N, GameState, BOARD_COLS, \
+     zobrist_hash, zobrist_key, board_to_bitboard, bitboard_to_board, apply_player_action_bitboard, \
+     connect_four_bitboard, check_end_state_bitboard, poss_actions_bitboard, canonical_hash, mirror_board, \
+     mirror_action
 from agents.agent_minimax import minimax_move
+from agents.agent_minimax.minimax_move import eval_board, eval_boards, minimax, WIN_VALUE, TranspositionTable, \
+     MinimaxState, EXACT, LOWER_BOUND
 from agents.agent_MCTS import MCTS_move
+from agents.agent_MCTS.MCTS_move import MCTS, MCTSDagState, ponder_MCTS
+from agents.agent_minimax.minimax_move import ponder_minimax
+from agents.pondering import Ponderer
+from agents.warmup import warm_up
+from agents.agent_MCTS.MCTS_array import MCTS_array
+from agents.agent_MCTS.MCTS_parallel import MCTS_parallel, shutdown_pools
+from agents.simulation import make_rng, random_playout, batch_random_playouts
+from agents.solver import Solver, random_position
 
 move_agents = [minimax_move, MCTS_move]
 
@@ -145,6 +158,427 @@ def test_check_end_state():
         assert check_end_state(draw_board, player) == GameState.IS_DRAW
 
 
+def test_last_action_win_detection():
+    """Test that the win and end state detection through the last action agrees with the full board scan"""
+
+    rng = np.random.default_rng(1)
+    for _ in range(500):
+        board = initialize_game_state()
+        player = PLAYER1
+        end_state = GameState.STILL_PLAYING
+        while end_state == GameState.STILL_PLAYING:
+            action = PlayerAction(rng.choice(np.where(board[0, :] == 0)[0]))
+            apply_player_action(board, action, player)
+            for p in players:
+                assert connect_four(board, p, action) == connect_four(board, p)
+            end_state = check_end_state(board, player, action)
+            assert end_state == check_end_state(board, player)
+            player = PLAYER1 if player == PLAYER2 else PLAYER2
+
+
+def test_bitboard():
+    """Test that the bitboard primitives agree with the primitives on the array board in random games"""
+
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        board = initialize_game_state()
+        bitboards, heights = board_to_bitboard(board)
+        player = PLAYER1
+        end_state = GameState.STILL_PLAYING
+        while end_state == GameState.STILL_PLAYING:
+            # The legal actions of both representations have to be the same
+            free_columns = poss_actions_bitboard(heights)
+            assert np.array_equal(free_columns, np.where(board[0, :] == 0)[0])
+            action = PlayerAction(rng.choice(free_columns))
+            apply_player_action(board, action, player)
+            apply_player_action_bitboard(bitboards, heights, action, player)
+            # Conversion in both directions has to give the same state
+            assert np.array_equal(bitboard_to_board(bitboards, heights), board)
+            assert np.array_equal(board_to_bitboard(board)[0], bitboards)
+            assert np.array_equal(board_to_bitboard(board)[1], heights)
+            for p in players:
+                assert connect_four_bitboard(bitboards[p - 1]) == connect_four(board, p)
+            end_state = check_end_state_bitboard(bitboards, heights, player)
+            assert end_state == check_end_state(board, player)
+            player = PLAYER1 if player == PLAYER2 else PLAYER2
+
+    # Applying an action to a full or non existent column has to fail
+    bitboards, heights = board_to_bitboard(initialize_game_state())
+    for _ in range(6):
+        apply_player_action_bitboard(bitboards, heights, PlayerAction(0), PLAYER1)
+    with pytest.raises(Exception):
+        apply_player_action_bitboard(bitboards, heights, PlayerAction(0), PLAYER1)
+    with pytest.raises(Exception):
+        apply_player_action_bitboard(bitboards, heights, PlayerAction(100), PLAYER1)
+
+
+def eval_board_reference(board, players):
+    """Window by window evaluation of a board for the maximizing player players[0] (reference for eval_board)"""
+
+    def eval_window(window, player, rival):
+        return np.count_nonzero(window == player) ** 2 if np.count_nonzero(window == rival) == 0 else 0
+
+    windows = []
+    rows, cols = board.shape
+    for i in range(rows):
+        for j in range(cols - CONNECT_N + 1):
+            windows.append(board[i, j:j + CONNECT_N])
+    for i in range(rows - CONNECT_N + 1):
+        for j in range(cols):
+            windows.append(board[i:i + CONNECT_N, j])
+    for i in range(rows - CONNECT_N + 1):
+        for j in range(cols - CONNECT_N + 1):
+            block = board[i:i + CONNECT_N, j:j + CONNECT_N]
+            windows += [np.diag(block), np.diag(block[::-1, :])]
+    return sum(eval_window(w, players[0], players[1]) - eval_window(w, players[1], players[0]) for w in windows)
+
+
+def test_eval_board():
+    """Test that the single and batched board evaluation of minimax agree with the window by window evaluation"""
+
+    rng = np.random.default_rng(2)
+    boards = []
+    for _ in range(100):
+        board = initialize_game_state()
+        player = PLAYER1
+        for _ in range(rng.integers(0, 42)):
+            action = PlayerAction(rng.choice(np.where(board[0, :] == 0)[0]))
+            apply_player_action(board, action, player)
+            player = PLAYER1 if player == PLAYER2 else PLAYER2
+        boards.append(board)
+    for ordered_players in (players, players[::-1]):
+        values = eval_boards(np.stack(boards), ordered_players)
+        for board, value in zip(boards, values):
+            assert eval_board(board, ordered_players) == eval_board_reference(board, ordered_players) == value
+
+
+def minimax_reference(board, players, depth, max_player, last_action=None):
+    """Minimax value of a board without any pruning (reference for the alpha-beta search)"""
+
+    last_player = players[1] if max_player else players[0]
+    end_state = check_end_state(board, last_player, last_action)
+    if end_state == GameState.IS_WIN:
+        return -WIN_VALUE - depth if max_player else WIN_VALUE + depth
+    if end_state == GameState.IS_DRAW:
+        return 0
+    if depth == 0:
+        return eval_board(board, players)
+    player = players[0] if max_player else players[1]
+    values = [minimax_reference(apply_player_action(board.copy(), PlayerAction(action), player), players,
+                                depth - 1, not max_player, PlayerAction(action))
+              for action in np.where(board[0, :] == 0)[0]]
+    return max(values) if max_player else min(values)
+
+
+def test_minimax_alpha_beta():
+    """Test that the alpha-beta search finds the same value as minimax without pruning and breaks ties randomly"""
+
+    rng = np.random.default_rng(3)
+    for _ in range(20):
+        board = initialize_game_state()
+        player = PLAYER1
+        for _ in range(rng.integers(0, 20)):
+            action = PlayerAction(rng.choice(np.where(board[0, :] == 0)[0]))
+            apply_player_action(board, action, player)
+            player = PLAYER1 if player == PLAYER2 else PLAYER2
+            if check_end_state(board, PLAYER1) != GameState.STILL_PLAYING or \
+                    check_end_state(board, PLAYER2) != GameState.STILL_PLAYING:
+                break
+        else:
+            ordered_players = [player, PLAYER1 if player == PLAYER2 else PLAYER2]
+            value, action = minimax(board, -np.inf, np.inf, ordered_players, 3, True, root=True)
+            assert value == minimax_reference(board, ordered_players, 3, True)
+            # The value of the chosen action has to be the best value
+            board_action = apply_player_action(board.copy(), action, player)
+            assert value == minimax_reference(board_action, ordered_players, 2, False, action)
+
+    # In a mirror symmetric position, mirrored actions have the same value and both have to be chosen
+    board = initialize_game_state()
+    board[-1, 3] = PLAYER1
+    actions = {minimax(board, -np.inf, np.inf, [PLAYER2, PLAYER1], 2, True, root=True)[1] for _ in range(30)}
+    assert actions == {BOARD_COLS - 1 - action for action in actions}
+
+
+def test_minimax_iterative_deepening():
+    """Test that minimax with a time budget returns in time and takes immediate wins"""
+
+    import time
+    board = initialize_game_state()
+    for action in range(CONNECT_N - 1):
+        apply_player_action(board, PlayerAction(action), PLAYER1)
+        apply_player_action(board, PlayerAction(action), PLAYER2)
+    minimax_move(board, PLAYER1, None, 1)  # Make sure that the compilation of numba functions is not timed
+    for max_time in (0.1, 1.0):
+        t0 = time.time()
+        action = minimax_move(board, PLAYER1, None, max_time)[0]
+        assert time.time() - t0 < max_time + 0.5
+        assert action == PlayerAction(CONNECT_N - 1)
+
+
+def test_zobrist_hash():
+    """Test that the incremental update of the Zobrist hash gives the hash of the new board"""
+
+    rng = np.random.default_rng(4)
+    board = initialize_game_state()
+    board_hash = zobrist_hash(board)
+    hashes = {board_hash}
+    for i in range(30):
+        player = players[i % 2]
+        action = PlayerAction(rng.choice(np.where(board[0, :] == 0)[0]))
+        board_hash ^= zobrist_key(board, action, player)
+        apply_player_action(board, action, player)
+        assert board_hash == zobrist_hash(board)
+        hashes.add(board_hash)
+    assert len(hashes) == 31
+
+
+def test_canonical_hash():
+    """Test that a board and its mirror image share a key and that minimax shares their search results"""
+
+    board = initialize_game_state()
+    for action, player in ((0, PLAYER1), (3, PLAYER2), (1, PLAYER1)):
+        apply_player_action(board, PlayerAction(action), player)
+    key, mirrored = canonical_hash(board)
+    mirror_key, mirror_mirrored = canonical_hash(mirror_board(board))
+    assert key == mirror_key and mirrored != mirror_mirrored
+    assert key == min(zobrist_hash(board), zobrist_hash(board[:, ::-1]))
+    assert np.array_equal(mirror_board(mirror_board(board)), board)
+    assert [mirror_action(PlayerAction(action)) for action in range(BOARD_COLS)] == list(range(BOARD_COLS))[::-1]
+    # Boards that are their own mirror image are not mirrored
+    assert not canonical_hash(initialize_game_state())[1]
+
+    # The search of the mirror image finds all its positions in the transposition table
+    saved_state = MinimaxState(PLAYER2)
+    minimax_move(board.copy(), PLAYER2, saved_state, 4, book_file=None, solver_nodes=0)
+    tt = saved_state.transposition_table
+    misses = tt.misses
+    minimax_move(mirror_board(board).copy(), PLAYER2, saved_state, 4, book_file=None, solver_nodes=0)
+    assert tt.misses == misses
+
+
+def test_transposition_table():
+    """Test the storage and replacement of transposition table entries and that the table is kept between moves"""
+
+    tt = TranspositionTable(size=16)
+    tt.store(1, 5.0, 3, EXACT, PlayerAction(2))
+    index = tt.lookup(1)
+    assert index is not None and tt.values[index] == 5.0 and tt.actions[index] == 2
+    # An entry that was searched less deep must not replace a deeper one of the same search ...
+    tt.store(17, 7.0, 2, LOWER_BOUND, PlayerAction(4))
+    assert tt.lookup(17) is None and tt.lookup(1) is not None
+    # ... but it replaces entries of previous searches
+    tt.generation += 1
+    tt.store(17, 7.0, 2, LOWER_BOUND, PlayerAction(4))
+    assert tt.lookup(17) is not None and tt.lookup(1) is None
+    assert tt.hits == 3 and tt.misses == 2
+
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    action, saved_state = minimax_move(board, PLAYER2, None, 4, book_file=None)
+    assert isinstance(saved_state, MinimaxState)
+    apply_player_action(board, action, PLAYER2)
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    tt = saved_state.transposition_table
+    hits = tt.hits
+    assert minimax_move(board, PLAYER2, saved_state, 4, book_file=None)[1] is saved_state
+    assert tt.hits > hits
+
+    # Values of won games are stored relative to the board: a table of a deeper search gives the values of a
+    # fresh search (the same number of moves until the win)
+    from agents.agent_minimax.minimax_move import SearchContext, value_to_tt, value_from_tt
+    assert value_from_tt(value_to_tt(WIN_VALUE + 3, 5), 4) == WIN_VALUE + 2
+    assert value_from_tt(value_to_tt(-WIN_VALUE - 1, 2), 0) == -WIN_VALUE
+    assert value_from_tt(value_to_tt(17, 5), 2) == 17
+    rng = np.random.default_rng(0)
+    n_wins = 0
+    for _ in range(60):
+        board = random_position(int(rng.integers(14, 26)), rng)
+        player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+        ordered_players = [player, PLAYER1 if player == PLAYER2 else PLAYER2]
+        context = SearchContext(transposition_table=TranspositionTable(2**16))
+        value, _ = minimax(board.copy(), -np.inf, np.inf, ordered_players, 4, True, context=context, root=True)
+        if abs(value) >= WIN_VALUE:
+            n_wins += 1
+            context = SearchContext(transposition_table=TranspositionTable(2**16))
+            minimax(board.copy(), -np.inf, np.inf, ordered_players, 6, True, context=context, root=True)
+            assert minimax(board.copy(), -np.inf, np.inf, ordered_players, 4, True, context=context,
+                           root=True)[0] == value
+    assert n_wins > 10
+
+
+def test_MCTS_tree_reuse():
+    """Test that MCTS continues the search in the subtree of the last move that belongs to the current board"""
+
+    board = initialize_game_state()
+    # Make sure that the compilation of numba functions is not timed
+    MCTS_move(board.copy(), PLAYER1, None, 0.1, book_file=None)
+    action, saved_state = MCTS_move(board.copy(), PLAYER1, None, 1.0, book_file=None)
+    assert saved_state.inherited_visits == 0
+    assert saved_state.node.parent is None and saved_state.node.action == action
+    apply_player_action(board, action, PLAYER1)
+    # Let the opponent reply with the action that was searched most
+    reply_node = max(saved_state.node.children, key=lambda child: child.visits)
+    apply_player_action(board, reply_node.action, PLAYER2)
+    assert np.array_equal(board, reply_node.board)
+    action, saved_state = MCTS_move(board.copy(), PLAYER1, saved_state, 1.0, book_file=None)
+    assert saved_state.inherited_visits > 0
+    assert np.array_equal(saved_state.node.board, apply_player_action(board.copy(), action, PLAYER1))
+
+
+def test_MCTS_array():
+    """Test that MCTS on an ArrayTree takes immediate wins and blocks immediate losses, also if the tree is full"""
+
+    board = initialize_game_state()
+    for action in range(CONNECT_N - 1):
+        apply_player_action(board, PlayerAction(action), PLAYER1)
+    MCTS_array(board, PLAYER1, 0.1)  # Make sure that the compilation of numba functions is not timed
+    for player in players:
+        for max_nodes in (50, 2**16):
+            action, tree = MCTS_array(board, player, 0.5, max_nodes)
+            assert action == PlayerAction(CONNECT_N - 1)
+            assert tree.n_nodes <= max_nodes
+            # Every iteration visits the root once
+            assert tree.visits[0] == np.sum(tree.visits[tree.first_child[0]:tree.first_child[0] + BOARD_COLS])
+    assert MCTS_move(board, PLAYER1, None, 0.5, engine="array")[0] == PlayerAction(CONNECT_N - 1)
+
+
+def test_MCTS_parallel():
+    """Test that root parallel MCTS merges the statistics of all workers and takes immediate wins"""
+
+    board = initialize_game_state()
+    for action in range(CONNECT_N - 1):
+        apply_player_action(board, PlayerAction(action), PLAYER1)
+    action, (visits, wins) = MCTS_parallel(board, PLAYER1, 0.5, n_workers=2, seed=0)
+    assert action == PlayerAction(CONNECT_N - 1)
+    assert visits.shape == (BOARD_COLS,) and np.all(np.abs(wins) <= visits)
+    # The pool is kept for the next move
+    assert MCTS_move(board, PLAYER1, None, 0.5, n_workers=2)[0] == PlayerAction(CONNECT_N - 1)
+    shutdown_pools()
+
+
+def test_MCTS_dag():
+    """Test that MCTS on a DAG shares the nodes of transpositions, keeps the table below its cap and takes wins"""
+
+    board = initialize_game_state()
+    MCTS(board, PLAYER1, 0.1)  # Make sure that the compilation of numba functions is not timed
+    table = {}
+    _, root_node = MCTS(board, PLAYER1, 1.0, table=table)
+    # Every board has exactly one node
+    assert all(node.hash == board_hash for board_hash, node in table.items())
+    assert len({id(node) for node in table.values()}) == len(table)
+    assert all(zobrist_hash(node.board) == node.hash for node in table.values())
+    # Some nodes are reached by different move orders
+    n_parents = {}
+    for node in table.values():
+        for child in node.children:
+            n_parents[id(child)] = n_parents.get(id(child), 0) + 1
+    assert max(n_parents.values()) > 1
+
+    max_table_nodes = 100
+    table = {}
+    action, root_node = MCTS(board, PLAYER1, 0.5, table=table, max_table_nodes=max_table_nodes)
+    assert len(table) <= max_table_nodes and table[zobrist_hash(board)] is root_node
+    assert 0 <= action < BOARD_COLS
+
+    for action in range(CONNECT_N - 1):
+        apply_player_action(board, PlayerAction(action), PLAYER1)
+    for player in players:
+        assert MCTS_move(board, player, None, 0.5, engine="dag", book_file=None)[0] == PlayerAction(CONNECT_N - 1)
+
+    # The table is kept for the next move and only holds nodes that can be reached from the current board
+    board = initialize_game_state()
+    action, saved_state = MCTS_move(board.copy(), PLAYER1, None, 0.5, engine="dag", book_file=None)
+    assert isinstance(saved_state, MCTSDagState)
+    apply_player_action(board, action, PLAYER1)
+    apply_player_action(board, PlayerAction(3), PLAYER2)
+    n_empty = np.count_nonzero(board == 0)
+    _, saved_state = MCTS_move(board.copy(), PLAYER1, saved_state, 0.5, engine="dag", book_file=None)
+    assert saved_state.stats["iterations"] > 0
+    assert all(np.count_nonzero(node.board == 0) <= n_empty for node in saved_state.table.values())
+
+
+def test_MCTS_tree_budget():
+    """Test that the search tree of MCTS stays within its node budget and keeps the statistics of the pruned
+    nodes"""
+
+    from agents.agent_MCTS.MCTS_move import count_nodes, prune_tree, tree_stats, MCTSState
+
+    board = initialize_game_state()
+    MCTS(board, PLAYER1, 0.1)  # Make sure that the compilation of numba functions is not timed
+    _, root_node = MCTS(board, PLAYER1, 0.5, max_tree_nodes=None)
+    n_nodes = count_nodes(root_node)
+    assert tree_stats(root_node)["tree_size"] == n_nodes and tree_stats(root_node)["tree_bytes"] > 100 * n_nodes
+    visits = [child.visits for child in root_node.children]
+    # Pruning cuts off subtrees of the least visited nodes, the pruned nodes keep their visits
+    assert prune_tree(root_node, n_nodes // 2) == count_nodes(root_node) <= 3 * (n_nodes // 2) // 4
+    assert [child.visits for child in root_node.children] == visits
+    for node in root_node.children:
+        assert node.untried_actions.size + len(node.children) == BOARD_COLS
+        assert all(child.parent is node for child in node.children)
+
+    # The search continues with a full tree, also if it cannot be pruned below the budget (no more expansions)
+    for max_tree_nodes in (100, 1):
+        action, root_node = MCTS(board, PLAYER1, 0.3, max_tree_nodes=max_tree_nodes)
+        assert count_nodes(root_node) <= max(max_tree_nodes, BOARD_COLS + 1)
+        assert root_node.visits > 10 * max_tree_nodes and 0 <= action < BOARD_COLS
+
+    # The budget is kept for the next move
+    action, saved_state = MCTS_move(board.copy(), PLAYER1, None, 0.3, book_file=None, max_tree_nodes=50)
+    assert isinstance(saved_state, MCTSState) and saved_state.max_tree_nodes == 50
+    assert saved_state.stats["tree_size"] <= 50 and saved_state.stats["tree_bytes"] > 0
+
+
+def test_random_playout():
+    """Test that the compiled random playouts are reproducible and end in a valid terminal state"""
+
+    board = initialize_game_state()
+    bitboards, heights = board_to_bitboard(board)
+    winners_1 = [random_playout(bitboards, heights, PLAYER1, make_rng(i)) for i in range(100)]
+    winners_2 = [random_playout(bitboards, heights, PLAYER1, make_rng(i)) for i in range(100)]
+    assert winners_1 == winners_2
+    assert set(winners_1) <= {0, PLAYER1, PLAYER2}
+    # The start position must not be modified
+    assert not bitboards.any() and not heights.any()
+    # Only one empty cell left: the player to move either wins with it or the game ends in a draw
+    draw_board = np.reshape(players * 21, (6, 7))
+    draw_board[:, 1] = draw_board[:, 1][::-1]
+    draw_board[:, 5] = draw_board[:, 5][::-1]
+    draw_board[0, 6] = 0
+    bitboards, heights = board_to_bitboard(draw_board)
+    winner = random_playout(bitboards, heights, draw_board[1, 6], make_rng())
+    assert winner == 0
+    rng = make_rng(0)
+    winners = [random_playout(bitboards, heights, PLAYER1, rng) for _ in range(10)]
+    assert winners == [winners[0]] * 10
+
+
+def test_batch_random_playouts():
+    """Test the batched random playouts on terminal positions and against the compiled single playouts"""
+
+    rng = np.random.default_rng(5)
+    # Only one empty cell left that does not complete a line: the game ends in a draw
+    draw_board = np.reshape(players * 21, (6, 7))
+    draw_board[:, 1] = draw_board[:, 1][::-1]
+    draw_board[:, 5] = draw_board[:, 5][::-1]
+    draw_board[0, 6] = 0
+    boards = np.stack([draw_board, initialize_game_state()])
+    winners = batch_random_playouts(boards, np.array([draw_board[1, 6], PLAYER1]), rng)
+    assert winners[0] == 0 and winners[1] in (0, PLAYER1, PLAYER2)
+    assert boards[0, 0, 6] == 0  # The start positions must not be modified
+    # The proportion of wins of the starting player in random games agrees with the compiled playouts
+    winners = batch_random_playouts(np.zeros((5000, 6, 7), dtype=np.int8), PLAYER1, rng)
+    bitboards, heights = board_to_bitboard(initialize_game_state())
+    rng_kernel = make_rng(5)
+    winners_kernel = [random_playout(bitboards, heights, PLAYER1, rng_kernel) for _ in range(5000)]
+    assert abs(np.mean(winners == PLAYER1) - np.mean(np.array(winners_kernel) == PLAYER1)) < 0.05
+    # Leaf parallel MCTS takes immediate wins
+    board = initialize_game_state()
+    for action in range(CONNECT_N - 1):
+        apply_player_action(board, PlayerAction(action), PLAYER1)
+    MCTS_move(board, PLAYER1, None, 0.1)  # Make sure that the compilation of numba functions is not timed
+    assert MCTS_move(board, PLAYER1, None, 1.0, n_playouts=16)[0] == PlayerAction(CONNECT_N - 1)
+
+
 def test_agents():
     """ Test that the agents minimax and MCTS take immediate wins and block immediate losses"""
 
@@ -175,11 +609,246 @@ def test_agents():
             assert action == PlayerAction(0) or action == PlayerAction(3)
 
 
-# Run the tests when executing the script
-test_pretty_print_board_and_string_to_board()
-test_initialize_game_state()
-test_apply_player_action_success()
-test_apply_player_action_fail()
-test_connect_four()
-test_check_end_state()
-test_agents()
+def solve_reference(board: np.ndarray, player) -> int:
+    """Score of a position (see agents.solver.negamax) by searching all moves without pruning"""
+
+    opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+    best = None
+    for action in np.flatnonzero(board[0] == 0):
+        child = board.copy()
+        apply_player_action(child, PlayerAction(action), player)
+        if connect_four(child, player, PlayerAction(action)):
+            return (43 - np.count_nonzero(board)) // 2
+        score = 0 if child[0].all() else -solve_reference(child, opponent)
+        best = score if best is None else max(best, score)
+    return best
+
+
+def test_solver():
+    """Test that the solver finds the exact score of positions and that the agents use it in the endgame"""
+
+    import time
+    rng = np.random.default_rng(0)
+    solver = Solver()
+    for n_empty in (4, 6, 8):
+        for _ in range(10):
+            board = random_position(n_empty, rng)
+            player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+            assert solver.solve(board, player) == solve_reference(board, player)
+            action, score = solver.best_move(board, player)
+            child = board.copy()
+            apply_player_action(child, action, player)
+            opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+            assert connect_four(child, player, action) or -solver.solve(child, opponent) == score
+
+    # The empty board cannot be solved within a small node budget
+    assert Solver().solve(initialize_game_state(), PLAYER1, max_nodes=1000) is None
+
+    # The agents play an optimal move at once in the endgame, although they were given a lot of time
+    board = random_position(12, rng)
+    player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+    opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+    _, score = solver.best_move(board, player)
+    t0 = time.time()
+    for move_agent, args in zip(move_agents, (20, 60.)):
+        action, _ = move_agent(board.copy(), player, None, args)
+        child = board.copy()
+        apply_player_action(child, action, player)
+        assert connect_four(child, player, action) or -solver.solve(child, opponent) == score
+    assert time.time() - t0 < 5
+
+
+def test_move_stats():
+    """Test that the agents report the statistics of their searches and that play_one_round collects them"""
+
+    import json
+    from functools import partial
+    from main import play_one_round
+
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    _, saved_state = minimax_move(board.copy(), PLAYER2, None, 3, book_file=None, solver_nodes=0)
+    stats = saved_state.stats
+    assert stats["source"] == "search" and stats["depth"] == 3 and stats["nodes"] > 0
+    assert stats["tt_hits"] + stats["tt_misses"] > 0 and stats["cutoffs"] >= 0
+    _, saved_state = minimax_move(board.copy(), PLAYER2, None, 0.2, book_file=None, solver_nodes=0)
+    assert saved_state.stats["depth"] >= 1
+    for engine in ("tree", "array"):
+        # Make sure that the compilation of numba functions is not part of the search
+        MCTS_move(board.copy(), PLAYER2, None, 0.01, engine=engine, book_file=None, solver_nodes=0)
+        _, saved_state = MCTS_move(board.copy(), PLAYER2, None, 0.2, engine=engine, book_file=None, solver_nodes=0)
+        stats = saved_state.stats
+        assert stats["iterations"] > BOARD_COLS and stats["tree_size"] > BOARD_COLS and stats["max_depth"] >= 2
+        assert sum(stats["child_visits"]) == stats["iterations"] == stats["playouts"]
+        assert all(-1 <= value <= 1 for value in stats["child_values"])
+    # With several playouts per iteration, the visits count the playouts
+    _, saved_state = MCTS_move(board.copy(), PLAYER2, None, 0.2, n_playouts=4, book_file=None, solver_nodes=0)
+    stats = saved_state.stats
+    assert stats["playouts"] == 4 * stats["iterations"] == sum(stats["child_visits"])
+
+    streamed = []
+    result, move_stats = play_one_round(partial(minimax_move, solver_nodes=0), partial(MCTS_move, solver_nodes=0),
+                                        args_1=2, args_2=0.05, print_board=False, return_stats=True,
+                                        stats_callback=streamed.append)
+    assert streamed == move_stats
+    assert {stats["round"] for stats in move_stats} == {0, 1}
+    for stats in move_stats:
+        assert stats["source"] in ("book", "search", "solver")
+        assert stats["time"] >= 0
+    json.dumps(move_stats)
+
+
+def test_move_time_budget(monkeypatch):
+    """Test that the time spent in the solver is part of the time budget of a move"""
+
+    import importlib
+    import time
+
+    def slow_solver_move(*args):
+        time.sleep(0.3)
+        return None
+
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    for module, agent, kwargs in (("agents.agent_minimax.minimax_move", minimax_move, {}),
+                                  ("agents.agent_MCTS.MCTS_move", MCTS_move, {"engine": "tree"}),
+                                  ("agents.agent_MCTS.MCTS_move", MCTS_move, {"engine": "array"})):
+        monkeypatch.setattr(importlib.import_module(module), "solver_move", slow_solver_move)
+        # Make sure that the compilation of numba functions is not part of the move
+        agent(board.copy(), PLAYER2, None, 0.01, book_file=None, **kwargs)
+        t0 = time.time()
+        agent(board.copy(), PLAYER2, None, 0.5, book_file=None, **kwargs)
+        assert time.time() - t0 < 0.5 + 0.15
+
+
+def test_pondering():
+    """Test that the agents search on the opponent's time and use the results for their next move"""
+
+    import time
+    from functools import partial
+    from main import play_one_round
+
+    for engine in ("tree", "dag"):
+        board = initialize_game_state()
+        # Make sure that the compilation of numba functions is not part of the search
+        MCTS_move(board.copy(), PLAYER1, None, 0.01, engine=engine, book_file=None)
+        action, saved_state = MCTS_move(board.copy(), PLAYER1, None, 0.1, engine=engine, book_file=None)
+        apply_player_action(board, action, PLAYER1)
+        ponderer = Ponderer(ponder_MCTS)
+        ponderer.start(board.copy(), PLAYER1, saved_state)
+        time.sleep(0.5)
+        ponder_time, iterations = ponderer.stop()
+        assert ponder_time >= 0.5 and iterations > 0
+        apply_player_action(board, PlayerAction(3), PLAYER2)
+        # The node of the reply got visits while pondering, the search of the next move continues from it
+        if engine == "tree":
+            node = [child for child in saved_state.node.children if np.array_equal(child.board, board)][0]
+        else:
+            node = saved_state.table[zobrist_hash(board)]
+        visits = node.visits
+        assert visits > 0
+        _, saved_state = MCTS_move(board.copy(), PLAYER1, saved_state, 0.1, engine=engine, book_file=None)
+        assert node.visits == visits + saved_state.stats["iterations"]
+
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    action, saved_state = minimax_move(board.copy(), PLAYER2, None, 2, book_file=None, solver_nodes=0)
+    apply_player_action(board, action, PLAYER2)
+    ponderer = Ponderer(ponder_minimax)
+    ponderer.start(board.copy(), PLAYER2, saved_state)
+    time.sleep(0.5)
+    assert ponderer.stop()[1] > 0
+    # The boards after all replies of the opponent were searched
+    tt = saved_state.transposition_table
+    for reply in range(BOARD_COLS):
+        index = tt.lookup(canonical_hash(apply_player_action(board.copy(), PlayerAction(reply), PLAYER1))[0])
+        assert index is not None and tt.depths[index] >= 1
+    # Stopping a ponderer that is not running does nothing
+    assert ponderer.stop() == (0., 0)
+
+    _, move_stats = play_one_round(partial(minimax_move, solver_nodes=0), partial(MCTS_move, solver_nodes=0),
+                                   args_1=2, args_2=0.05, print_board=False, return_stats=True,
+                                   ponder_1=ponder_minimax, ponder_2=ponder_MCTS)
+    assert all(stats["ponder_time"] >= 0 and stats["ponder_work"] >= 0 for stats in move_stats)
+    assert any(stats["ponder_work"] > 0 for stats in move_stats)
+
+
+def test_warm_up():
+    """Test that the warm-up compiles the numba functions of the agents"""
+
+    from agents.simulation import random_playout
+    from agents.solver import solve_bitboard
+    from agents.agent_MCTS.MCTS_array import max_tree_depth
+
+    assert warm_up() > 0
+    for func in (connect_four, connect_four_bitboard, board_to_bitboard, random_playout, solve_bitboard,
+                 max_tree_depth):
+        assert func.signatures
+
+
+def test_batch_moves():
+    """Test that the batched move generation of the agents plays legal moves, takes wins, blocks and finds the
+    moves of the minimax search"""
+
+    from agents.agent_random import random_moves
+    from agents.agent_minimax import minimax_moves
+    from agents.agent_MCTS import MCTS_moves
+    from agents.agent_minimax.minimax_move import batch_minimax, SearchContext
+
+    rng = np.random.default_rng(0)
+    boards = np.stack([random_position(n_empty, rng) for n_empty in rng.integers(10, 40, 40)])
+    players = np.array([PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2 for board in boards])
+    for generate_moves, args in ((random_moves, None), (minimax_moves, 2), (minimax_moves, 4), (MCTS_moves, 20)):
+        actions = generate_moves(boards, players, args)
+        assert actions.shape == (boards.shape[0],)
+        assert np.all(boards[np.arange(boards.shape[0]), 0, actions] == 0)
+
+    # The values of the batched search are the ones of minimax
+    for depth in (1, 2, 3):
+        values = batch_minimax(boards, players, depth)
+        for board, player, board_values in zip(boards, players, values):
+            opponent = PLAYER1 if player == PLAYER2 else PLAYER2
+            value, _ = minimax(board.copy(), -np.inf, np.inf, [player, opponent], depth, True,
+                               context=SearchContext(), root=True)
+            assert board_values.max() == value
+
+    # Wins are taken and wins of the opponent are blocked (the players to move differ between the boards)
+    win = initialize_game_state()
+    win[-3:, 0] = PLAYER1
+    win[-3:, 6] = PLAYER2
+    block = win.copy()
+    block[-3, 6] = 0
+    block[-1, 5] = PLAYER2
+    for generate_moves in (minimax_moves, MCTS_moves):
+        assert list(generate_moves(np.stack([win, block]), np.array([PLAYER1, PLAYER2]))) == [0, 0]
+
+
+# Run the tests when executing the script (pytest collects them without running them on import)
+if __name__ == "__main__":
+    test_pretty_print_board_and_string_to_board()
+    test_initialize_game_state()
+    test_apply_player_action_success()
+    test_apply_player_action_fail()
+    test_connect_four()
+    test_check_end_state()
+    test_last_action_win_detection()
+    test_bitboard()
+    test_eval_board()
+    test_minimax_alpha_beta()
+    test_minimax_iterative_deepening()
+    test_zobrist_hash()
+    test_canonical_hash()
+    test_transposition_table()
+    test_MCTS_tree_reuse()
+    test_MCTS_array()
+    test_MCTS_parallel()
+    test_MCTS_dag()
+    test_MCTS_tree_budget()
+    test_random_playout()
+    test_batch_random_playouts()
+    test_solver()
+    test_move_stats()
+    test_pondering()
+    test_warm_up()
+    test_batch_moves()
+    test_agents()
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from agents.common import PLAYER1, PLAYER2, NO_PLAYER, PlayerAction, GameState, initialize_game_state, \
+    apply_player_action, check_end_state
+from agents.game_records import GameRecordWriter, GameRecords, INDEX_SUFFIX, pack_moves
+
+
+def random_game(rng: np.random.Generator) -> tuple:
+    """Plays a random game and returns its moves and the player ID of the winner"""
+    board = initialize_game_state()
+    moves = []
+    end_state = GameState.STILL_PLAYING
+    while end_state == GameState.STILL_PLAYING:
+        player = PLAYER1 if len(moves) % 2 == 0 else PLAYER2
+        action = PlayerAction(rng.choice(np.flatnonzero(board[0] == NO_PLAYER)))
+        apply_player_action(board, action, player)
+        moves.append(int(action))
+        end_state = check_end_state(board, player, action)
+    return moves, player if end_state == GameState.IS_WIN else NO_PLAYER
+
+
+def test_game_records(tmp_path):
+    """Test that written games are read back and that positions are rebuilt correctly, also after an interruption"""
+
+    records_file = str(tmp_path / "games.c4r")
+    rng = np.random.default_rng(0)
+    games = [random_game(rng) for _ in range(50)] + [([], NO_PLAYER)]
+    with GameRecordWriter(records_file) as writer:
+        for moves, winner in games[:30]:
+            writer.write(moves, winner)
+    # An interrupted writer left half an index entry, the next writer continues after the complete entries
+    with open(records_file + INDEX_SUFFIX, "ab") as f:
+        f.write(b"\x01\x02\x03")
+    assert len(GameRecords(records_file)) == 30
+    with GameRecordWriter(records_file) as writer:
+        for moves, winner in games[30:]:
+            writer.write(moves, winner)
+
+    records = GameRecords(records_file)
+    assert len(records) == len(games)
+    assert list(records.results) == [winner for _, winner in games]
+    assert list(records.lengths) == [len(moves) for moves, _ in games]
+    for index, (moves, _) in enumerate(games):
+        assert list(records.moves(index)) == moves
+    # A record takes 2 bytes plus half a byte per move
+    assert len(np.fromfile(records_file, dtype=np.uint8)) == sum(2 + (len(moves) + 1) // 2 for moves, _ in games)
+
+    # Replay all final positions and positions in the middle of the games at once
+    plies = rng.integers(0, 43, len(games))
+    for boards, ply_list in ((records.replay(), [None] * len(games)), (records.replay(plies=plies), plies)):
+        assert boards.shape == (len(games), 6, 7)
+        for board, (moves, _), ply in zip(boards, games, ply_list):
+            expected = initialize_game_state()
+            for i, action in enumerate(moves[:ply]):
+                apply_player_action(expected, PlayerAction(action), PLAYER1 if i % 2 == 0 else PLAYER2)
+            assert np.array_equal(board, expected)
+    assert np.array_equal(records.position(3, 2), records.replay([3], 2)[0])
+    assert np.count_nonzero(records.position(3, 2)) == 2
+    assert records.replay(slice(10, 20)).shape[0] == 10
+
+
+def test_empty_game_records(tmp_path):
+    """Test that a records file without games can be read"""
+
+    records_file = str(tmp_path / "games.c4r")
+    GameRecordWriter(records_file).close()
+    records = GameRecords(records_file)
+    assert len(records) == 0 and records.replay().shape == (0, 6, 7)
+
+
+def test_pack_moves_illegal():
+    """Test that games which cannot be played on the board are rejected"""
+
+    assert len(pack_moves([3] * 6, NO_PLAYER)) == 5
+    for moves in ([3] * 7, [7], [0, 1] * 22):
+        with pytest.raises(ValueError):
+            pack_moves(moves, NO_PLAYER)
@@ -0,0 +1,46 @@
+import time
+import numpy as np
+from agents.common import PLAYER1, PLAYER2, PlayerAction, initialize_game_state, apply_player_action
+from agents.agent_minimax import minimax_move
+from agents.agent_MCTS import MCTS_move
+from agents.agent_minimax.minimax_move import MinimaxState
+from agents.opening_book import build_opening_book, load_opening_book, BOOK_DTYPE
+
+
+def test_opening_book(tmp_path):
+    """Test that the book holds all positions up to its depth and that the agents answer book positions at once"""
+
+    book_file = str(tmp_path / "book.bin")
+    # 1 empty board, 7 positions after one move and 49 after two moves, of which 1, 4 and 25 are left if mirror
+    # images are only stored once
+    assert build_opening_book(book_file, depth=2, search_depth=2) == 30
+    book = load_opening_book(book_file)
+    assert len(book) == 30
+    hashes = np.fromfile(book_file, dtype=BOOK_DTYPE)["hash"]
+    assert np.all(hashes[:-1] < hashes[1:])
+    assert book.lookup(initialize_game_state()) == 3
+
+    board = initialize_game_state()
+    apply_player_action(board, PlayerAction(0), PLAYER1)
+    apply_player_action(board, PlayerAction(6), PLAYER2)
+    action = book.lookup(board)
+    assert 0 <= action < 7
+    # The mirror image of the position gets the mirrored action
+    assert book.lookup(board[:, ::-1]) == 6 - action
+    # The book is only consulted by the agents if its file is given
+    t0 = time.time()
+    assert minimax_move(board.copy(), PLAYER1, None, 8, book_file=book_file)[0] == action
+    assert MCTS_move(board.copy(), PLAYER1, None, 60, book_file=book_file)[0] == action
+    assert time.time() - t0 < 1
+
+    # Positions deeper than the book are not in it
+    apply_player_action(board, PlayerAction(3), PLAYER1)
+    assert book.lookup(board) is None
+    assert load_opening_book(str(tmp_path / "missing.bin")) is None
+    # A book that is built after a lookup of its missing file is found
+    assert build_opening_book(str(tmp_path / "missing.bin"), depth=1, search_depth=1) == 5
+    assert len(load_opening_book(str(tmp_path / "missing.bin"))) == 5
+
+    # No transposition table is allocated for a move of the book
+    _, saved_state = minimax_move(initialize_game_state(), PLAYER1, None, 4, book_file=book_file)
+    assert not isinstance(saved_state, MinimaxState) and saved_state.stats == {"source": "book"}
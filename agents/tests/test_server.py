@@ -0,0 +1,99 @@
+import asyncio
+from agents.common import BOARD_COLS
+from server import GameServer, HTTPClient, run_load
+
+
+def test_server_and_load_generator():
+    """Test that the server plays concurrent games in its workers, rejects invalid requests and reports metrics"""
+
+    async def run():
+        server = GameServer(n_workers=2)
+        await server.start("127.0.0.1", 0, warm_up=False)
+        try:
+            report = await run_load("127.0.0.1", server.port, n_games=6, concurrency=3, agent="random",
+                                    max_time=0.1)
+            client = HTTPClient("127.0.0.1", server.port)
+            status, game = await client.request("POST", "/games", {"agent": "random", "first": "agent"})
+            errors = [(await client.request("POST", "/games", {"agent": "unknown"}))[0],
+                      (await client.request("POST", "/games", {"time": 1000}))[0],
+                      (await client.request("GET", "/games/unknown"))[0],
+                      (await client.request("POST", f"/games/{game['id']}/moves", {"action": BOARD_COLS}))[0]]
+            status_move, moved = await client.request("POST", f"/games/{game['id']}/moves", {"action": 0})
+            _, metrics = await client.request("GET", "/metrics")
+            await client.close()
+        finally:
+            await server.close()
+        return report, status, game, errors, status_move, moved, metrics
+
+    report, status, game, errors, status_move, moved, metrics = asyncio.run(run())
+    assert report["games"] == 6 and report["errors"] == 0
+    assert report["moves"] > 0 and report["moves_per_sec"] > 0
+    assert report["latency_ms"]["p50"] <= report["latency_ms"]["p99"]
+    # All games of the load generator were deleted and all moves were answered
+    assert report["server"]["sessions"] == 0 and report["server"]["queue_depth"] == 0
+    assert report["server"]["agent_moves"] > 0 and report["server"]["latency_ms"]["p90"] is not None
+    assert report["server"]["max_queue_depth"] >= 1
+
+    # The agent made the first move of the game
+    assert status == 201 and len(game["moves"]) == 1 and game["to_move"] != game["agent_player"]
+    assert errors == [400, 400, 404, 400]
+    assert status_move == 200 and len(moved["moves"]) == 3 and moved["moves"][1] == 0
+    assert metrics["sessions"] == 1 and metrics["errors"] == 4
+
+
+def test_worker_states(monkeypatch):
+    """Test that a worker keeps a bounded number of saved states of agents, the least recently used are dropped"""
+
+    import server
+    import numpy as np
+    from agents.common import PLAYER1, PLAYER2
+    from agents.agent_minimax.minimax_move import MinimaxState
+    from agents.solver import random_position
+
+    monkeypatch.setattr(server, "MAX_WORKER_STATES", 2)
+    monkeypatch.setattr(server, "worker_states", server.OrderedDict())
+    # A position after the opening book and before the solver
+    board = random_position(30, np.random.default_rng(0))
+    player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+    for game_id in ("a", "b", "a", "c"):
+        server.worker_move(game_id, "minimax", board.copy(), player, 0.05)
+    assert list(server.worker_states) == ["a", "c"]
+    assert len(server.worker_states["a"].transposition_table.keys) == server.SERVER_TT_SIZE
+    assert isinstance(server.worker_states["c"], MinimaxState)
+    assert server.GameServer(n_workers=3).max_sessions == 6
+
+
+def test_delete_during_move():
+    """Test that a game deleted during a move of the agent does not keep the saved state of the agent in its worker"""
+
+    import numpy as np
+    from agents.common import PLAYER1, PLAYER2
+    from agents.solver import random_position
+    from server import GameSession, worker_game_ids
+
+    async def run():
+        server = GameServer(n_workers=1)
+        await server.start("127.0.0.1", 0, warm_up=False)
+        try:
+            loop = asyncio.get_running_loop()
+            session = GameSession("0", "minimax", PLAYER1, 0.5, 0)
+            # A position after the opening book and before the solver, so that the agent searches
+            session.board = random_position(30, np.random.default_rng(0))
+            if np.count_nonzero(session.board) % 2:
+                session.agent_player = PLAYER2
+            server.sessions[session.id] = session
+            move = asyncio.ensure_future(server.run_agent(session, 0.5))
+            await asyncio.sleep(0.2)
+            busy = session.agent_task is not None
+            server.remove_session(session.id)
+            await move
+            # The worker runs its tasks in order, the freeing of the state was submitted after the move
+            game_ids = await loop.run_in_executor(server.workers[0], worker_game_ids)
+        finally:
+            await server.close()
+        return busy, session, game_ids
+
+    busy, session, game_ids = asyncio.run(run())
+    assert busy and session.removed
+    # The move was not applied to the deleted game
+    assert game_ids == [] and np.array_equal(session.board, random_position(30, np.random.default_rng(0)))
@@ -0,0 +1,126 @@
+import functools
+import json
+import numpy as np
+import pytest
+from agents.agent_random import random_move
+from agents.agent_minimax import minimax_move
+from agents.common import PLAYER1, PLAYER2, NO_PLAYER, GameState, PlayerAction, check_end_state
+from agents.game_records import GameRecords
+from tournament import run_tournament, agent_config, load_results, summarize_results, run_sprt, sprt_llr, \
+    elo_estimate, convert_results
+
+agents = {"Random": (random_move, None), "Minimax": (minimax_move, 1)}
+pairings = [("Minimax", "Random")]
+
+
+def test_run_tournament(tmp_path):
+    """Test that all games of a tournament are recorded and that an interrupted tournament is resumed"""
+
+    results_file = str(tmp_path / "results.jsonl")
+    results = run_tournament(agents, pairings, 2, results_file, n_workers=2)
+    assert len(results) == 4
+    assert len({result["id"] for result in results}) == 4
+    for result in results:
+        assert len(result["moves"]) == len(result["move_times"])
+        assert result["winner"] in ("Minimax", "Random", None)
+
+    # Simulate an interruption in the middle of writing the third record
+    with open(results_file) as f:
+        lines = f.readlines()
+    with open(results_file, "w") as f:
+        f.writelines(lines[:2] + [lines[2][:10]])
+    results = run_tournament(agents, pairings, 2, results_file, n_workers=1)
+    assert sorted(result["id"] for result in load_results(results_file)) == sorted(result["id"] for result in results)
+    assert len(load_results(results_file)) == 4
+    # The games are reproducible: the replayed games are the same as the ones of the first run
+    for line in lines[2:]:
+        assert any(result["moves"] == json.loads(line)["moves"] for result in results)
+
+    perc_win = summarize_results(results)[pairings[0]]
+    assert np.isclose(np.sum(perc_win), 1)
+
+    # More rounds and pairings extend the tournament
+    more_pairings = [("Random", "Minimax")] + pairings
+    assert len(run_tournament(agents, more_pairings, 3, results_file)) == 12
+
+    # Results of other settings of the agents or of another seed are not resumed
+    for other_agents, seed in (({"Random": (random_move, None), "Minimax": (minimax_move, 2)}, 0), (agents, 1)):
+        with pytest.raises(ValueError):
+            run_tournament(other_agents, pairings, 2, results_file, seed=seed)
+    assert agent_config((functools.partial(minimax_move, book_file=None), 2)) == \
+        "agents.agent_minimax.minimax_move.generate_move_minimax(book_file=None), args=2"
+
+
+
+def test_sprt():
+    """Test that the SPRT stops early for clearly different agents and the estimates of the Elo difference"""
+
+    # Equal results support neither H1 nor a large Elo difference
+    assert sprt_llr(50, 0, 50, 0, 50) < 0
+    assert sprt_llr(90, 0, 10, 0, 50) > 0
+    elo, elo_lower, elo_upper = elo_estimate(50, 20, 50)
+    assert np.isclose(elo, 0) and elo_lower < 0 < elo_upper
+    # More games make the interval narrower
+    elo_lower_more, elo_upper_more = elo_estimate(500, 200, 500)[1:]
+    assert elo_lower < elo_lower_more < elo_upper_more < elo_upper
+
+    res = run_sprt(agents, "Minimax", "Random", max_rounds=100)
+    assert res["hypothesis"] == "H1"
+    assert res["games"] < 200
+    assert res["wins"] + res["draws"] + res["losses"] == res["games"]
+    assert res["elo_interval"][0] < res["elo"] < res["elo_interval"][1]
+    # Swapping the agents accepts H0
+    assert run_sprt(agents, "Random", "Minimax", max_rounds=100)["hypothesis"] == "H0"
+
+
+def test_sprt_results_file(tmp_path):
+    """Test that the games of the SPRT do not mix with the ones of a tournament in the same results file and that
+    a rerun of the SPRT resumes its games instead of appending them again"""
+
+    results_file = str(tmp_path / "results.jsonl")
+    run_tournament(agents, pairings, 2, results_file)
+    res = run_sprt(agents, "Minimax", "Random", max_rounds=100, results_file=results_file)
+    results = load_results(results_file)
+    assert len(results) == 4 + res["games"]
+    assert len({result["id"] for result in results}) == len(results)
+    assert run_sprt(agents, "Minimax", "Random", max_rounds=100, results_file=results_file) == res
+    assert len(load_results(results_file)) == len(results)
+    # The tournament does not take the games of the SPRT as its own
+    assert len(run_tournament(agents, pairings, 3, results_file)) == 6 + res["games"]
+    # The games of the SPRT have the seeds of the games of the tournament with the same ids and are not counted in
+    # the summary of the tournament
+    seeds = {result["id"]: result["seed"] for result in results}
+    assert seeds["SPRT: Minimax vs. Random #0 (Random first)"] == seeds["Minimax vs. Random #0 (Random first)"]
+    assert summarize_results([result for result in results if result.get("mode") == "sprt"]) == {}
+    # Games recorded twice are counted once
+    assert np.array_equal(summarize_results(results + results)[pairings[0]], summarize_results(results)[pairings[0]])
+
+
+def test_tournament_game_records(tmp_path):
+    """Test that the games of a tournament are written as binary game records and that results files convert"""
+
+    results_file = str(tmp_path / "results.jsonl")
+    records_file = str(tmp_path / "games.c4r")
+    results = run_tournament({"Random 1": (random_move, None), "Random 2": (random_move, None)},
+                             [("Random 1", "Random 2")], 3, results_file, records_file=records_file)
+    records = GameRecords(records_file)
+    assert len(records) == len(results) == 6
+    boards = records.replay()
+    for index, result in enumerate(results):
+        assert list(records.moves(index)) == result["moves"]
+        last_player = PLAYER1 if len(result["moves"]) % 2 == 1 else PLAYER2
+        end_state = check_end_state(boards[index], last_player, PlayerAction(result["moves"][-1]))
+        assert records.results[index] == (last_player if end_state == GameState.IS_WIN else NO_PLAYER)
+        assert (records.results[index] == NO_PLAYER) == (result["winner"] is None)
+
+    converted_file = str(tmp_path / "converted.c4r")
+    assert convert_results(results_file, converted_file) == 6
+    assert np.array_equal(GameRecords(converted_file).move_matrix(), records.move_matrix())
+
+    # A resumed tournament rewrites the records file, so that its records stay in the order of the results file
+    results = run_tournament({"Random 1": (random_move, None), "Random 2": (random_move, None)},
+                             [("Random 1", "Random 2")], 4, results_file, records_file=records_file)
+    records = GameRecords(records_file)
+    assert len(records) == len(load_results(results_file)) == 8
+    assert [list(records.moves(index)) for index in range(len(records))] == \
+        [result["moves"] for result in load_results(results_file)]
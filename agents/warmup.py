@@ -0,0 +1,32 @@
+import time
+import numpy as np
+from agents.common import PLAYER1, PLAYER2, initialize_game_state
+
+
+def warm_up() -> float:
+    """
+    Compiles all numba functions of the agents, so that the compilation does not land in the time budget of the
+    first move: the agents search an opening, a middle game and an endgame position (solved exactly) with tiny
+    budgets, which calls every kernel with the argument types the agents use. The compiled functions are cached on
+    disk (cache=True), so only the first process after a change of the code compiles, later ones load them.
+    Worker pools call it as initializer of their processes (or before the clock of a game starts)
+    :return: Time in sec the warm-up took
+    """
+    # Imported here, as the agents use the warm-up for their own worker pools
+    from agents.agent_minimax import minimax_move
+    from agents.agent_MCTS import MCTS_move
+    from agents.solver import random_position, SOLVER_EMPTY_CELLS
+
+    t0 = time.perf_counter()
+    rng = np.random.default_rng(0)
+    for board in (initialize_game_state(), random_position(30, rng), random_position(SOLVER_EMPTY_CELLS - 2, rng)):
+        player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+        minimax_move(board.copy(), player, None, 2, book_file=None)
+        minimax_move(board.copy(), player, None, 0.01, book_file=None)
+        for engine in ("tree", "array"):
+            MCTS_move(board.copy(), player, None, 0.01, engine=engine, book_file=None)
+    return time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    print(f"Warm-up took {warm_up():.3f}s")
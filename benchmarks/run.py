@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import numba
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+from agents.common import PlayerAction, BoardPiece, PLAYER1, PLAYER2, initialize_game_state, apply_player_action,\
+    connect_four, check_end_state, zobrist_hash, board_to_bitboard, connect_four_bitboard
+from agents.agent_minimax.minimax_move import eval_board, minimax, SearchContext, generate_moves_minimax
+from agents.agent_MCTS.MCTS_move import MCTS
+from agents.agent_MCTS.MCTS_array import MCTS_array
+from agents.simulation import make_rng, random_playout, batch_random_playouts
+from agents.solver import random_position
+
+# Numbers of empty cells of the positions of the corpus (from the opening to the endgame)
+CORPUS_EMPTY_CELLS = (38, 30, 22, 14)
+# Results the compare command checks against if no other baseline is given
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Directory of the repository (the working directory of the processes of the startup benchmarks)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Numbers of boards per call of the benchmarks of the batched move generation
+BATCH_SIZES = (1, 64, 1024)
+# Results: name -> {"value": measured value, "unit": unit of the value, "higher_is_better": bool}
+Results = Dict[str, dict]
+
+
+def make_corpus(n_positions: int = 8, seed: int = 0) -> List[Tuple[np.ndarray, BoardPiece, PlayerAction]]:
+    """
+    Creates a fixed corpus of positions (the same for every run with the same seed)
+    :param n_positions: Number of positions per number of empty cells in CORPUS_EMPTY_CELLS
+    :param seed: Seed of the random moves that lead to the positions
+    :return: List of boards with the player who made the last move and the last move
+    """
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for n_empty in CORPUS_EMPTY_CELLS:
+        n = 0
+        while n < n_positions:
+            # The last move is a random move that does not win the game
+            board = random_position(n_empty + 1, rng)
+            player = PLAYER1 if np.count_nonzero(board) % 2 == 0 else PLAYER2
+            action = PlayerAction(rng.choice(np.flatnonzero(board[0] == 0)))
+            apply_player_action(board, action, player)
+            if not connect_four(board, player, action):
+                corpus.append((board, player, action))
+                n += 1
+    return corpus
+
+
+def time_calls(func: Callable, make_args: Callable[[], List[tuple]], n_repeats: int = 5, n_loops: int = 20) \
+        -> float:
+    """
+    :param func: Function to be timed
+    :param make_args: Function returning the list of arguments of the calls (called before every loop, so that
+    functions that modify their arguments get fresh ones)
+    :param n_repeats: Number of timed repetitions (the fastest repetition is taken)
+    :param n_loops: Number of loops over all calls per repetition
+    :return: Time per call in ns
+    """
+    best = np.inf
+    for _ in range(n_repeats + 1):  # The first repetition compiles numba functions and is not counted
+        args_lists = [make_args() for _ in range(n_loops)]
+        t0 = time.perf_counter()
+        for args_list in args_lists:
+            for args in args_list:
+                func(*args)
+        best = min(best, (time.perf_counter() - t0) / (n_loops * len(args_lists[0])))
+    return best * 1e9
+
+
+def run_micro(corpus: List[Tuple[np.ndarray, BoardPiece, PlayerAction]], n_repeats: int = 5) -> Results:
+    """
+    Times the primitives of the game and the agents on every position of the corpus
+    :param corpus: Positions of make_corpus
+    :param n_repeats: Number of repetitions of all calls
+    :return: Time per call of each primitive
+    """
+    def opponent(player: BoardPiece) -> BoardPiece:
+        return PLAYER1 if player == PLAYER2 else PLAYER2
+
+    bitboards = [board_to_bitboard(board) for board, _, _ in corpus]
+    # Legal action of the player to move (the center most free column)
+    free = [PlayerAction(np.flatnonzero(board[0] == 0)[np.argmin(np.abs(np.flatnonzero(board[0] == 0) - 3))])
+            for board, _, _ in corpus]
+    benchmarks = {
+        "connect_four": (connect_four, lambda: [(board, player) for board, player, _ in corpus]),
+        "connect_four_last_action": (connect_four, lambda: list(corpus)),
+        "check_end_state": (check_end_state, lambda: list(corpus)),
+        "apply_player_action": (apply_player_action, lambda: [(board.copy(), action, opponent(player))
+                                                              for (board, player, _), action in zip(corpus, free)]),
+        "eval_board": (eval_board, lambda: [(board, [player, opponent(player)]) for board, player, _ in corpus]),
+        "zobrist_hash": (zobrist_hash, lambda: [(board,) for board, _, _ in corpus]),
+        "board_to_bitboard": (board_to_bitboard, lambda: [(board,) for board, _, _ in corpus]),
+        "connect_four_bitboard": (connect_four_bitboard, lambda: [(masks[player - 1],) for (masks, _), (_, player, _)
+                                                                  in zip(bitboards, corpus)]),
+        # Every repetition gets a fresh generator, so that it plays the same playouts
+        "random_playout": (random_playout, lambda: [(masks, heights, opponent(player), rng) for rng in [make_rng(0)]
+                                                    for (masks, heights), (_, player, _) in zip(bitboards, corpus)]),
+    }
+    return {name: {"value": time_calls(func, make_args, n_repeats), "unit": "ns/call", "higher_is_better": False}
+            for name, (func, make_args) in benchmarks.items()}
+
+
+def run_macro(corpus: List[Tuple[np.ndarray, BoardPiece, PlayerAction]], depths: Tuple[int, ...] = (4, 6),
+              max_time: float = 1., n_repeats: int = 3, batch_sizes: Tuple[int, ...] = BATCH_SIZES) -> Results:
+    """
+    Measures the search speed of the agents
+    :param corpus: Positions of make_corpus (the minimax searches use the positions that are not close to the end)
+    :param depths: Depths of the minimax searches
+    :param max_time: Time budget of each MCTS search in sec
+    :param n_repeats: Number of repetitions of the minimax searches (the fastest repetition is taken)
+    :param batch_sizes: Numbers of boards per call of the batched minimax move generation
+    :return: Minimax nodes per sec at each depth, MCTS playouts per sec of both tree engines and of the
+    batched playouts and moves per sec of the batched move generation at each batch size
+    """
+    results = {}
+    positions = [(board, PLAYER1 if player == PLAYER2 else PLAYER2) for board, player, _ in corpus
+                 if np.count_nonzero(board == 0) >= 22]
+    # Make sure that the compilation of numba functions is not timed
+    minimax(positions[0][0].copy(), -np.inf, np.inf, [PLAYER1, PLAYER2], 2, True, context=SearchContext(), root=True)
+    MCTS_array(positions[0][0], positions[0][1], 0.01, seed=0)
+    for depth in depths:
+        best = 0
+        for _ in range(n_repeats):
+            nodes = 0
+            t0 = time.perf_counter()
+            for board, player in positions:
+                context = SearchContext()
+                minimax(board.copy(), -np.inf, np.inf, [player, PLAYER1 if player == PLAYER2 else PLAYER2], depth,
+                        True, context=context, root=True)
+                nodes += context.nodes
+            best = max(best, nodes / (time.perf_counter() - t0))
+        results[f"minimax_depth_{depth}"] = {"value": best, "unit": "nodes/s", "higher_is_better": True}
+
+    board = initialize_game_state()
+    t0 = time.perf_counter()
+    _, root_node = MCTS(board, PLAYER1, max_time, seed=0)
+    results["mcts_tree"] = {"value": root_node.visits / (time.perf_counter() - t0), "unit": "playouts/s",
+                            "higher_is_better": True}
+    t0 = time.perf_counter()
+    _, tree = MCTS_array(board, PLAYER1, max_time, seed=0)
+    results["mcts_array"] = {"value": tree.visits[0] / (time.perf_counter() - t0), "unit": "playouts/s",
+                             "higher_is_better": True}
+    boards = np.broadcast_to(board, (10000,) + board.shape)
+    t0 = time.perf_counter()
+    batch_random_playouts(boards, PLAYER1, np.random.default_rng(0))
+    results["batch_random_playouts"] = {"value": boards.shape[0] / (time.perf_counter() - t0),
+                                        "unit": "playouts/s", "higher_is_better": True}
+
+    # The same number of moves at each batch size, so only the overhead per call differs
+    n_boards = max(batch_sizes)
+    boards = np.stack([positions[i % len(positions)][0] for i in range(n_boards)])
+    players = np.array([positions[i % len(positions)][1] for i in range(n_boards)], dtype=BoardPiece)
+    generate_moves_minimax(boards[:1], players[:1], 2)
+    for batch_size in batch_sizes:
+        t0 = time.perf_counter()
+        for start in range(0, n_boards, batch_size):
+            generate_moves_minimax(boards[start:start + batch_size], players[start:start + batch_size], 2)
+        results[f"batch_minimax_moves_{batch_size}"] = {"value": n_boards / (time.perf_counter() - t0),
+                                                        "unit": "moves/s", "higher_is_better": True}
+    return results
+
+
+def time_process(code: str, env: Optional[Dict[str, str]] = None) -> float:
+    """
+    :param code: Python code run in a fresh interpreter in the directory of the repository
+    :param env: Environment variables of the process (the ones of this process if not given)
+    :return: Wall time of the process in ms (start of the interpreter, imports and the code)
+    """
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, env=env, check=True)
+    return (time.perf_counter() - t0) * 1e3
+
+
+def run_startup(n_repeats: int = 3, cold: bool = True) -> Results:
+    """
+    Measures the startup of fresh processes: importing main.py and warming up the agents (see agents.warmup),
+    with the numba functions loaded from the on-disk cache and (if cold) compiled from scratch
+    :param n_repeats: Number of repetitions of the measurements with the cache (the fastest one is taken)
+    :param cold: True if the warm-up should also be measured with an empty cache (compiles every function once)
+    :return: Wall time of each kind of process
+    """
+    warm_up_code = "from agents.warmup import warm_up; warm_up()"
+    results = {"startup_import_main": min(time_process("import main") for _ in range(n_repeats))}
+    if cold:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            env = dict(os.environ, NUMBA_CACHE_DIR=cache_dir)
+            results["startup_warm_up_cold"] = time_process(warm_up_code, env)
+            results["startup_warm_up_cached"] = min(time_process(warm_up_code, env) for _ in range(n_repeats))
+    else:
+        time_process(warm_up_code)  # Fill the cache if it is empty
+        results["startup_warm_up_cached"] = min(time_process(warm_up_code) for _ in range(n_repeats))
+    return {name: {"value": value, "unit": "ms", "higher_is_better": False} for name, value in results.items()}
+
+
+def run_benchmarks(n_repeats: int = 5, max_time: float = 1., startup: bool = True) -> dict:
+    """
+    :param n_repeats: Number of repetitions of the micro benchmarks
+    :param max_time: Time budget of each MCTS search in sec
+    :param startup: True if the startup benchmarks should be run as well
+    :return: Results of all micro, macro (and startup) benchmarks and information about the machine
+    """
+    corpus = make_corpus()
+    results = run_micro(corpus, n_repeats)
+    results.update(run_macro(corpus, max_time=max_time))
+    if startup:
+        results.update(run_startup())
+    return {"machine": {"python": platform.python_version(), "numpy": np.__version__, "numba": numba.__version__,
+                        "platform": platform.platform(), "processor": platform.processor()},
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"), "results": results}
+
+
+def compare(baseline: dict, current: dict, tolerance: float = 0.2) -> List[Tuple[str, float, float, float, bool]]:
+    """
+    Compares the results of two runs of run_benchmarks
+    :param baseline: Results of the baseline run
+    :param current: Results of the current run
+    :param tolerance: Relative change in the worse direction that is still accepted (0.2: 20 %, timings of
+    single runs easily vary by 10 %)
+    :return: Name, baseline value, current value, relative change (positive: better) and whether it is a
+    regression for every benchmark of both runs
+    """
+    rows = []
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            continue
+        base_value = baseline["results"][name]["value"]
+        value = result["value"]
+        change = (value - base_value) / base_value
+        if not result["higher_is_better"]:
+            change = -change
+        rows.append((name, base_value, value, change, change < -tolerance))
+    return rows
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of the primitives of the game and the agents")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run all benchmarks and write the results as JSON")
+    run_parser.add_argument("-o", "--output", default="benchmark_results.json")
+    run_parser.add_argument("--repeats", type=int, default=5)
+    run_parser.add_argument("--max-time", type=float, default=1.)
+    run_parser.add_argument("--no-startup", action="store_true", help="skip the startup benchmarks")
+    compare_parser = commands.add_parser("compare", help="compare results with a baseline, exit code 1 on "
+                                                         "regressions")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--baseline", default=BASELINE_FILE)
+    compare_parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == "run":
+        results = run_benchmarks(args.repeats, args.max_time, not args.no_startup)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        for name, result in results["results"].items():
+            print(f"{name:<28} {result['value']:>14.1f} {result['unit']}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.tolerance)
+    for name, base_value, value, change, regression in rows:
+        print(f"{name:<28} {base_value:>14.1f} {value:>14.1f} {100 * change:>+8.1f} %"
+              f"{'  REGRESSION' if regression else ''}")
+    return int(any(row[-1] for row in rows))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,7 +4,7 @@ from agents.common import PlayerAction, BoardPiece, SavedState, GenMove, apply_p
 from agents.agent_random import random_move
 from agents.agent_minimax import minimax_move
 from agents.agent_MCTS import MCTS_move
-from matplotlib import pyplot as plt
+from agents.pondering import Ponderer, PonderFunc
 
 
 def user_move(board: np.ndarray, _player: BoardPiece, saved_state: Optional[SavedState], args):
@@ -36,7 +36,11 @@ def play_one_round(
         args_2: Union[int, float, None] = None,
         init_1: Callable = lambda board, player: None,
         init_2: Callable = lambda board, player: None,
-        print_board=True
+        print_board=True,
+        return_stats: bool = False,
+        stats_callback: Optional[Callable[[dict], None]] = None,
+        ponder_1: Optional[PonderFunc] = None,
+        ponder_2: Optional[PonderFunc] = None
 ):
     """
     :param generate_move_1: Function which is used for the move generation of player 1
@@ -49,7 +53,16 @@ def play_one_round(
     :param init_1: /
     :param init_2: /
     :param print_board: True if board state should be printed to console, False otherwise
-    :return: No return type, the function controls the CONNECT_N (here N=4) game between two players
+    :param return_stats: True if the statistics of all moves should be returned as well
+    :param stats_callback: Function that is called with the statistics of each move right after the move (e.g. to
+    write them to a log file)
+    :param ponder_1: Pondering function of player 1 (e.g. ponder_MCTS or ponder_minimax): after each of its moves,
+    player 1 keeps searching in a background thread until the opponent has moved. None: no pondering
+    :param ponder_2: Pondering function of player 2
+    :return: Number of wins of both agents (and the list of the statistics of all moves if return_stats is True).
+    The statistics of a move hold the round, the index of the move, the name of the player, the action, the move
+    time and the search statistics of the agent (SavedState.stats). For agents that ponder, they also hold the
+    time the agent pondered before the move and the work done while pondering (iterations or nodes)
     """
     import time
     from agents.common import PLAYER1, PLAYER2, GameState
@@ -58,8 +71,9 @@ def play_one_round(
     players = (PLAYER1, PLAYER2)
     static_player_names = (player_1, player_2)
     result = np.zeros((2, 1))  # Save the number of wins per agent
+    move_stats = []
     # Two rounds in which the player that makes the first move is switched
-    for play_first in (1, -1):
+    for round_index, play_first in enumerate((1, -1)):
         for init, player in zip((init_1, init_2)[::play_first], players):
             init(initialize_game_state(), player)
 
@@ -68,12 +82,20 @@ def play_one_round(
         gen_moves = (generate_move_1, generate_move_2)[::play_first]
         player_names = (player_1, player_2)[::play_first]
         gen_args = (args_1, args_2)[::play_first]
+        # Pondering runs while the user is typing or the other agent is searching. Against another agent, the
+        # background thread shares the CPU with the search of the other agent
+        ponderers = {player: Ponderer(ponder) if ponder is not None else None
+                     for player, ponder in zip(players, (ponder_1, ponder_2)[::play_first])}
 
         playing = True
         while playing:
             for player, player_name, gen_move, args in zip(
                     players, player_names, gen_moves, gen_args,
             ):
+                ponder_stats = {}
+                if ponderers[player] is not None:
+                    ponder_time, ponder_work = ponderers[player].stop()
+                    ponder_stats = {"ponder_time": ponder_time, "ponder_work": ponder_work}
                 t0 = time.time()
                 if print_board:
                     print(pretty_print_board(board))
@@ -83,10 +105,23 @@ def play_one_round(
                 action, saved_state[player] = gen_move(
                     board.copy(), player, saved_state[player], args
                 )
-                print(f"Move time: {time.time() - t0:.3f}s") if print_board else None
+                search_stats = getattr(saved_state[player], "stats", None) or {}
+                stats = {"round": round_index, "move": int(np.count_nonzero(board)), "player": player_name,
+                         "action": int(action), "time": time.time() - t0, **ponder_stats, **search_stats}
+                move_stats.append(stats)
+                if stats_callback is not None:
+                    stats_callback(stats)
+                print(f"Move time: {stats['time']:.3f}s") if print_board else None
+                if print_board and search_stats:
+                    print(", ".join(f"{key}: {value}" for key, value in search_stats.items()))
                 apply_player_action(board, action, player)
-                end_state = check_end_state(board, player)
+                end_state = check_end_state(board, player, action)
+                if end_state == GameState.STILL_PLAYING and ponderers[player] is not None:
+                    ponderers[player].start(board.copy(), player, saved_state[player])
                 if end_state != GameState.STILL_PLAYING:
+                    for ponderer in ponderers.values():
+                        if ponderer is not None:
+                            ponderer.stop()
                     print(pretty_print_board(board)) if print_board else None
                     if end_state == GameState.IS_DRAW:
                         print("Game ended in draw") if print_board else None
@@ -100,45 +135,74 @@ def play_one_round(
 
                     playing = False
                     break
+    if print_board:
+        # Report how much thinking time pondering added per move
+        for player_name in static_player_names:
+            pondered = [stats for stats in move_stats if stats["player"] == player_name and "ponder_time" in stats]
+            if pondered:
+                move_time = np.mean([stats["time"] for stats in pondered])
+                ponder_time = np.mean([stats["ponder_time"] for stats in pondered])
+                print(f"{player_name}: {move_time:.3f}s move time + {ponder_time:.3f}s pondering = "
+                      f"{move_time + ponder_time:.3f}s effective thinking time per move")
+    if return_stats:
+        return result, move_stats
     return result
 
 
-def evaluate_performance_agents(n_iterations: int, plot_res: bool):
+def random_baseline(n_games: int, seed: Optional[int] = None) -> np.ndarray:
+    """
+    Lets two random agents play a lot of games against each other (all games are simulated at once)
+    :param n_games: Number of games
+    :param seed: Seed of the random number generator
+    :return: Proportions of the wins of the player who starts, the wins of the other player and the draws
+    """
+    from agents.common import PLAYER1, PLAYER2, NO_PLAYER, initialize_game_state
+    from agents.simulation import batch_random_playouts
+
+    boards = np.broadcast_to(initialize_game_state(), (n_games, 6, 7))
+    winners = batch_random_playouts(boards, PLAYER1, np.random.default_rng(seed))
+    return np.array([np.mean(winners == PLAYER1), np.mean(winners == PLAYER2), np.mean(winners == NO_PLAYER)])
+
+
+def evaluate_performance_agents(n_iterations: int, plot_res: bool, n_random_games: int = 0, n_workers: int = 1,
+                                results_file: str = "tournament_results.jsonl", sprt: bool = False):
     """
     Lets minimax, MCTS and the random  agent play against each other for a lot of rounds, tracks the
     winning of the three agents and creates a pie charts of the winning proportions
     :param n_iterations: Number of rounds the agents should play against each other
     :param plot_res: True if results (winning proportions) should be plotted, False if not wanted
+    :param n_random_games: Number of games of the random agent against itself that are simulated as a baseline
+    :param n_workers: Number of processes across which the games are spread
+    :param results_file: File to which every finished game is appended. If it already contains games (e.g. of an
+    interrupted run), only the missing games are played
+    :param sprt: True if each pairing should only play until a sequential probability ratio test decides which
+    agent is stronger (at most n_iterations rounds), False if all n_iterations rounds should be played
     """
-    # Change here the variations of MCTS time and minimax depth (no alpha-beta pruning used - caution
-    # when increasing the search depth)
+    from tournament import run_tournament, run_sprt, plot_results
+
+    if n_random_games:
+        perc_random = random_baseline(n_random_games)
+        print(f"Random vs. Random: {perc_random[0]:.3f} first player, {perc_random[1]:.3f} second player, "
+              f"{perc_random[2]:.3f} draws")
+    # Change here the variations of MCTS time and minimax depth
     MCTS_time = 10
     minimax_depth = 4
+    agents = {"Minimax": (minimax_move, minimax_depth), "MCTS": (MCTS_move, MCTS_time), "Random": (random_move, None)}
     # Let all agents play against each other
-    agent_pairs = [(minimax_move, MCTS_move), (random_move, MCTS_move), (minimax_move, random_move)]
-    names = [("Minimax", "MCTS"), ("Random", "MCTS"), ("Minimax", "Random")]
-    for j, ((agent_1, agent_2), (name_1, name_2)) in enumerate(zip(agent_pairs, names)):
-        result = np.zeros((2, 1))  # Stores the number of wins for each agent
-        for i in range(n_iterations):
-            print(f"Agent {name_1} vs. {name_2} starts round {i} out of {n_iterations}")
-            # Let the agents play one round (consisting of each agent starting one game)
-            # and add the wins to the result array
-            result += play_one_round(generate_move_1=agent_1, generate_move_2=agent_2,
-                                     args_1=minimax_depth, args_2=MCTS_time, print_board=False)
-        # Calculate the percentage of wins and add the percentage of draws
-        perc_win = result / (n_iterations * 2)  # * 2 as a round consists of two plays
-        draw = 1 - np.sum(perc_win)
-        perc_win = np.vstack((perc_win, [[draw]]))
-        if plot_res:
-            # Plot a pie chart of the winning percentages
-            label_1 = f": {name_1} with depth {minimax_depth}" if name_1 == "Minimax" else name_1
-            label_2 = f": {name_2} with max time {MCTS_time}" if name_2 == "MCTS" else name_2
-            labels = [str(perc_win[0][0]) + label_1, str(perc_win[1][0]) + label_2, "Draw"]
-            print(perc_win.flatten())
-            plt.plot()
-            plt.pie(np.squeeze(perc_win), labels=labels)
-            plt.savefig(f"Percentage_wins_{name_1}_{name_2}.png")
-            plt.close()
+    pairings = [("Minimax", "MCTS"), ("Random", "MCTS"), ("Minimax", "Random")]
+    if sprt:
+        for name_1, name_2 in pairings:
+            res = run_sprt(agents, name_1, name_2, max_rounds=n_iterations, results_file=results_file,
+                           n_workers=n_workers)
+            print(f"{name_1} vs. {name_2}: {res['games']} games (+{res['wins']} ={res['draws']} -{res['losses']}), "
+                  f"accepted {res['hypothesis']}, Elo difference {res['elo']:.0f} "
+                  f"[{res['elo_interval'][0]:.0f}, {res['elo_interval'][1]:.0f}]")
+    else:
+        run_tournament(agents, pairings, n_iterations, results_file, n_workers)
+    if plot_res:
+        # Plot pie charts of the winning percentages
+        plot_results(results_file, {"Minimax": f"Minimax with depth {minimax_depth}",
+                                    "MCTS": f"MCTS with max time {MCTS_time}"})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,564 @@
+import argparse
+import asyncio
+import functools
+import itertools
+import json
+import sys
+import time
+import numpy as np
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from agents.common import PlayerAction, BoardPiece, PLAYER1, PLAYER2, NO_PLAYER, BOARD_COLS, GameState,\
+    initialize_game_state, apply_player_action, check_end_state
+from agents.agent_random import random_move
+from agents.agent_minimax import minimax_move
+from agents.agent_MCTS import MCTS_move
+from agents.warmup import warm_up as warm_up_agents
+
+SERVER_TT_SIZE = 2**16  # Entries of the transposition table of a game of the minimax agent (about 1.4 MB)
+SERVER_TREE_NODES = 5000  # Maximal number of nodes of the search tree of a game of the MCTS agent (about 2.7 MB)
+# Agents the clients can play against: name -> move generation function (called with the time budget in sec). The
+# saved states of many games are kept at once, so they get small transposition tables and search trees
+AGENTS = {"random": random_move, "minimax": functools.partial(minimax_move, tt_size=SERVER_TT_SIZE),
+          "mcts": functools.partial(MCTS_move, max_tree_nodes=SERVER_TREE_NODES)}
+MAX_WORKER_STATES = 100  # Maximal number of saved states of agents in a worker process (at most about 300 MB)
+DEFAULT_TIME = 1.  # Time budget of a move in sec if the client does not give one
+MAX_TIME = 10.  # Largest time budget of a move in sec a client can ask for
+TIMEOUT_MARGIN = 2.  # Time in sec a move may take longer than its budget before the request fails
+SESSION_TIMEOUT = 600.  # Time in sec after which games without requests are removed
+N_SAMPLES = 1000  # Number of the most recent moves from which the latency metrics are computed
+
+# Saved states of the agents of the games of a worker process by game id (every game is played by one worker, so
+# the agents keep their search trees and transposition tables between the moves of a game), the least recently
+# used first. Beyond MAX_WORKER_STATES the least recently used states are dropped, the next move of such a game is
+# searched without the results of the previous moves
+worker_states = OrderedDict()
+
+
+def worker_move(game_id: str, agent: str, board: np.ndarray, player: BoardPiece, max_time: float) \
+        -> Tuple[int, Optional[dict], float]:
+    """
+    Generates the move of an agent in a worker process
+    :param game_id: Id of the game
+    :param agent: Name of the agent (see AGENTS)
+    :param board: State of board, 6 x 7 with either 0 or player ID [1, 2]
+    :param player: Player ID of the agent
+    :param max_time: Time budget of the move in sec
+    :return: Action, search statistics of the agent and time of the move in sec
+    """
+    t0 = time.perf_counter()
+    action, saved_state = AGENTS[agent](board, player, worker_states.pop(game_id, None), max_time)
+    worker_states[game_id] = saved_state
+    while len(worker_states) > MAX_WORKER_STATES:
+        worker_states.popitem(last=False)
+    return int(action), getattr(saved_state, "stats", None), time.perf_counter() - t0
+
+
+def worker_end_game(game_id: str):
+    """
+    Frees the saved state of the agent of a game in a worker process
+    :param game_id: Id of the game
+    """
+    worker_states.pop(game_id, None)
+
+
+def worker_game_ids() -> List[str]:
+    """
+    :return: Ids of the games of which a worker process keeps the saved state, the least recently used first
+    """
+    return list(worker_states)
+
+
+def percentiles(samples: deque) -> dict:
+    """
+    :param samples: Times in sec
+    :return: Mean, median, 90th and 99th percentile of the times in ms (None if there are no samples)
+    """
+    if not samples:
+        return {"mean": None, "p50": None, "p90": None, "p99": None}
+    values = 1000 * np.array(samples)
+    return {"mean": float(np.mean(values)), "p50": float(np.percentile(values, 50)),
+            "p90": float(np.percentile(values, 90)), "p99": float(np.percentile(values, 99))}
+
+
+def to_json(obj) -> bytes:
+    """
+    :param obj: Response (may contain numpy scalars, e.g. in the search statistics)
+    :return: JSON encoding of obj
+    """
+    return json.dumps(obj, default=lambda value: value.item() if isinstance(value, np.generic) else str(value))\
+        .encode()
+
+
+class HTTPError(Exception):
+    """
+    Error that is sent to the client as a response with a status code
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class GameSession:
+    """
+    Game between a client and an agent that is kept in the memory of the server
+    """
+    def __init__(self, game_id: str, agent: str, agent_player: BoardPiece, max_time: float, worker: int):
+        self.id = game_id
+        self.agent = agent
+        self.agent_player = agent_player  # Player ID of the agent (the client plays the other one)
+        self.max_time = max_time  # Time budget of the moves of the agent in sec
+        self.worker = worker  # Index of the worker process that generates the moves of the agent
+        self.board = initialize_game_state()
+        self.moves = []
+        self.end_state = GameState.STILL_PLAYING
+        self.winner = NO_PLAYER
+        self.agent_task = None  # Move of the agent that is being generated
+        self.removed = False  # True once the game was removed from the server (possibly during a move of the agent)
+        self.last_stats = None  # Search statistics of the last move of the agent
+        self.last_request = time.time()
+
+    def player_to_move(self) -> BoardPiece:
+        return PLAYER1 if len(self.moves) % 2 == 0 else PLAYER2
+
+    def apply(self, action: PlayerAction, player: BoardPiece):
+        """
+        Applies an action and updates the state of the game
+        :param action: Column of the move
+        :param player: Player ID of the player who makes the move
+        """
+        apply_player_action(self.board, action, player)
+        self.moves.append(int(action))
+        self.end_state = check_end_state(self.board, player, action)
+        if self.end_state == GameState.IS_WIN:
+            self.winner = player
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "agent": self.agent, "agent_player": int(self.agent_player),
+                "time": self.max_time, "board": self.board.tolist(), "moves": self.moves,
+                "state": self.end_state.name, "winner": int(self.winner),
+                "to_move": int(self.player_to_move()), "busy": self.agent_task is not None,
+                "agent_stats": self.last_stats}
+
+
+class GameServer:
+    """
+    Asyncio HTTP server that hosts many games at once. The moves of the agents are generated by worker processes,
+    so that the searches do not block the event loop. Each game is bound to one worker, which keeps the saved state
+    of its agent.
+
+    Endpoints (JSON bodies and responses):
+    POST /games {"agent": "random" | "minimax" | "mcts", "first": "client" | "agent", "time": budget in sec}
+    GET /games/<id>
+    POST /games/<id>/moves {"action": column of the client, "time": budget of the reply of the agent in sec}
+    DELETE /games/<id>
+    GET /metrics
+
+    If a move of the agent takes longer than its time budget (plus TIMEOUT_MARGIN), the server answers with status
+    202 and a game that is still busy. The move is applied as soon as it is finished, the client polls the game.
+    """
+    def __init__(self, n_workers: int = 1, max_sessions: Optional[int] = None,
+                 session_timeout: float = SESSION_TIMEOUT):
+        """
+        :param n_workers: Number of worker processes
+        :param max_sessions: Maximal number of games that are kept in memory at once (by default as many as the
+        workers keep saved states of, see MAX_WORKER_STATES)
+        :param session_timeout: Time in sec after which games without requests are removed
+        """
+        self.workers = [ProcessPoolExecutor(max_workers=1) for _ in range(n_workers)]
+        self.max_sessions = n_workers * MAX_WORKER_STATES if max_sessions is None else max_sessions
+        self.session_timeout = session_timeout
+        self.sessions: Dict[str, GameSession] = {}
+        self.game_ids = itertools.count()
+        self.server = None
+        self.port = None
+        # Metrics
+        self.start_time = time.time()
+        self.queue_depths = [0] * n_workers  # Moves submitted to each worker that are not finished yet
+        self.max_queue_depth = 0
+        self.latencies = deque(maxlen=N_SAMPLES)  # Time from submitting a move to the worker until its result
+        self.search_times = deque(maxlen=N_SAMPLES)  # Time of the move generation in the worker
+        self.queue_waits = deque(maxlen=N_SAMPLES)  # Latency minus search time (waiting and transfer)
+        self.counters = {"requests": 0, "errors": 0, "timeouts": 0, "games_started": 0, "games_finished": 0,
+                         "agent_moves": 0, "client_moves": 0}
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080, warm_up: bool = True):
+        """
+        Starts the worker processes and the server
+        :param host: Host name to listen on
+        :param port: Port to listen on (0: any free port, see self.port)
+        :param warm_up: True if the numba functions of the agents should be compiled before the first request
+        """
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(worker, warm_up_agents if warm_up else time.time)
+                               for worker in self.workers))
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stops the server and the worker processes
+        """
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for worker in self.workers:
+            worker.shutdown(cancel_futures=True)
+
+    def metrics(self) -> dict:
+        """
+        :return: Number of games and moves, current and maximal queue depth and latency, search time and queue wait
+        of the recent moves of the agents in ms
+        """
+        return {"uptime": time.time() - self.start_time, "sessions": len(self.sessions),
+                "workers": len(self.workers), "queue_depth": sum(self.queue_depths),
+                "queue_depth_per_worker": list(self.queue_depths), "max_queue_depth": self.max_queue_depth,
+                **self.counters, "latency_ms": percentiles(self.latencies),
+                "search_ms": percentiles(self.search_times), "queue_wait_ms": percentiles(self.queue_waits)}
+
+    async def agent_move(self, session: GameSession, max_time: float):
+        """
+        Generates the move of the agent of a game in its worker process and applies it
+        :param session: Game in which the agent is to move
+        :param max_time: Time budget of the move in sec
+        """
+        loop = asyncio.get_running_loop()
+        self.queue_depths[session.worker] += 1
+        self.max_queue_depth = max(self.max_queue_depth, sum(self.queue_depths))
+        t0 = time.perf_counter()
+        try:
+            action, stats, search_time = await loop.run_in_executor(
+                self.workers[session.worker], worker_move, session.id, session.agent, session.board.copy(),
+                session.agent_player, max_time)
+        finally:
+            self.queue_depths[session.worker] -= 1
+            session.agent_task = None
+            if session.removed:
+                # The game was removed during the move: drop the saved state the worker just stored
+                self.workers[session.worker].submit(worker_end_game, session.id)
+        latency = time.perf_counter() - t0
+        self.latencies.append(latency)
+        self.search_times.append(search_time)
+        self.queue_waits.append(max(latency - search_time, 0.))
+        self.counters["agent_moves"] += 1
+        if not session.removed:
+            session.apply(PlayerAction(action), session.agent_player)
+            session.last_stats = stats
+            if session.end_state != GameState.STILL_PLAYING:
+                self.counters["games_finished"] += 1
+
+    async def run_agent(self, session: GameSession, max_time: float) -> bool:
+        """
+        Starts the move of the agent and waits for it until its time budget (plus TIMEOUT_MARGIN) ran out. A move
+        that takes longer is still applied when it is finished (the client can poll the game)
+        :param session: Game in which the agent is to move
+        :param max_time: Time budget of the move in sec
+        :return: True if the move was applied, False if it took too long
+        """
+        session.agent_task = asyncio.ensure_future(self.agent_move(session, max_time))
+        try:
+            await asyncio.wait_for(asyncio.shield(session.agent_task), max_time + TIMEOUT_MARGIN)
+        except asyncio.TimeoutError:
+            self.counters["timeouts"] += 1
+            return False
+        return True
+
+    def get_session(self, game_id: str) -> GameSession:
+        if game_id not in self.sessions:
+            raise HTTPError(404, f"Unknown game {game_id}")
+        session = self.sessions[game_id]
+        session.last_request = time.time()
+        return session
+
+    def remove_session(self, game_id: str):
+        """
+        Removes a game and frees the saved state of its agent in the worker. During a move of the agent the state
+        is freed once the move is finished (see agent_move), the move is not applied
+        :param game_id: Id of the game
+        """
+        session = self.sessions.pop(game_id)
+        session.removed = True
+        if session.agent_task is None:
+            self.workers[session.worker].submit(worker_end_game, game_id)
+
+    def expire_sessions(self):
+        """
+        Removes the games without requests for longer than the session timeout
+        """
+        now = time.time()
+        for game_id, session in list(self.sessions.items()):
+            if now - session.last_request > self.session_timeout and session.agent_task is None:
+                self.remove_session(game_id)
+
+    @staticmethod
+    def time_budget(body: dict, default: float) -> float:
+        try:
+            max_time = float(body.get("time", default))
+        except (TypeError, ValueError):
+            raise HTTPError(400, "The time budget must be a number")
+        if not 0 < max_time <= MAX_TIME:
+            raise HTTPError(400, f"The time budget must be in (0, {MAX_TIME}] sec")
+        return max_time
+
+    async def create_game(self, body: dict) -> Tuple[int, dict]:
+        self.expire_sessions()
+        if len(self.sessions) >= self.max_sessions:
+            raise HTTPError(503, "Too many games")
+        agent = body.get("agent", "mcts")
+        if agent not in AGENTS:
+            raise HTTPError(400, f"Unknown agent {agent}, choose one of {', '.join(AGENTS)}")
+        first = body.get("first", "client")
+        if first not in ("client", "agent"):
+            raise HTTPError(400, "first must be client or agent")
+        max_time = self.time_budget(body, DEFAULT_TIME)
+        # Bind the game to the worker with the fewest games
+        n_games = [0] * len(self.workers)
+        for session in self.sessions.values():
+            n_games[session.worker] += 1
+        session = GameSession(str(next(self.game_ids)), agent, PLAYER1 if first == "agent" else PLAYER2, max_time,
+                              int(np.argmin(n_games)))
+        self.sessions[session.id] = session
+        self.counters["games_started"] += 1
+        if first == "agent" and not await self.run_agent(session, max_time):
+            return 202, session.to_dict()
+        return 201, session.to_dict()
+
+    async def client_move(self, session: GameSession, body: dict) -> Tuple[int, dict]:
+        if session.agent_task is not None:
+            raise HTTPError(409, "The agent is still generating its move")
+        if session.end_state != GameState.STILL_PLAYING:
+            raise HTTPError(409, "The game is over")
+        try:
+            action = PlayerAction(body["action"])
+        except (KeyError, TypeError, ValueError, OverflowError):
+            raise HTTPError(400, "The move needs an integer action")
+        if not 0 <= action < BOARD_COLS or session.board[0, action] != NO_PLAYER:
+            raise HTTPError(400, f"Column {action} does not exist or is full")
+        max_time = self.time_budget(body, session.max_time)
+        session.apply(action, PLAYER1 if session.agent_player == PLAYER2 else PLAYER2)
+        self.counters["client_moves"] += 1
+        if session.end_state == GameState.STILL_PLAYING:
+            if not await self.run_agent(session, max_time):
+                return 202, session.to_dict()
+        else:
+            self.counters["games_finished"] += 1
+        return 200, session.to_dict()
+
+    async def route(self, method: str, path: str, body: dict) -> Tuple[int, dict]:
+        """
+        :param method: HTTP method of the request
+        :param path: Path of the request
+        :param body: Decoded JSON body of the request (empty dict if there is no body)
+        :return: Status code and response
+        """
+        parts = [part for part in path.split("?")[0].split("/") if part]
+        if parts == ["metrics"] and method == "GET":
+            return 200, self.metrics()
+        if parts == ["games"] and method == "POST":
+            return await self.create_game(body)
+        if len(parts) == 2 and parts[0] == "games":
+            session = self.get_session(parts[1])
+            if method == "GET":
+                return 200, session.to_dict()
+            if method == "DELETE":
+                self.remove_session(session.id)
+                return 200, {"id": session.id}
+        if len(parts) == 3 and parts[0] == "games" and parts[2] == "moves" and method == "POST":
+            return await self.client_move(self.get_session(parts[1]), body)
+        raise HTTPError(404, f"No endpoint {method} {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Serves the requests of one connection (connections are kept alive until the client closes them)
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                data = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.counters["requests"] += 1
+                try:
+                    try:
+                        body = json.loads(data) if data else {}
+                    except ValueError:
+                        raise HTTPError(400, "The body must be JSON")
+                    if not isinstance(body, dict):
+                        raise HTTPError(400, "The body must be a JSON object")
+                    status, response = await self.route(method, path, body)
+                except HTTPError as error:
+                    self.counters["errors"] += 1
+                    status, response = error.status, {"error": str(error)}
+                except Exception as error:
+                    # E.g. a crashed worker process
+                    self.counters["errors"] += 1
+                    status, response = 500, {"error": repr(error)}
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                payload = to_json(response)
+                writer.write(f"{version} {status} {'OK' if status < 400 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+class HTTPClient:
+    """
+    Minimal HTTP client for the game server that sends all requests over one kept alive connection
+    """
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, dict]:
+        """
+        :param method: HTTP method
+        :param path: Path of the endpoint
+        :param body: JSON body of the request
+        :return: Status code and decoded JSON response
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        payload = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Type: application/json\r\n"
+                          f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = (await self.reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+
+async def run_load(host: str, port: int, n_games: int = 20, concurrency: int = 4, agent: str = "mcts",
+                   max_time: float = 0.2, seed: int = 0) -> dict:
+    """
+    Load generator: concurrency clients play n_games games with random moves against an agent of the server
+    :param host: Host name of the server
+    :param port: Port of the server
+    :param n_games: Number of games
+    :param concurrency: Number of clients that play at the same time (each one over its own connection)
+    :param agent: Name of the agent of the games
+    :param max_time: Time budget of the moves of the agent in sec
+    :param seed: Seed of the moves of the clients
+    :return: Number of games, moves, failed requests and moves of the agent that exceeded their time budget, moves
+    per sec, latency of the move requests in ms (time until the reply of the agent arrived) and the metrics of the
+    server after the run
+    """
+    rng = np.random.default_rng(seed)
+    games = iter(range(n_games))
+    latencies = deque()
+    counts = {"games": 0, "moves": 0, "errors": 0, "timeouts": 0}
+
+    async def wait_for_agent(client: HTTPClient, game: dict) -> Tuple[int, dict]:
+        # Poll the game until the move of the agent that exceeded its time budget is finished
+        counts["timeouts"] += 1
+        status = 200
+        while status == 200 and game["busy"]:
+            await asyncio.sleep(0.05)
+            status, game = await client.request("GET", f"/games/{game['id']}")
+        return status, game
+
+    async def play(client: HTTPClient):
+        for game_index in games:
+            first = "agent" if game_index % 2 else "client"
+            status, game = await client.request("POST", "/games", {"agent": agent, "first": first, "time": max_time})
+            if status == 202:
+                status, game = await wait_for_agent(client, game)
+            if status not in (200, 201):
+                counts["errors"] += 1
+                continue
+            while game["state"] == GameState.STILL_PLAYING.name:
+                free = [action for action in range(BOARD_COLS) if game["board"][0][action] == NO_PLAYER]
+                t0 = time.perf_counter()
+                status, response = await client.request("POST", f"/games/{game['id']}/moves",
+                                                        {"action": int(rng.choice(free))})
+                if status == 202:
+                    status, response = await wait_for_agent(client, response)
+                if status != 200:
+                    counts["errors"] += 1
+                    break
+                latencies.append(time.perf_counter() - t0)
+                counts["moves"] += 1
+                game = response
+            await client.request("DELETE", f"/games/{game['id']}")
+            counts["games"] += 1
+
+    clients = [HTTPClient(host, port) for _ in range(concurrency)]
+    t0 = time.perf_counter()
+    await asyncio.gather(*(play(client) for client in clients))
+    duration = time.perf_counter() - t0
+    _, server_metrics = await clients[0].request("GET", "/metrics")
+    for client in clients:
+        await client.close()
+    return {**counts, "duration": duration, "moves_per_sec": counts["moves"] / duration,
+            "latency_ms": percentiles(latencies), "server": server_metrics}
+
+
+async def serve(host: str, port: int, n_workers: int):
+    server = GameServer(n_workers)
+    await server.start(host, port)
+    print(f"Serving on http://{host}:{server.port} with {n_workers} workers")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Game server hosting many games against the agents at once")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="run the game server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+    serve_parser.add_argument("--workers", type=int, default=2)
+    load_parser = commands.add_parser("load", help="run the load generator against a running server")
+    load_parser.add_argument("--host", default="127.0.0.1")
+    load_parser.add_argument("--port", type=int, default=8080)
+    load_parser.add_argument("--games", type=int, default=20)
+    load_parser.add_argument("--concurrency", type=int, default=4)
+    load_parser.add_argument("--agent", default="mcts", choices=list(AGENTS))
+    load_parser.add_argument("--time", type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        try:
+            asyncio.run(serve(args.host, args.port, args.workers))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    report = asyncio.run(run_load(args.host, args.port, args.games, args.concurrency, args.agent, args.time))
+    print(json.dumps(report, indent=2))
+    return int(report["errors"] > 0)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,415 @@
+import functools
+import json
+import os
+import time
+import zlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple, Union
+from agents.common import GenMove, BoardPiece, PLAYER1, PLAYER2, NO_PLAYER, GameState, initialize_game_state,\
+    apply_player_action, check_end_state
+from agents.game_records import GameRecordWriter
+from agents.warmup import warm_up
+
+# Agents of a tournament: name -> (move generation function, additional parameter of the function)
+Agents = Dict[str, Tuple[GenMove, Union[int, float, None]]]
+# Prefix of the ids of the games of run_sprt (they can be appended to the results file of a tournament)
+SPRT_PREFIX = "SPRT: "
+
+
+def game_id(name_1: str, name_2: str, round_index: int, first: str, prefix: str = "") -> str:
+    """
+    :param name_1: Name of the first agent of the pairing
+    :param name_2: Name of the second agent of the pairing
+    :param round_index: Index of the round (each round consists of two games, each agent starts once)
+    :param first: Name of the agent that makes the first move
+    :param prefix: Prefix of the id (e.g. SPRT_PREFIX)
+    :return: Unique name of the game in a tournament
+    """
+    return f"{prefix}{name_1} vs. {name_2} #{round_index} ({first} first)"
+
+
+def agent_config(agent: Tuple[GenMove, Union[int, float, None]]) -> str:
+    """
+    :param agent: Move generation function and additional parameter of an agent
+    :return: Description of the agent: the function with the arguments bound by functools.partial and the
+    parameter (stored with every game, so that results of other settings of the agents are recognized)
+    """
+    gen_move, args = agent
+    bound = []
+    while isinstance(gen_move, functools.partial):
+        bound = [repr(arg) for arg in gen_move.args] + \
+            [f"{key}={value!r}" for key, value in sorted(gen_move.keywords.items())] + bound
+        gen_move = gen_move.func
+    return f"{gen_move.__module__}.{gen_move.__qualname__}({', '.join(bound)}), args={args!r}"
+
+
+def seed_of_game(seed: int, game: str) -> int:
+    """
+    :param seed: Seed of the tournament (or of the SPRT)
+    :param game: Id of the game (see game_id, without prefix)
+    :return: Seed of the game, which only depends on the seed and the id of the game (not on the number of rounds,
+    the order of the pairings or the order in which the games are played)
+    """
+    return int(np.random.SeedSequence([seed, zlib.crc32(game.encode())]).generate_state(1)[0])
+
+
+def play_game(agents: Agents, name_1: str, name_2: str, round_index: int, first: str, seed: int,
+              id_prefix: str = "") -> dict:
+    """
+    Plays one game between two agents without printing anything. The global random number generator of numpy
+    is seeded with the seed of the game, from which the agents draw their random numbers (the MCTS agent draws
+    the seed of its simulations from it). The moves of an agent with a time budget still depend on how many
+    iterations it completes in the time, so only games of agents with fixed budgets (e.g. the search depth) are
+    reproduced exactly
+    :param agents: Agents of the tournament
+    :param name_1: Name of the first agent of the pairing
+    :param name_2: Name of the second agent of the pairing
+    :param round_index: Index of the round
+    :param first: Name of the agent that makes the first move (name_1 or name_2)
+    :param seed: Seed of the random number generator for this game
+    :param id_prefix: Prefix of the id of the game (see game_id)
+    :return: Record of the game: id, names and settings of the agents, seed, actions, time and search statistics
+    per move and the name of the winner (None for a draw)
+    """
+    np.random.seed(seed)
+    names = (first, name_2 if first == name_1 else name_1)
+    saved_state = {PLAYER1: None, PLAYER2: None}
+    board = initialize_game_state()
+    moves = []
+    move_times = []
+    move_stats = []
+    winner = None
+    end_state = GameState.STILL_PLAYING
+    while end_state == GameState.STILL_PLAYING:
+        player = PLAYER1 if len(moves) % 2 == 0 else PLAYER2
+        gen_move, args = agents[names[player - 1]]
+        t0 = time.time()
+        action, saved_state[player] = gen_move(board.copy(), player, saved_state[player], args)
+        move_times.append(time.time() - t0)
+        moves.append(int(action))
+        move_stats.append(getattr(saved_state[player], "stats", None))
+        apply_player_action(board, action, player)
+        end_state = check_end_state(board, player, action)
+        if end_state == GameState.IS_WIN:
+            winner = names[player - 1]
+    return {"id": game_id(name_1, name_2, round_index, first, id_prefix), "pairing": [name_1, name_2],
+            "round": round_index, "first": first,
+            "agents": {name: agent_config(agents[name]) for name in (name_1, name_2)}, "seed": seed, "moves": moves,
+            "move_times": move_times, "move_stats": move_stats, "winner": winner}
+
+
+def load_results(results_file: str) -> List[dict]:
+    """
+    Reads the records of all finished games of a tournament
+    :param results_file: JSONL file with one game record per line
+    :return: List of game records (an incomplete last line, e.g. of an interrupted run, is skipped)
+    """
+    if not os.path.exists(results_file):
+        return []
+    results = []
+    with open(results_file) as f:
+        for line in f:
+            try:
+                results.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return results
+
+
+def end_last_line(results_file: str):
+    """
+    Makes sure that a line of an interrupted write does not merge with the first record that is appended
+    :param results_file: JSONL file with one game record per line
+    """
+    if os.path.exists(results_file) and os.path.getsize(results_file) > 0:
+        with open(results_file, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            missing_newline = f.read() != b"\n"
+        if missing_newline:
+            with open(results_file, "a") as f:
+                f.write("\n")
+
+
+def check_resumed(results: List[dict], game_seeds: Dict[str, int], agents: Agents, seed: int, results_file: str):
+    """
+    Makes sure that the games of a results file that are not played again were played with the same settings
+    :param results: Records of the results file
+    :param game_seeds: Seeds of the games of the run by their ids
+    :param agents: Agents of the run
+    :param seed: Seed of the run
+    :param results_file: Name of the results file (for the error message)
+    :raises ValueError: If a game of the run was played with other settings of the agents or another seed
+    """
+    for result in results:
+        if result["id"] in game_seeds and (result["seed"] != game_seeds[result["id"]]
+                                           or result.get("tournament_seed") != seed
+                                           or result.get("agents") != {name: agent_config(agents[name])
+                                                                       for name in result["pairing"]}):
+            raise ValueError(f"{results_file} holds the game {result['id']} of a run with other settings of the "
+                             f"agents or another seed, use another results file")
+
+
+def record_winner(result: dict) -> BoardPiece:
+    """
+    :param result: Record of a game of play_game
+    :return: Player ID of the winner (PLAYER1 is the agent that moved first), NO_PLAYER for a draw
+    """
+    if result["winner"] is None:
+        return NO_PLAYER
+    return PLAYER1 if result["winner"] == result["first"] else PLAYER2
+
+
+def convert_results(results_file: str, records_file: str) -> int:
+    """
+    Appends the moves and results of all games of a results file to a binary game records file (see
+    agents.game_records), which loads much faster than the JSONL file
+    :param results_file: JSONL file of game records of play_game
+    :param records_file: File of the binary game records
+    :return: Number of converted games
+    """
+    results = load_results(results_file)
+    with GameRecordWriter(records_file) as writer:
+        for result in results:
+            writer.write(result["moves"], record_winner(result))
+    return len(results)
+
+
+def run_tournament(agents: Agents, pairings: List[Tuple[str, str]], n_rounds: int, results_file: str,
+                   n_workers: int = 1, seed: int = 0, records_file: Optional[str] = None) -> List[dict]:
+    """
+    Lets the agents of all pairings play n_rounds rounds (two games, each agent starts once) against each other.
+    The games are spread across a process pool and each finished game is appended to the results file right
+    away. Games that are already in the results file (e.g. of an interrupted run) are not played again, a
+    ValueError is raised if they were played with other settings of the agents or another seed
+    :param agents: Agents of the tournament
+    :param pairings: Pairs of names of agents that play against each other
+    :param n_rounds: Number of rounds per pairing
+    :param results_file: JSONL file to which the game records are appended
+    :param n_workers: Number of worker processes (1: play all games in this process)
+    :param seed: Seed from which the seeds of the games are derived
+    :param records_file: Optional file to which the moves and results of the games are written as binary game
+    records as well (see agents.game_records). It is rewritten from the results file first, so that record i
+    always belongs to the game of record i of load_results(results_file), which holds the agents of the game (the
+    binary records only hold the moves and the winning side)
+    :return: Records of all games of the tournament
+    """
+    # Every game gets its own seed (see seed_of_game), so that a tournament can be extended
+    all_games = [(name_1, name_2, round_index, first) for name_1, name_2 in pairings
+                 for round_index in range(n_rounds) for first in (name_1, name_2)]
+    all_seeds = {game_id(*game): seed_of_game(seed, game_id(*game)) for game in all_games}
+    results = load_results(results_file)
+    check_resumed(results, all_seeds, agents, seed, results_file)
+    finished = {result["id"] for result in results}
+    games = [game for game in all_games if game_id(*game) not in finished]
+    game_seeds = [all_seeds[game_id(*game)] for game in games]
+
+    end_last_line(results_file)
+    writer = GameRecordWriter(records_file, append=False) if records_file is not None else None
+    try:
+        if writer is not None:
+            for result in results:
+                writer.write(result["moves"], record_winner(result))
+        with open(results_file, "a") as f:
+            def save(result: dict):
+                result["tournament_seed"] = seed
+                f.write(json.dumps(result) + "\n")
+                f.flush()
+                if writer is not None:
+                    writer.write(result["moves"], record_winner(result))
+                results.append(result)
+                print(f"Finished {result['id']}, winner: {result['winner']}")
+
+            if n_workers == 1:
+                # Make sure that the compilation of numba functions is not part of the move times
+                warm_up()
+                for game, game_seed in zip(games, game_seeds):
+                    save(play_game(agents, *game, game_seed))
+            else:
+                with ProcessPoolExecutor(max_workers=n_workers, initializer=warm_up) as pool:
+                    futures = [pool.submit(play_game, agents, *game, game_seed)
+                               for game, game_seed in zip(games, game_seeds)]
+                    for future in as_completed(futures):
+                        save(future.result())
+    finally:
+        if writer is not None:
+            writer.close()
+    return results
+
+
+def summarize_results(results: List[dict]) -> Dict[Tuple[str, str], np.ndarray]:
+    """
+    :param results: Game records of a tournament (of games that are recorded several times only the first
+    record is counted, games of run_sprt are not counted)
+    :return: For each pairing the proportions of wins of the first agent, wins of the second agent and draws
+    """
+    counts = {}
+    counted = set()
+    for result in results:
+        if result["id"] in counted or result.get("mode") == "sprt":
+            continue
+        counted.add(result["id"])
+        name_1, name_2 = result["pairing"]
+        count = counts.setdefault((name_1, name_2), np.zeros(3))
+        count[[name_1, name_2, None].index(result["winner"])] += 1
+    return {pairing: count / np.sum(count) for pairing, count in counts.items()}
+
+
+def plot_results(results_file: str, labels: Dict[str, str] = None):
+    """
+    Creates a pie chart of the winning proportions of each pairing of a tournament (saved as
+    Percentage_wins_{name_1}_{name_2}.png)
+    :param results_file: JSONL file with the game records of the tournament
+    :param labels: Optional labels of the agents (e.g. with the parameters of the agent) by name
+    """
+    from matplotlib import pyplot as plt
+
+    labels = labels or {}
+    for (name_1, name_2), perc_win in summarize_results(load_results(results_file)).items():
+        pie_labels = [f"{perc_win[0]}: {labels.get(name_1, name_1)}", f"{perc_win[1]}: {labels.get(name_2, name_2)}",
+                      "Draw"]
+        print(f"{name_1} vs. {name_2}: {perc_win}")
+        plt.plot()
+        plt.pie(perc_win, labels=pie_labels)
+        plt.savefig(f"Percentage_wins_{name_1}_{name_2}.png")
+        plt.close()
+
+
+def elo_to_score(elo: float) -> float:
+    """
+    :param elo: Elo difference
+    :return: Expected score (win = 1, draw = 0.5, loss = 0) of the stronger agent
+    """
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score: float) -> float:
+    """
+    :param score: Mean score (win = 1, draw = 0.5, loss = 0)
+    :return: Elo difference that corresponds to the score
+    """
+    score = np.clip(score, 1e-6, 1 - 1e-6)
+    return -400 * np.log10(1 / score - 1)
+
+
+def score_statistics(wins: int, draws: int, losses: int) -> Tuple[float, float, int]:
+    """
+    Mean and variance of the score per game. One virtual win and one virtual loss are added, so that the variance is
+    never zero (e.g. if an agent won all games so far)
+    :param wins: Number of wins
+    :param draws: Number of draws
+    :param losses: Number of losses
+    :return: Mean score, variance of the score per game and number of games (including the virtual ones)
+    """
+    n = wins + draws + losses + 2
+    mean = (wins + 1 + 0.5 * draws) / n
+    variance = ((wins + 1) * (1 - mean) ** 2 + draws * (0.5 - mean) ** 2 + (losses + 1) * mean ** 2) / n
+    return mean, variance, n
+
+
+def sprt_llr(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    """
+    Log-likelihood ratio of the hypotheses H1: Elo difference = elo1 against H0: Elo difference = elo0 given the
+    results of the games (normal approximation of the generalized sequential probability ratio test)
+    :param wins: Number of wins
+    :param draws: Number of draws
+    :param losses: Number of losses
+    :param elo0: Elo difference of H0
+    :param elo1: Elo difference of H1
+    :return: Log-likelihood ratio
+    """
+    mean, variance, n = score_statistics(wins, draws, losses)
+    score0, score1 = elo_to_score(elo0), elo_to_score(elo1)
+    return n * (score1 - score0) * (2 * mean - score0 - score1) / (2 * variance)
+
+
+def elo_estimate(wins: int, draws: int, losses: int, z: float = 1.96) -> Tuple[float, float, float]:
+    """
+    :param wins: Number of wins
+    :param draws: Number of draws
+    :param losses: Number of losses
+    :param z: Quantile of the normal distribution of the confidence interval (1.96: 95 % interval)
+    :return: Estimated Elo difference and lower and upper bound of its confidence interval
+    """
+    mean, variance, n = score_statistics(wins, draws, losses)
+    margin = z * np.sqrt(variance / n)
+    return score_to_elo(mean), score_to_elo(mean - margin), score_to_elo(mean + margin)
+
+
+def run_sprt(agents: Agents, name_1: str, name_2: str, elo0: float = 0, elo1: float = 50, alpha: float = 0.05,
+             beta: float = 0.05, max_rounds: int = 1000, results_file: str = None, n_workers: int = 1,
+             seed: int = 0) -> dict:
+    """
+    Lets two agents play rounds (two games, each agent starts once) against each other until a sequential
+    probability ratio test decides whether agent 1 is stronger than agent 2 by at least elo1 (H1) or by at most
+    elo0 (H0) Elo. The ids of the games start with SPRT_PREFIX and their records are marked with "mode": "sprt"
+    (summarize_results does not count them). Games that are already in the results file (e.g. of an interrupted
+    run) are not played again (see run_tournament)
+    :param agents: Agents of the tournament
+    :param name_1: Name of the first agent
+    :param name_2: Name of the second agent
+    :param elo0: Elo difference of H0
+    :param elo1: Elo difference of H1
+    :param alpha: Probability of accepting H1 if H0 is true
+    :param beta: Probability of accepting H0 if H1 is true
+    :param max_rounds: Maximal number of rounds if the test does not decide earlier
+    :param results_file: Optional JSONL file to which the game records are appended (e.g. the one of a
+    tournament)
+    :param n_workers: Number of worker processes (each plays one game of the next batch of games)
+    :param seed: Seed from which the seeds of the games are derived
+    :return: Number of games, wins, draws and losses of agent 1, log-likelihood ratio, accepted hypothesis
+    ("H0", "H1" or None if max_rounds was reached) and the estimated Elo difference with its 95 % interval
+    """
+    lower_bound, upper_bound = np.log(beta / (1 - alpha)), np.log((1 - beta) / alpha)
+    games = [(name_1, name_2, round_index, first) for round_index in range(max_rounds) for first in (name_1, name_2)]
+    # The same seeds as the games of run_tournament with the same ids (see seed_of_game)
+    seeds = [seed_of_game(seed, game_id(*game)) for game in games]
+    previous = {}
+    if results_file is not None:
+        previous_results = load_results(results_file)
+        check_resumed(previous_results, {game_id(*game, SPRT_PREFIX): int(game_seed)
+                                         for game, game_seed in zip(games, seeds)}, agents, seed, results_file)
+        previous = {result["id"]: result for result in previous_results}
+        end_last_line(results_file)
+    # Play as many games at once as there are workers, but always complete rounds
+    batch_size = 2 * int(np.ceil(n_workers / 2))
+    counts = {name_1: 0, None: 0, name_2: 0}
+    llr = 0
+    hypothesis = None
+    pool = ProcessPoolExecutor(max_workers=n_workers, initializer=warm_up) if n_workers > 1 else None
+    if pool is None:
+        # Make sure that the compilation of numba functions is not part of the move times
+        warm_up()
+    try:
+        for start in range(0, len(games), batch_size):
+            batch = [(game, int(game_seed)) for game, game_seed in zip(games[start:start + batch_size],
+                                                                       seeds[start:start + batch_size])]
+            resumed = [previous[game_id(*game, SPRT_PREFIX)] for game, _ in batch
+                       if game_id(*game, SPRT_PREFIX) in previous]
+            batch = [(game, game_seed) for game, game_seed in batch if game_id(*game, SPRT_PREFIX) not in previous]
+            if pool is None or not batch:
+                results = [play_game(agents, *game, game_seed, SPRT_PREFIX) for game, game_seed in batch]
+            else:
+                results = list(pool.map(play_game, *zip(*[(agents, *game, game_seed, SPRT_PREFIX)
+                                                          for game, game_seed in batch])))
+            for result in results:
+                result["tournament_seed"] = seed
+                result["mode"] = "sprt"
+                if results_file is not None:
+                    with open(results_file, "a") as f:
+                        f.write(json.dumps(result) + "\n")
+            for result in resumed + results:
+                counts[result["winner"]] += 1
+            llr = sprt_llr(counts[name_1], counts[None], counts[name_2], elo0, elo1)
+            if llr >= upper_bound:
+                hypothesis = "H1"
+                break
+            if llr <= lower_bound:
+                hypothesis = "H0"
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elo, elo_lower, elo_upper = elo_estimate(counts[name_1], counts[None], counts[name_2])
+    return {"games": sum(counts.values()), "wins": counts[name_1], "draws": counts[None], "losses": counts[name_2],
+            "llr": llr, "hypothesis": hypothesis, "elo": elo, "elo_interval": (elo_lower, elo_upper)}